@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for mysite.deploy, driven by environment variables.
+
+- WEB_CONCURRENCY: worker processes (2 x CPUs + 1 by default)
+- GUNICORN_WORKER_CLASS: sync, gthread or gevent
+- GUNICORN_THREADS: threads per gthread worker
+- GUNICORN_WORKER_CONNECTIONS: greenlets per gevent worker
+- GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE: seconds
+- GUNICORN_MAX_REQUESTS: requests before a worker is recycled (0 = never)
+
+Keep DB_POOL_SIZE (mysite.deploy_settings) at least GUNICORN_THREADS or
+GUNICORN_WORKER_CONNECTIONS, every thread or greenlet may hold a
+connection while it handles a request.
+
+The change feed (/api/changes/) only long polls under gevent workers
+(MENU_CHANGE_FEED_WAIT), sync and gthread workers answer it at once: a
+waiting client would hold the worker or thread. Serve it from the ASGI
+entry point (mysite.asgi) to long poll without a gevent worker.
+"""
+
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 2))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    """Makes psycopg2 cooperative in gevent workers (psycogreen)"""
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -1,6 +1,35 @@
 from django.contrib import admin
-from .models import Menu, Item, Ingredient
+from .models import Menu, Item, Ingredient, Restaurant, Webhook
+from .trash import restore, soft_delete
 
-admin.site.register(Menu)
-admin.site.register(Item)
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """SoftDeleteAdmin class
+    Inherit: - admin.ModelAdmin
+    - Lists soft deleted rows as well. Deletes are soft deletes
+      (menu.trash), the purge_deleted command removes them for good.
+    """
+    list_display = ('__str__', 'deleted_at')
+    list_filter = (('deleted_at', admin.EmptyFieldListFilter),)
+    actions = ['restore_selected']
+
+    def get_queryset(self, request):
+        return self.model.all_objects.all()
+
+    def delete_model(self, request, obj):
+        soft_delete(self.model, [obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        soft_delete(self.model, queryset.values_list('pk', flat=True))
+
+    @admin.action(description='Restore selected')
+    def restore_selected(self, request, queryset):
+        restored = restore(self.model, queryset.values_list('pk', flat=True))
+        self.message_user(request, 'Restored {}.'.format(len(restored)))
+
+
+admin.site.register(Menu, SoftDeleteAdmin)
+admin.site.register(Item, SoftDeleteAdmin)
 admin.site.register(Ingredient)
+admin.site.register(Restaurant)
+admin.site.register(Webhook)
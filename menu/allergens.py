@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from .models import MenuIngredient
+from .signals import MenuItems, catalog_changed
+
+
+def index_rows(menu_pks):
+    """Returns MenuIngredient rows of the menus, counted in one query,
+    soft deleted items left out
+    :input: - menu_pks - iterable of menu ids, None for every menu
+    """
+    links = MenuItems.objects.filter(item__ingredients__isnull=False,
+                                     item__deleted_at__isnull=True)
+    if menu_pks is not None:
+        links = links.filter(menu_id__in=menu_pks)
+    counts = links.values('menu_id', 'item__ingredients').annotate(
+        items=Count('item_id', distinct=True)).order_by()
+    return [MenuIngredient(menu_id=row['menu_id'],
+                           ingredient_id=row['item__ingredients'],
+                           items=row['items'])
+            for row in counts]
+
+
+def build_index(menu_pks):
+    """Rebuilds the ingredient index rows of the menus
+    :input: - menu_pks - iterable of menu ids
+    """
+    menu_pks = set(menu_pks)
+    if not menu_pks:
+        return
+    rows = index_rows(menu_pks)
+    with transaction.atomic():
+        # noinspection PyUnresolvedReferences
+        MenuIngredient.objects.filter(menu_id__in=menu_pks).delete()
+        # noinspection PyUnresolvedReferences
+        MenuIngredient.objects.bulk_create(rows)
+
+
+@receiver(catalog_changed)
+def refresh_index(sender, menus, **kwargs):
+    """Menu items or item ingredients changed"""
+    build_index(menus)
@@ -0,0 +1,264 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import never_cache
+
+from .changes import changes_since, last_sequence
+from .history import menu_as_of, parse_at
+from .models import MenuCard, Item, Ingredient, item_ingredients
+from .pagination import keyset_page
+
+import json
+import time
+
+# Default and largest page size of the paginated responses
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+# Number of rows fetched and serialized at once by the streaming responses
+API_STREAM_CHUNK = 500
+# Longest wait (seconds) of a change feed request, and seconds between two
+# looks at the change log while waiting
+CHANGE_FEED_TIMEOUT = 25
+CHANGE_POLL_INTERVAL = 1.0
+
+
+def _wanted(fields, name):
+    return fields is None or name in fields
+
+
+def _select(row, fields):
+    if fields is None:
+        return row
+    return {key: value for key, value in row.items() if key in fields}
+
+
+def serialize_menu(card, fields=None):
+    """Menu dictionary, read from the menu card (no joins)
+    :input: - card - MenuCard
+            - fields - set of fields to return, None for all
+    """
+    row = {'id': card.pk,
+           'season': card.season,
+           'created_date': card.created_date,
+           'expiration_date': card.expiration_date,
+           'updated_at': card.updated_at}
+    if _wanted(fields, 'items'):
+        row['items'] = [{'id': item['pk'], 'name': item['name']}
+                        for item in card.items]
+    return _select(row, fields)
+
+
+def serialize_item(item, fields=None):
+    """Item dictionary with ingredients and chef
+    :input: - item - Item
+            - fields - set of fields to return, None for all
+    """
+    row = {'id': item.pk,
+           'name': item.name,
+           'description': item.description,
+           'standard': item.standard,
+           'created_date': item.created_date,
+           'updated_at': item.updated_at}
+    if _wanted(fields, 'chef'):
+        row['chef'] = str(item.chef)
+    if _wanted(fields, 'ingredients'):
+        row['ingredients'] = [{'id': ingredient.pk, 'name': ingredient.name}
+                              for ingredient in item.ingredients.all()]
+    return _select(row, fields)
+
+
+def serialize_ingredient(ingredient, fields=None):
+    """Ingredient dictionary
+    :input: - ingredient - Ingredient
+            - fields - set of fields to return, None for all
+    """
+    row = {'id': ingredient.pk,
+           'name': ingredient.name,
+           'updated_at': ingredient.updated_at}
+    return _select(row, fields)
+
+
+def _fields(request):
+    """Returns set of requested fields (?fields=id,name) or None for all"""
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',') if field.strip()}
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def _stream(queryset, serialize, fields, prefetch):
+    """Yields the JSON document chunk by chunk, rows come from .iterator()
+    and relations are prefetched per chunk (iterator() skips
+    prefetch_related), so memory depends on the chunk size only.
+    """
+    yield '{"results":['
+    first = True
+    batch = []
+    rows = queryset.order_by('pk').iterator(chunk_size=API_STREAM_CHUNK)
+    for obj in rows:
+        batch.append(obj)
+        if len(batch) < API_STREAM_CHUNK:
+            continue
+        yield _stream_chunk(batch, serialize, fields, prefetch, first)
+        first = False
+        batch = []
+    if batch:
+        yield _stream_chunk(batch, serialize, fields, prefetch, first)
+    yield '],"next":null}'
+
+
+def _stream_chunk(batch, serialize, fields, prefetch, first):
+    if prefetch:
+        prefetch_related_objects(batch, *prefetch)
+    chunk = ','.join(_dumps(serialize(obj, fields)) for obj in batch)
+    return chunk if first else ',' + chunk
+
+
+def api_response(request, queryset, serialize, relations=None):
+    """Paginated or streamed JSON list
+    :input: - request - ?after= cursor, ?limit= page size,
+                        ?fields= comma separated fields, ?stream=1
+            - queryset - rows to list, ordered by pk
+            - serialize - function returning the dictionary of a row
+                          limited to the requested fields
+            - relations - {'select': {field: lookups},
+                           'prefetch': {field: lookups}}, relations of
+                          fields left out are not loaded
+    :return: - JsonResponse or StreamingHttpResponse
+    """
+    fields = _fields(request)
+    relations = relations or {}
+    prefetch = [lookup
+                for field, lookups in relations.get('prefetch', {}).items()
+                if _wanted(fields, field)
+                for lookup in lookups]
+    for field, lookups in relations.get('select', {}).items():
+        if _wanted(fields, field):
+            queryset = queryset.select_related(*lookups)
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(
+            _stream(queryset, serialize, fields, prefetch),
+            content_type='application/json')
+
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        limit = API_PAGE_SIZE
+    limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    rows, next_cursor = keyset_page(queryset, ('pk',),
+                                    cursor=request.GET.get('after'),
+                                    size=limit)
+    if prefetch:
+        prefetch_related_objects(rows, *prefetch)
+    next_url = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['after'] = next_cursor
+        next_url = '{}?{}'.format(request.path, query.urlencode())
+    return JsonResponse(
+        {'results': [serialize(row, fields) for row in rows],
+         'next': next_url})
+
+
+def menu_list_api(request):
+    """Menus with their item ids and names
+    :return: - JSON list of menus
+    """
+    # noinspection PyUnresolvedReferences
+    return api_response(request, MenuCard.objects.all(), serialize_menu)
+
+
+def item_list_api(request):
+    """Items with their ingredients and chef
+    :return: - JSON list of items
+    """
+    # noinspection PyUnresolvedReferences
+    return api_response(request, Item.objects.all(), serialize_item,
+                        {'select': {'chef': ['chef']},
+                         'prefetch': {'ingredients': [item_ingredients()]}})
+
+
+def ingredient_list_api(request):
+    """Ingredients
+    :return: - JSON list of ingredients
+    """
+    # noinspection PyUnresolvedReferences
+    return api_response(request, Ingredient.objects.all(),
+                        serialize_ingredient)
+
+
+def menu_history_api(request, pk):
+    """Menu as it was at a time (?at=, ISO 8601 date or date and time),
+    rebuilt from its versions, the last version without ?at=
+    :input: - pk - menu id
+    :return: - JSON {"id", "season", "expiration_date", "is_active",
+                     "recorded_at", "items": [{"id", "name"}]}
+    """
+    try:
+        at = parse_at(request.GET.get('at', '').strip())
+    except ValueError:
+        return JsonResponse({'error': 'at must be an ISO 8601 date.'},
+                            status=400)
+    found = menu_as_of(pk, at)
+    if found is None:
+        raise Http404('No menu matches the given query.')
+    version, items = found
+    return JsonResponse({'id': int(pk),
+                         'season': version.season,
+                         'expiration_date': version.expiration_date,
+                         'is_active': version.is_active,
+                         'recorded_at': version.recorded_at,
+                         'items': [{'id': item.pk, 'name': item.name}
+                                   for item in items]})
+
+
+def feed_params(request):
+    """Returns ?since= (None if not given) and ?timeout= of a change feed
+    request, the timeout capped at CHANGE_FEED_TIMEOUT
+    :raise: - ValueError
+    """
+    since = request.GET.get('since')
+    since = int(since) if since else None
+    timeout = int(request.GET.get('timeout', CHANGE_FEED_TIMEOUT))
+    if since is not None and since < 0 or timeout < 0:
+        raise ValueError('since and timeout must not be negative')
+    return since, min(timeout, CHANGE_FEED_TIMEOUT)
+
+
+def feed_error():
+    return JsonResponse(
+        {'error': 'since and timeout must be non-negative integers.'},
+        status=400)
+
+
+@never_cache
+def change_feed_api(request):
+    """Change feed, long poll - changes of the catalog after ?since=N,
+    waiting up to ?timeout= seconds for the first one. Clients ask again
+    with ?since= set to 'last'. Without ?since= answers at once with the
+    current 'last', the starting point of a new client. The waiting holds
+    the worker, so the wait is capped at settings.MENU_CHANGE_FEED_WAIT
+    (0, no wait, unless the workers are gevent greenlets). The ASGI entry
+    point serves the async version (menu.async_views.change_feed_api),
+    which always waits.
+    :return: - JSON {"changes": [{"seq", "model", "id", "action", "at"}],
+                     "last": N}
+    """
+    try:
+        since, timeout = feed_params(request)
+    except ValueError:
+        return feed_error()
+    if since is None:
+        return JsonResponse({'changes': [], 'last': last_sequence()})
+    timeout = min(timeout, getattr(settings, 'MENU_CHANGE_FEED_WAIT', 0))
+    deadline = time.monotonic() + timeout
+    feed = changes_since(since)
+    while not feed['changes'] and time.monotonic() < deadline:
+        time.sleep(min(CHANGE_POLL_INTERVAL, deadline - time.monotonic()))
+        feed = changes_since(since)
+    return JsonResponse(feed)
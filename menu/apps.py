@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class MenuConfig(AppConfig):
+    """MenuConfig class
+    Inherit: - AppConfig
+    - ready(): - connects the catalog signal receivers, the connection
+                 health checks and the query timer
+    """
+    name = 'menu'
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from . import signals, allergens, cache, cards, changes, choices, db, history, perf, search, tenants, trash  # noqa: F401
@@ -0,0 +1,202 @@
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+from PIL import Image
+
+from urllib.parse import urljoin
+from urllib.request import urlopen
+import base64
+import hashlib
+import os
+import posixpath
+import re
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+SOURCE_MAP_RE = re.compile(r'/\*#\s*sourceMappingURL=[^*]*\*/')
+RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+BACKGROUND_RE = re.compile(
+    r'background(?:-image)?\s*:\s*url\(\s*([\'"]?)([^\'")]+)\1\s*\)[^;]*;?')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+IMAGE_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+               '.png': 'image/png'}
+WEBP_QUALITY = 80
+
+
+class AssetError(Exception):
+    """Static build failure"""
+
+
+def is_remote(path):
+    return path.startswith(('http://', 'https://', '//'))
+
+
+def fetch(url, integrity, cache_dir):
+    """Returns the text of a vendored file, downloaded once and checked
+    against its subresource integrity hash ('sha384-...')
+    :raise: - AssetError - missing or mismatching integrity
+    """
+    if not integrity:
+        raise AssetError('{} has no integrity hash'.format(url))
+    algorithm, digest = integrity.split('-', 1)
+    path = os.path.join(cache_dir, 'vendor', '{}-{}'.format(
+        algorithm, hashlib.md5(digest.encode()).hexdigest()))
+    if os.path.exists(path):
+        with open(path, 'rb') as stream:
+            data = stream.read()
+    else:
+        with urlopen('https:' + url if url.startswith('//') else url,
+                     timeout=30) as response:
+            data = response.read()
+    found = base64.b64encode(hashlib.new(algorithm, data).digest()).decode()
+    if found != digest:
+        raise AssetError('{} does not match {}'.format(url, integrity))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as stream:
+            stream.write(data)
+    return data.decode('utf-8')
+
+
+def rebase_urls(css, source, target):
+    """Rewrites relative url()s of a stylesheet moved from 'source' to
+    'target' (static paths), remote sources get absolute urls
+    """
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '#', '/')) or is_remote(url) or \
+                ':' in url.split('/')[0]:
+            return match.group(0)
+        if is_remote(source):
+            url = urljoin(source, url)
+        else:
+            url = posixpath.relpath(
+                posixpath.normpath(posixpath.join(
+                    posixpath.dirname(source), url)),
+                posixpath.dirname(target))
+        return 'url({0}{1}{0})'.format(quote, url)
+    return CSS_URL_RE.sub(rebase, css)
+
+
+def read_source(path, integrity, cache_dir):
+    """Returns the text of a local static file or a vendored url"""
+    if is_remote(path):
+        return fetch(path, integrity, cache_dir)
+    found = finders.find(path)
+    if not found:
+        raise AssetError('{} is not a static file'.format(path))
+    with open(found, encoding='utf-8') as stream:
+        return stream.read()
+
+
+def webp_name(path, width=None):
+    root = os.path.splitext(path)[0]
+    return '{}-{}w.webp'.format(root, width) if width else root + '.webp'
+
+
+def make_webp(build_dir, widths, prefix='images/'):
+    """Writes a WebP copy and resized WebP variants of every static image
+    under 'prefix' into build_dir, skipping the up to date ones
+    :return: - {image path: [(width, webp path), ...]} widest first
+    """
+    variants = {}
+    seen = set()
+    for finder in finders.get_finders():
+        for path, storage in finder.list([]):
+            path = path.replace(os.sep, '/')
+            if path in seen or not path.startswith(prefix) or \
+                    not path.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            seen.add(path)
+            source = storage.path(path)
+            with Image.open(source) as image:
+                image.load()
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.mode
+                                          else 'RGB')
+                outputs = [(image.width, webp_name(path))]
+                outputs += [(width, webp_name(path, width))
+                            for width in sorted(widths, reverse=True)
+                            if width < image.width]
+                for width, name in outputs:
+                    target = os.path.join(build_dir, name)
+                    if os.path.exists(target) and \
+                            os.path.getmtime(target) >= \
+                            os.path.getmtime(source):
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    resized = image if width == image.width else \
+                        image.resize((width, round(
+                            image.height * width / image.width)),
+                            Image.LANCZOS)
+                    resized.save(target, 'WEBP', quality=WEBP_QUALITY)
+            variants[path] = outputs
+    return variants
+
+
+def image_set(url, webp_url):
+    extension = os.path.splitext(url)[1].lower()
+    return 'image-set(url("{}") type("image/webp"), url("{}") type("{}"))'\
+        .format(webp_url, url, IMAGE_TYPES[extension])
+
+
+def add_webp(css, target, variants):
+    """Adds WebP image-set() backgrounds after the url() backgrounds of
+    top level rules, plus media queries picking the resized variants
+    """
+    media = []
+
+    def rule(match):
+        selector, body = match.groups()
+
+        def declaration(found):
+            url = found.group(2)
+            path = posixpath.normpath(posixpath.join(
+                posixpath.dirname(target), url))
+            if path not in variants:
+                return found.group(0)
+            base = posixpath.dirname(target)
+            outputs = variants[path]
+            for width, name in outputs[1:]:
+                media.append('@media (max-width: {}px) {{ {} {{ '
+                             'background-image: {}; }} }}'.format(
+                                 width, COMMENT_RE.sub('', selector).strip(), image_set(
+                                     url, posixpath.relpath(name, base))))
+            return '{}{} background-image: {};'.format(
+                found.group(0), '' if found.group(0).endswith(';') else ';',
+                image_set(url, posixpath.relpath(outputs[0][1], base)))
+        return '{}{{{}}}'.format(selector,
+                                 BACKGROUND_RE.sub(declaration, body))
+    css = RULE_RE.sub(rule, css)
+    return '\n'.join([css] + media)
+
+
+def build(build_dir=None, bundle=None, sources=None, widths=None,
+          images=True):
+    """Writes the CSS bundle and the WebP images into build_dir, to be
+    fingerprinted and compressed by collectstatic
+    :input: - build_dir - settings.STATIC_BUILD_DIR by default
+            - bundle - static path of the bundle (settings.MENU_CSS_BUNDLE)
+            - sources - (path or url, integrity) pairs in cascade order
+                        (settings.MENU_CSS_SOURCES)
+            - widths - resized image widths (settings.MENU_IMAGE_WIDTHS)
+            - images - False to skip the WebP variants
+    :return: - dictionary of bundle path, bundle size and image count
+    """
+    build_dir = build_dir or settings.STATIC_BUILD_DIR
+    bundle = bundle or settings.MENU_CSS_BUNDLE
+    sources = sources or settings.MENU_CSS_SOURCES
+    widths = settings.MENU_IMAGE_WIDTHS if widths is None else widths
+    variants = make_webp(build_dir, widths) if images else {}
+    parts = []
+    for path, integrity in sources:
+        css = SOURCE_MAP_RE.sub('', read_source(path, integrity, build_dir))
+        parts.append('/* {} */\n{}'.format(
+            path, rebase_urls(css, path, bundle)))
+    css = add_webp('\n'.join(parts), bundle, variants)
+    target = os.path.join(build_dir, bundle)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as stream:
+        stream.write(css)
+    return {'bundle': target, 'bytes': len(css.encode('utf-8')),
+            'images': sum(len(outputs) for outputs in variants.values())}
@@ -0,0 +1,144 @@
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import add_never_cache_headers, \
+    get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import conditional
+from .api import CHANGE_POLL_INTERVAL, feed_error, feed_params
+from .cache import cached_render
+from .cards import get_card
+from .changes import changes_since, last_sequence
+from .models import MenuCard, Item
+from .offload import offload
+from .routers import replica_reads
+from .views import render_item_list
+
+import asyncio
+import calendar
+import time
+
+# Async versions of the read views for the ASGI entry point (mysite.asgi
+# routes them through menu.urls_async). Blocking work is offloaded to the
+# bounded thread pool of menu.offload, the event loop only waits.
+
+
+def _validators(request, etag_func, last_modified_func, *args):
+    etag = etag_func(request, *args) if etag_func else None
+    last_modified = (last_modified_func(request, *args)
+                     if last_modified_func else None)
+    return (quote_etag(etag) if etag else None,
+            calendar.timegm(last_modified.utctimetuple())
+            if last_modified else None)
+
+
+async def conditional_response(request, respond, args=(), etag_func=None,
+                               last_modified_func=None):
+    """Async counterpart of django.views.decorators.http.condition
+    :input: - respond - coroutine function returning the full response
+            - args - view arguments passed to the validator functions
+    :return: - 304/412 response or the response of respond()
+    """
+    etag, last_modified = await offload(
+        _validators, request, etag_func, last_modified_func, *args)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = await respond()
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.setdefault('ETag', etag)
+    return response
+
+
+@replica_reads
+async def menu_list(request):
+    """Menu list view - the dated and the undated menu cards are selected
+    concurrently
+    :return: - list_all_current.html + menu_list with expiration date
+                                     + menu_list without expiration date
+    """
+    async def respond():
+        # noinspection PyUnresolvedReferences
+        menus, menus_no_expdate = await asyncio.gather(
+            offload(list, MenuCard.objects.current()),
+            offload(list, MenuCard.objects.without_expiration()))
+        return await offload(render, request,
+                             'menu/list_all_current_menus.html',
+                             {'menus': menus, 'no_date': menus_no_expdate})
+    return await conditional_response(
+        request, respond, etag_func=conditional.menu_list_etag)
+
+
+@replica_reads
+async def menu_detail(request, pk):
+    """Menu detail view - get menu card 'pk'
+    :input: - pk - menu id
+    :return: - menu_detail.html + dictionary of menu values
+    """
+    def get_context():
+        return {'menu': get_card(pk)}
+
+    async def respond():
+        return await offload(cached_render, request, 'menu', pk,
+                             'menu/menu_detail.html', get_context)
+    return await conditional_response(
+        request, respond, (pk,), etag_func=conditional.menu_etag,
+        last_modified_func=conditional.menu_last_modified)
+
+
+@replica_reads
+async def item_list(request):
+    """Item list view, selects one page of item objects
+    :input: - ?after= - cursor of the last item on the previous page
+    :return: - item_list.html + item list dictionary + next page cursor
+    """
+    async def respond():
+        return await offload(render_item_list, request)
+    return await conditional_response(
+        request, respond, etag_func=conditional.item_list_etag)
+
+
+@replica_reads
+async def item_detail(request, pk):
+    """Item detail view - get item object 'pk'
+    :input: - pk - item id
+    :return: - detail_item.html + dictionary of item values
+    """
+    def get_context():
+        # noinspection PyUnresolvedReferences
+        return {'item': get_object_or_404(Item.objects.with_relations(),
+                                          pk=pk)}
+
+    async def respond():
+        return await offload(cached_render, request, 'item', pk,
+                             'menu/detail_item.html', get_context)
+    return await conditional_response(
+        request, respond, (pk,), etag_func=conditional.item_etag,
+        last_modified_func=conditional.item_last_modified)
+
+
+async def change_feed_api(request):
+    """Change feed, long poll (see menu.api.change_feed_api) - the waiting
+    clients hold no thread, only the looks at the change log are offloaded
+    :return: - JSON {"changes": [...], "last": N}
+    """
+    try:
+        since, timeout = feed_params(request)
+    except ValueError:
+        return feed_error()
+    if since is None:
+        feed = {'changes': [], 'last': await offload(last_sequence)}
+    else:
+        deadline = time.monotonic() + timeout
+        feed = await offload(changes_since, since)
+        while not feed['changes'] and time.monotonic() < deadline:
+            await asyncio.sleep(min(CHANGE_POLL_INTERVAL,
+                                    deadline - time.monotonic()))
+            feed = await offload(changes_since, since)
+    response = JsonResponse(feed)
+    # never_cache does not wrap coroutines on this Django version
+    add_never_cache_headers(response)
+    return response
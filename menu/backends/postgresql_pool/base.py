@@ -0,0 +1,114 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+
+from psycopg2 import extensions, pool
+
+import os
+import threading
+
+# Settings of a database using this backend, besides the PostgreSQL ones:
+#   'POOL': {'MIN_SIZE': 1, 'MAX_SIZE': 10, 'TIMEOUT': 10}
+# CONN_MAX_AGE should stay 0: Django closes the connection at the end of
+# every request, which hands it back to the pool.
+POOL_DEFAULTS = {'MIN_SIZE': 1, 'MAX_SIZE': 10, 'TIMEOUT': 10}
+
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """BlockingConnectionPool class
+    Inherit: - psycopg2.pool.ThreadedConnectionPool
+    - getconn() waits up to 'timeout' seconds for a free connection instead
+      of failing at once when all of them are used. The semaphore and lock
+      come from threading, so gevent workers wait cooperatively once
+      monkey patched.
+    - Connections closed by the server are dropped when taken out.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise pool.PoolError('No free connection after {} seconds'.format(
+                self.timeout))
+        try:
+            connection = super().getconn(key)
+            if connection.closed:
+                super().putconn(connection, key, close=True)
+                connection = super().getconn(key)
+            return connection
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        if key is None and id(conn) not in self._rused:
+            # Not taken from this pool (inherited from the parent process)
+            conn.close()
+            return
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    """Returns the pool of a database alias for the current process, pools
+    inherited through fork() (gunicorn --preload) are not shared
+    """
+    with _pools_lock:
+        pid, connection_pool = _pools.get(alias, (None, None))
+        if connection_pool is None or pid != os.getpid():
+            options = dict(POOL_DEFAULTS, **settings_dict.get('POOL', {}))
+            if options['MIN_SIZE'] > options['MAX_SIZE']:
+                raise ImproperlyConfigured(
+                    'POOL MIN_SIZE is larger than MAX_SIZE.')
+            connection_pool = BlockingConnectionPool(
+                options['MIN_SIZE'], options['MAX_SIZE'], options['TIMEOUT'],
+                **conn_params)
+            _pools[alias] = (os.getpid(), connection_pool)
+        return connection_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """DatabaseWrapper class
+    Inherit: - django.db.backends.postgresql.base.DatabaseWrapper
+    - Connections are borrowed from a per-process pool shared by the
+      threads (or greenlets) of a worker, closing one returns it.
+    - Django restores time zone and autocommit of a borrowed connection
+      (init_connection_state), an open transaction is rolled back before
+      the connection goes back.
+    """
+
+    def get_new_connection(self, conn_params):
+        connection = get_pool(self.alias, self.settings_dict,
+                              conn_params).getconn()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection_pool = get_pool(self.alias, self.settings_dict,
+                                   self.get_connection_params())
+        close = bool(self.connection.closed)
+        if not close and self.connection.get_transaction_status() != \
+                extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                self.connection.rollback()
+            except base.Database.Error:
+                close = True
+        with self.wrap_database_errors:
+            connection_pool.putconn(self.connection, close=close)
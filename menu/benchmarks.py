@@ -0,0 +1,176 @@
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Menu, Item, Ingredient
+from .synthetic import seed_catalog
+from .tenants import restaurants
+from .urls import urlpatterns
+
+import json
+import statistics
+import time
+import tracemalloc
+
+# Query string sent to views which need one to do any work
+BENCH_QUERIES = {
+    'item_list': {},
+    'search': {'q': 'chick'},
+    'autocomplete': {'q': 'sa'},
+    'ingredient_menus': {'free_of': 'peanuts,almonds', 'contains': 'butter'},
+    'api_items': {'limit': 50},
+}
+# Absolute slack (ms) added to the p95 limit, so tiny views do not fail on
+# timer noise
+P95_SLACK_MS = 5.0
+
+
+def bench_urls():
+    """Returns list of (view name, url, query) of every route of
+    menu/urls.py, using the first menu and item for the pk routes
+    """
+    # noinspection PyUnresolvedReferences
+    menu = Menu.objects.order_by('pk').values_list('pk', flat=True).first()
+    # noinspection PyUnresolvedReferences
+    item = Item.objects.order_by('pk').values_list('pk', flat=True).first()
+    routes = []
+    for pattern in urlpatterns:
+        name = pattern.name
+        kwargs = {}
+        if 'pk' in pattern.pattern.regex.groupindex:
+            kwargs['pk'] = item if name.startswith('item') else menu
+        if 'kind' in pattern.pattern.regex.groupindex:
+            kwargs['kind'] = 'ingredients'
+        routes.append((name, reverse('menu:' + name, kwargs=kwargs),
+                       BENCH_QUERIES.get(name, {})))
+    return routes
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers"""
+    values = sorted(values)
+    index = max(0, min(len(values) - 1,
+                       int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def clear_caches():
+    """Clears every cache but the restaurants of the request routing
+    (menu.tenants.restaurants), which are not part of the measured work
+    """
+    for cache in caches.all():
+        cache.clear()
+    restaurants()
+
+
+def measure(client, url, query, repeat):
+    """Requests a url 'repeat' times with cold caches
+    :return: - dictionary of status, queries, p50_ms, p95_ms, peak_kib
+    """
+    timings = []
+    queries = None
+    status = None
+    for _ in range(repeat):
+        clear_caches()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url, query)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(captured.captured_queries)
+        status = response.status_code
+
+    clear_caches()
+    tracemalloc.start()
+    try:
+        response = client.get(url, query)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'status': status,
+            'queries': queries,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'peak_kib': round(peak / 1024.0, 1)}
+
+
+def run_benchmarks(sizes, repeat=20, seed=0, log=None):
+    """Seeds a catalog of every size and measures every route
+    :input: - sizes - list of item counts
+            - repeat - requests per route
+            - seed - random seed of the synthetic catalog
+            - log - optional function called with progress messages
+    :return: - {size: {view name: measure() result}}
+    """
+    results = {}
+    for size in sizes:
+        clear_catalog()
+        seed_catalog(items=size, seed=seed)
+        client = Client()
+        results[str(size)] = {}
+        for name, url, query in bench_urls():
+            results[str(size)][name] = measure(client, url, query, repeat)
+            if log:
+                log('{:>8} {:<18} {}'.format(
+                    size, name, results[str(size)][name]))
+    return results
+
+
+def clear_catalog():
+    """Deletes the whole catalog, soft deleted rows included, and its chefs
+    (benchmark database only)
+    """
+    # noinspection PyUnresolvedReferences
+    Menu.all_objects.all().delete()
+    # noinspection PyUnresolvedReferences
+    Item.all_objects.all().delete()
+    # noinspection PyUnresolvedReferences
+    Ingredient.objects.all().delete()
+    # noinspection PyUnresolvedReferences
+    User.objects.filter(username__startswith='chef-').delete()
+
+
+def regressions(results, baseline, threshold):
+    """Compares results with a baseline
+    :input: - results, baseline - run_benchmarks() results
+            - threshold - allowed p95 latency and peak memory ratio
+    :return: - list of regression messages
+    """
+    found = []
+    for size, views in results.items():
+        for name, result in views.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            label = '{} @ {} items'.format(name, size)
+            if result['queries'] > base['queries']:
+                found.append('{}: {} queries, baseline {}'.format(
+                    label, result['queries'], base['queries']))
+            if result['p95_ms'] > base['p95_ms'] * threshold + P95_SLACK_MS:
+                found.append('{}: p95 {} ms, baseline {} ms'.format(
+                    label, result['p95_ms'], base['p95_ms']))
+            if result['peak_kib'] > base['peak_kib'] * threshold:
+                found.append('{}: peak {} KiB, baseline {} KiB'.format(
+                    label, result['peak_kib'], base['peak_kib']))
+    return found
+
+
+def load_baseline(path):
+    """Returns the baseline stored at path, None if there is none"""
+    try:
+        with open(path, encoding='utf-8') as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path, results):
+    """Writes benchmark results as JSON"""
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, indent=2, sort_keys=True)
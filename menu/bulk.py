@@ -0,0 +1,194 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms import Form, JSONField, Textarea
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_date
+
+from .forms import validate_menu
+from .models import Menu, Item
+from .signals import MenuItems, send_catalog_changed
+
+import functools
+import operator
+
+# Keys of one menu change
+CHANGE_KEYS = {'menu', 'season', 'expiration_date', 'add', 'remove'}
+# Largest number of menus changed at once
+MAX_MENU_CHANGES = 500
+
+
+def _pks(value, label):
+    """Returns set of pks from a JSON list of integers
+    :raise: - ValidationError
+    """
+    if not isinstance(value, list) or not all(
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in value):
+        raise ValidationError('{} must be a list of ids!'.format(label))
+    return set(value)
+
+
+def _clean_change(change):
+    """Normalizes one menu change
+    :input: - change - dictionary with 'menu' and any of 'season',
+                       'expiration_date', 'add' and 'remove'
+    :return: - cleaned change dictionary
+    :raise: - ValidationError
+    """
+    if not isinstance(change, dict) or \
+            not isinstance(change.get('menu'), int):
+        raise ValidationError('Every change must name a menu id!')
+    unknown = set(change) - CHANGE_KEYS
+    if unknown:
+        raise ValidationError('Unknown keys: {}'.format(
+            ', '.join(sorted(unknown))))
+    label = 'Menu {}'.format(change['menu'])
+    cleaned = {'menu': change['menu'],
+               'add': _pks(change.get('add', []), label + ' add'),
+               'remove': _pks(change.get('remove', []), label + ' remove')}
+    if cleaned['add'] & cleaned['remove']:
+        raise ValidationError('{}: an item is both added and removed!'.format(
+            label))
+    if 'season' in change:
+        season = change['season']
+        max_length = Menu._meta.get_field('season').max_length
+        if not isinstance(season, str) or not season.strip() or \
+                len(season.strip()) > max_length:
+            raise ValidationError('{}: invalid season!'.format(label))
+        cleaned['season'] = season.strip()
+    if 'expiration_date' in change:
+        expiration_date = change['expiration_date'] or None
+        if expiration_date is not None:
+            expiration_date = parse_date(str(expiration_date))
+            if expiration_date is None:
+                raise ValidationError('{}: invalid expiration date!'.format(
+                    label))
+        cleaned['expiration_date'] = expiration_date
+    return cleaned
+
+
+def plan_menu_changes(changes):
+    """Checks a list of menu changes against the database and works out the
+    minimal writes, in four queries whatever the number of menus.
+    :input: - changes - list of change dictionaries (see _clean_change)
+    :return: - plan dictionary - menus - {pk: Menu with the new fields}
+                                 - add - list of (menu pk, item pk) to insert
+                                 - remove - list of (menu pk, item pk) to
+                                            delete
+    :raise: - ValidationError
+    """
+    if not isinstance(changes, list) or not changes:
+        raise ValidationError('Changes must be a non-empty list!')
+    if len(changes) > MAX_MENU_CHANGES:
+        raise ValidationError(
+            'At most {} menus can be changed at once!'.format(
+                MAX_MENU_CHANGES))
+    changes = [_clean_change(change) for change in changes]
+    menu_pks = [change['menu'] for change in changes]
+    if len(set(menu_pks)) != len(menu_pks):
+        raise ValidationError('Every menu can be changed only once!')
+
+    # noinspection PyUnresolvedReferences
+    menus = Menu.objects.in_bulk(menu_pks)
+    missing = sorted(set(menu_pks) - set(menus))
+    if missing:
+        raise ValidationError('Unknown menus: {}'.format(
+            ', '.join(map(str, missing))))
+    item_pks = set().union(*(change['add'] | change['remove']
+                             for change in changes))
+    # noinspection PyUnresolvedReferences
+    missing = sorted(item_pks - set(Item.objects.filter(
+        pk__in=item_pks).values_list('pk', flat=True)))
+    if missing:
+        raise ValidationError('Unknown items: {}'.format(
+            ', '.join(map(str, missing))))
+    counts = dict(MenuItems.objects.filter(menu_id__in=menu_pks).values(
+        'menu_id').annotate(items=Count('pk')).values_list('menu_id', 'items'))
+    current = set(MenuItems.objects.filter(
+        menu_id__in=menu_pks, item_id__in=item_pks).values_list(
+        'menu_id', 'item_id'))
+
+    plan = {'menus': {}, 'add': [], 'remove': []}
+    for change in changes:
+        pk = change['menu']
+        menu = menus[pk]
+        add = sorted(item for item in change['add']
+                     if (pk, item) not in current)
+        remove = sorted(item for item in change['remove']
+                        if (pk, item) in current)
+        try:
+            # Same rules as MenuForm, on the resulting menu
+            validate_menu(range(counts.get(pk, 0) + len(add) - len(remove)),
+                          change.get('expiration_date'))
+        except ValidationError as error:
+            raise ValidationError('Menu {}: {}'.format(
+                pk, ' '.join(error.messages)))
+        fields = {key: change[key] for key in ('season', 'expiration_date')
+                  if key in change and change[key] != getattr(menu, key)}
+        if fields:
+            for key, value in fields.items():
+                setattr(menu, key, value)
+            # A valid expiration date brings an archived menu back
+            menu.is_active = True
+            plan['menus'][pk] = menu
+        plan['add'].extend((pk, item) for item in add)
+        plan['remove'].extend((pk, item) for item in remove)
+    return plan
+
+
+def apply_menu_changes(plan):
+    """Applies a plan of plan_menu_changes() in one transaction: one
+    bulk_update of the changed menus, one bulk_create and one filtered
+    delete on the 'items' through table, then one catalog_changed per
+    changed menu.
+    :input: - plan - dictionary returned by plan_menu_changes()
+    :return: - sorted list of changed menu pks
+    """
+    changed = sorted(set(plan['menus']) |
+                     {pk for pk, item in plan['add'] + plan['remove']})
+    with transaction.atomic():
+        if plan['menus']:
+            # noinspection PyUnresolvedReferences
+            Menu.objects.bulk_update(
+                plan['menus'].values(),
+                ['season', 'expiration_date', 'is_active'])
+        if plan['add']:
+            # Rows added by a concurrent edit since the plan are skipped
+            MenuItems.objects.bulk_create(
+                [MenuItems(menu_id=pk, item_id=item)
+                 for pk, item in plan['add']], ignore_conflicts=True)
+        if plan['remove']:
+            removed = {}
+            for pk, item in plan['remove']:
+                removed.setdefault(pk, []).append(item)
+            MenuItems.objects.filter(functools.reduce(operator.or_, [
+                Q(menu_id=pk, item_id__in=items)
+                for pk, items in removed.items()])).delete()
+        # bulk_update(), bulk_create() and delete() of the through rows
+        # send no model signals
+        for pk in changed:
+            send_catalog_changed(Menu, menus=[pk])
+    return changed
+
+
+class MenuBulkForm(Form):
+    """MenuBulkForm class - many menu changes posted at once
+    Inherit: - Form
+    field: - changes: - JSONField, list of changes, one per menu:
+             {"menu": 1, "season": "Fall", "expiration_date": "2030-01-31",
+              "add": [3, 4], "remove": [5]}, every key but "menu" optional
+    """
+    changes = JSONField(widget=Textarea(attrs={'rows': 12}))
+
+    def clean_changes(self):
+        """Checks the changes and keeps the plan of their writes
+        -:return: - changes
+        """
+        changes = self.cleaned_data['changes']
+        self.plan = plan_menu_changes(changes)
+        return changes
+
+    def save(self):
+        """Applies the changes
+        -:return: - sorted list of changed menu pks
+        """
+        return apply_menu_changes(self.plan)
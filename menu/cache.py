@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.shortcuts import render
+
+from .conditional import row_updated_at
+from .models import Menu, Item
+
+# kind of a cached page: model of its row
+MODELS = {'menu': Menu, 'item': Item}
+
+
+def render_cache():
+    """Returns the cache backend holding rendered pages
+    (settings.MENU_RENDER_CACHE alias, 'default' if not set)
+    """
+    return caches[getattr(settings, 'MENU_RENDER_CACHE', 'default')]
+
+
+def render_key(request, kind, pk, updated_at):
+    """Returns the cache key of a rendered page. Every change of a page
+    moves updated_at of its row (signals.touch_updated_at), so the key
+    follows the database and is the same in every worker process.
+    Authenticated users see the Edit buttons so they get their own variant.
+    """
+    variant = 'auth' if request.user.is_authenticated else 'anon'
+    return 'menu:render:{}:{}:{}:{}'.format(
+        kind, pk, updated_at.timestamp(), variant)
+
+
+def cached_render(request, kind, pk, template_name, get_context):
+    """Render shortcut backed by the render cache
+    :input: - request
+            - kind - 'menu' or 'item'
+            - pk - object id
+            - template_name
+            - get_context - callable returning the template context, only
+                            called (and the database only hit) on a miss
+    :return: - HttpResponse
+    """
+    updated_at = row_updated_at(request, MODELS[kind], pk)
+    if updated_at is None:
+        # Missing row, get_context() raises Http404
+        return render(request, template_name, get_context())
+    cache = render_cache()
+    key = render_key(request, kind, pk, updated_at)
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content)
+    response = render(request, template_name, get_context())
+    cache.set(key, response.content)
+    return response
+
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.dispatch import receiver
+from django.http import Http404
+
+from .models import Menu, MenuCard, Item
+from .signals import catalog_changed
+
+import json
+
+
+def card_payload(menu):
+    """Returns the JSON payload of a menu card
+    :input: - menu - Menu with prefetched items, chefs and ingredients
+    :return: - JSON string
+    """
+    return json.dumps([
+        {'pk': item.pk,
+         'name': item.name,
+         'chef': str(item.chef),
+         'ingredients': [str(ingredient)
+                         for ingredient in item.ingredients.all()]}
+        for item in menu.items.all()
+    ], separators=(',', ':'))
+
+
+def build_cards(menu_pks):
+    """Rebuilds the cards of the menus in four queries plus the writes,
+    cards of menus which no longer exist are removed.
+    :input: - menu_pks - iterable of menu ids
+    """
+    menu_pks = set(menu_pks)
+    if not menu_pks:
+        return
+    # noinspection PyUnresolvedReferences
+    items = Item.objects.with_relations().order_by('name', 'pk')
+    # noinspection PyUnresolvedReferences
+    menus = Menu.objects.filter(pk__in=menu_pks).prefetch_related(
+        Prefetch('items', queryset=items))
+    cards = [MenuCard(menu_id=menu.pk,
+                      restaurant_id=menu.restaurant_id,
+                      season=menu.season,
+                      created_date=menu.created_date,
+                      expiration_date=menu.expiration_date,
+                      is_active=menu.is_active,
+                      payload=card_payload(menu))
+             for menu in menus]
+    with transaction.atomic():
+        # noinspection PyUnresolvedReferences
+        MenuCard.objects.filter(pk__in=menu_pks).delete()
+        # noinspection PyUnresolvedReferences
+        MenuCard.objects.bulk_create(cards)
+
+
+def get_card(pk):
+    """Returns the card of a menu, building it if it is missing (menus
+    written around the signals, e.g. by raw SQL)
+    :input: - pk - menu id
+    :return: - MenuCard or Http404
+    """
+    # noinspection PyUnresolvedReferences
+    card = MenuCard.objects.filter(pk=pk).first()
+    if card is None:
+        build_cards([pk])
+        # noinspection PyUnresolvedReferences
+        card = MenuCard.objects.filter(pk=pk).first()
+    if card is None:
+        raise Http404('No menu matches the given query.')
+    return card
+
+
+@receiver(catalog_changed)
+def rebuild_cards(sender, menus, **kwargs):
+    """Rebuilds the cards of every affected menu"""
+    build_cards(menus)
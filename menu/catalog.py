@@ -0,0 +1,300 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .forms import validate_item, validate_menu
+from .models import Menu, Item, Ingredient
+from .signals import ItemIngredients, MenuItems, send_catalog_changed
+from .tenants import current_restaurant
+
+import csv
+import json
+
+# One row per item on a menu, items on no menu have an empty 'menu'.
+# CSV keeps the ingredient names in one column separated by '|'.
+FIELDS = ('menu', 'expiration_date', 'item', 'description', 'chef',
+          'standard', 'ingredients')
+INGREDIENT_SEPARATOR = '|'
+FORMATS = ('csv', 'jsonl')
+
+
+class RowError(Exception):
+    """Invalid catalog row"""
+
+
+def guess_format(path):
+    """Returns the catalog format from a file name ('csv' by default)"""
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yields row dictionaries from a CSV or JSON Lines stream one by one
+    :input: - stream - text file object
+            - fmt - 'csv' or 'jsonl'
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            row['ingredients'] = [
+                name for name in
+                (row.get('ingredients') or '').split(INGREDIENT_SEPARATOR)
+                if name.strip()]
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RowWriter:
+    """RowWriter class - writes catalog rows as CSV or JSON Lines"""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            row = dict(row, ingredients=INGREDIENT_SEPARATOR.join(
+                row['ingredients']))
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row) + '\n')
+
+
+def _clean_row(row):
+    """Normalizes one input row and checks it with the form rules
+    :return: - cleaned row dictionary
+    :raise: - RowError
+    """
+    try:
+        name = (row.get('item') or '').strip()
+        if not name:
+            raise RowError('Item name is missing!')
+        expiration_date = row.get('expiration_date') or None
+        if expiration_date:
+            expiration_date = parse_date(str(expiration_date))
+            if expiration_date is None:
+                raise RowError('Invalid expiration date!')
+        ingredients = sorted({str(ingredient).strip()
+                              for ingredient in row.get('ingredients') or []})
+        standard = row.get('standard')
+        if isinstance(standard, str):
+            standard = standard.strip().lower() in ('1', 'true', 'yes')
+        cleaned = {'menu': (row.get('menu') or '').strip(),
+                   'expiration_date': expiration_date,
+                   'item': name,
+                   'description': row.get('description') or '',
+                   'chef': (row.get('chef') or '').strip(),
+                   'standard': bool(standard),
+                   'ingredients': ingredients}
+        if not cleaned['chef']:
+            raise RowError('Chef is missing!')
+        if not ingredients:
+            raise RowError('Ingredients are missing!')
+        validate_item(cleaned['description'], ingredients)
+        if cleaned['menu']:
+            validate_menu([name], expiration_date)
+    except ValidationError as error:
+        raise RowError(' '.join(error.messages))
+    return cleaned
+
+
+def _lookup(model, field, names, cache):
+    """Fills 'cache' (name: pk) with existing rows for the missing names.
+    Duplicated names map to the newest row.
+    :return: - list of names still missing
+    """
+    missing = {name for name in names if name not in cache}
+    if missing:
+        # noinspection PyUnresolvedReferences
+        rows = model.objects.filter(**{field + '__in': missing}).order_by(
+            'pk').values_list(field, 'pk')
+        cache.update(rows)
+    return sorted(name for name in missing if name not in cache)
+
+
+class CatalogImporter:
+    """CatalogImporter class - imports catalog rows in batches.
+    - Ingredients, items and menus are matched by name (menus by season
+      and expiration date) through caches held in memory, missing ones are
+      created with bulk_create.
+    - Through rows are bulk inserted, existing pairs are ignored.
+    - batch_size is the number of rows per batch, INSERT sizes are left to
+      the backend.
+    - finish() sends one catalog_changed for everything touched, as
+      bulk_create() skips the model signals.
+    """
+
+    def __init__(self, batch_size=1000, skip_invalid=False):
+        self.batch_size = batch_size
+        self.skip_invalid = skip_invalid
+        self.chefs = {}
+        self.ingredients = {}
+        self.items = {}
+        self.menus = {}
+        self.touched_items = set()
+        self.touched_menus = set()
+        self.rows = 0
+        self.errors = []
+
+    def run(self, rows):
+        """Imports an iterable of rows inside one transaction
+        :return: - number of imported rows
+        :raise: - RowError (whole import rolled back)
+        """
+        with transaction.atomic():
+            batch = []
+            for number, row in enumerate(rows, 1):
+                try:
+                    batch.append(_clean_row(row))
+                except RowError as error:
+                    error = RowError('Row {}: {}'.format(number, error))
+                    if not self.skip_invalid:
+                        raise error
+                    self.errors.append(str(error))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+            self.finish()
+        return self.rows
+
+    def import_batch(self, rows):
+        """Imports one batch of cleaned rows"""
+        chefs = {row['chef'] for row in rows}
+        for username in _lookup(User, 'username', chefs, self.chefs):
+            raise RowError('Unknown chef: {}'.format(username))
+
+        names = {name for row in rows for name in row['ingredients']}
+        missing = _lookup(Ingredient, 'name', names, self.ingredients)
+        if missing:
+            # noinspection PyUnresolvedReferences
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name) for name in missing])
+            _lookup(Ingredient, 'name', missing, self.ingredients)
+
+        new_items = {}
+        for row in rows:
+            if row['item'] not in self.items:
+                new_items.setdefault(row['item'], row)
+        missing = _lookup(Item, 'name', new_items, self.items)
+        if missing:
+            # noinspection PyUnresolvedReferences
+            Item.objects.bulk_create(
+                [Item(name=name,
+                      description=new_items[name]['description'],
+                      chef_id=self.chefs[new_items[name]['chef']],
+                      standard=new_items[name]['standard'])
+                 for name in missing])
+            _lookup(Item, 'name', missing, self.items)
+
+        missing = {(row['menu'], row['expiration_date']) for row in rows
+                   if row['menu']} - set(self.menus)
+        for season, expiration_date in missing:
+            # noinspection PyUnresolvedReferences
+            pk = Menu.objects.filter(
+                season=season, expiration_date=expiration_date
+            ).order_by('-pk').values_list('pk', flat=True).first()
+            if pk:
+                self.menus[season, expiration_date] = pk
+        missing -= set(self.menus)
+        if missing:
+            created = [Menu(season=season, expiration_date=expiration_date)
+                       for season, expiration_date in sorted(
+                           missing, key=lambda key: (key[0], str(key[1])))]
+            # noinspection PyUnresolvedReferences
+            Menu.objects.bulk_create(created)
+            if any(menu.pk is None for menu in created):
+                # Backends which do not return pks from bulk inserts,
+                # the new menus are the newest rows of their season
+                for season, expiration_date in missing:
+                    # noinspection PyUnresolvedReferences
+                    self.menus[season, expiration_date] = Menu.objects.filter(
+                        season=season, expiration_date=expiration_date
+                    ).order_by('-pk').values_list('pk', flat=True).first()
+            else:
+                for menu in created:
+                    self.menus[menu.season, menu.expiration_date] = menu.pk
+
+        item_ingredients = set()
+        menu_items = set()
+        for row in rows:
+            item_pk = self.items[row['item']]
+            self.touched_items.add(item_pk)
+            for name in row['ingredients']:
+                item_ingredients.add((item_pk, self.ingredients[name]))
+            if row['menu']:
+                menu_pk = self.menus[row['menu'], row['expiration_date']]
+                self.touched_menus.add(menu_pk)
+                menu_items.add((menu_pk, item_pk))
+        ItemIngredients.objects.bulk_create(
+            [ItemIngredients(item_id=item_pk, ingredient_id=ingredient_pk)
+             for item_pk, ingredient_pk in sorted(item_ingredients)],
+            ignore_conflicts=True)
+        MenuItems.objects.bulk_create(
+            [MenuItems(menu_id=menu_pk, item_id=item_pk)
+             for menu_pk, item_pk in sorted(menu_items)],
+            ignore_conflicts=True)
+        self.rows += len(rows)
+
+    def finish(self):
+        """Invalidates caches and rebuilds read models of touched objects"""
+        send_catalog_changed(Menu, menus=self.touched_menus,
+                             items=self.touched_items)
+
+
+def export_rows(chunk_size=1000):
+    """Yields catalog rows (FIELDS) of every menu item and of every item
+    on no menu of the current restaurant, streamed in chunks with the ingredient names of a chunk
+    loaded in one query. Soft deleted menus and items are left out.
+    """
+    pairs = MenuItems.objects.select_related('menu', 'item__chef').filter(
+        menu__deleted_at__isnull=True, item__deleted_at__isnull=True)
+    restaurant = current_restaurant.get()
+    if restaurant is not None:
+        # The through model has no restaurant scoped manager
+        pairs = pairs.filter(menu__restaurant_id=restaurant)
+    pairs = pairs.order_by('menu_id', 'item_id').iterator(
+        chunk_size=chunk_size)
+    # noinspection PyUnresolvedReferences
+    lonely = Item.objects.select_related('chef').exclude(
+        pk__in=MenuItems.objects.filter(
+            menu__deleted_at__isnull=True).values('item_id')
+    ).order_by('pk').iterator(chunk_size=chunk_size)
+
+    def rows(objects):
+        chunk = []
+        for menu, item in objects:
+            chunk.append((menu, item))
+            if len(chunk) >= chunk_size:
+                yield from _export_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from _export_chunk(chunk)
+
+    yield from rows((pair.menu, pair.item) for pair in pairs)
+    yield from rows((None, item) for item in lonely)
+
+
+def _export_chunk(chunk):
+    ingredients = {}
+    for item_pk, name in ItemIngredients.objects.filter(
+            item_id__in={item.pk for menu, item in chunk}
+    ).order_by('ingredient__name').values_list('item_id', 'ingredient__name'):
+        ingredients.setdefault(item_pk, []).append(name)
+    for menu, item in chunk:
+        expiration_date = menu and menu.expiration_date
+        yield {'menu': menu.season if menu else '',
+               'expiration_date': (expiration_date.isoformat()
+                                   if expiration_date else ''),
+               'item': item.name,
+               'description': item.description,
+               'chef': item.chef.username if item.chef_id else '',
+               'standard': item.standard,
+               'ingredients': ingredients.get(item.pk, [])}
@@ -0,0 +1,281 @@
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ChangeEvent, Menu, Item, Ingredient, Restaurant
+from .signals import catalog_changed
+
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import urllib.request
+import weakref
+
+# Model name of ChangeEvent.model: model
+MODELS = {'menu': Menu, 'item': Item, 'ingredient': Ingredient}
+# catalog_changed keyword: model name
+KEYS = {'menus': 'menu', 'items': 'item', 'ingredients': 'ingredient'}
+# Action kept when one object changes several times in a transaction or a
+# webhook batch: a delete wins, a create stays a create
+ACTION_RANK = {'update': 0, 'create': 1, 'delete': 2}
+# Largest number of events of one feed response
+CHANGE_FEED_LIMIT = 500
+# Rows looked up per query by write_events()
+LOOKUP_BATCH = 500
+
+# Callbacks queued by queue_on_commit() in the transaction of this thread
+# (connections are per thread), {class: weak reference}. The transaction
+# holds the only strong reference, so a rolled back callback is gone too.
+_queued = threading.local()
+
+
+def merge(pending, key, action, restaurant=None):
+    """Adds one change to a dictionary {(model name, pk): [action,
+    restaurant pk]}, keeping the strongest action (ACTION_RANK)
+    """
+    current = pending.get(key)
+    if current is None:
+        pending[key] = [action, restaurant]
+        return
+    if ACTION_RANK[action] > ACTION_RANK[current[0]]:
+        current[0] = action
+    if restaurant is not None:
+        current[1] = restaurant
+
+
+class PendingChanges(dict):
+    """PendingChanges class - changes of one transaction, {(model name,
+    pk): [action, restaurant pk]}, written by write_events() when called
+    (transaction.on_commit)
+    Inherit: - dict
+    """
+
+    def __call__(self):
+        write_events(self)
+
+
+def queue_on_commit(cls, add):
+    """Adds writes to the callback of class 'cls' queued with
+    transaction.on_commit() by the current transaction, queueing a new one
+    if there is none. The writes of a whole transaction are collected and
+    done once it commits, not at all if it rolls back. Outside of a
+    transaction they are done right away.
+    :input: - cls - callable class, called with no arguments
+            - add - function adding the writes to a cls instance
+    """
+    if not transaction.get_connection().in_atomic_block:
+        pending = cls()
+        add(pending)
+        # Runs right away outside of a transaction
+        transaction.on_commit(pending)
+        return
+    queued = _queued.__dict__.setdefault('callbacks', {})
+    pending = queued[cls]() if cls in queued else None
+    if pending is None:
+        pending = cls()
+        reference = queued[cls] = weakref.ref(pending)
+
+        def run():
+            if queued.get(cls) is reference:
+                del queued[cls]
+            pending()
+        transaction.on_commit(run)
+    add(pending)
+
+
+def _record(changes):
+    """Queues changes, list of (model name, pk, action, restaurant pk or
+    None), for write_events(), coalesced per transaction
+    """
+    def add(pending):
+        for model, pk, action, restaurant in changes:
+            merge(pending, (model, pk), action, restaurant)
+    queue_on_commit(PendingChanges, add)
+
+
+def write_events(pending):
+    """Writes queued changes as ChangeEvent rows. The restaurants of the
+    changed rows are read in one query per model and LOOKUP_BATCH rows,
+    changes of rows gone since (deleted) are dropped, their delete event
+    carries the restaurant. The restaurants are locked while the events
+    are inserted, so their sequence numbers follow the commit order.
+    :input: - pending - {(model name, pk): [action, restaurant pk]}
+    """
+    missing = {}
+    for (model, pk), (action, restaurant) in pending.items():
+        if restaurant is None:
+            missing.setdefault(model, []).append(pk)
+    found = {}
+    for model, pks in missing.items():
+        for start in range(0, len(pks), LOOKUP_BATCH):
+            found.update(
+                ((model, pk), restaurant) for pk, restaurant in
+                MODELS[model]._base_manager.filter(
+                    pk__in=pks[start:start + LOOKUP_BATCH]).values_list(
+                    'pk', 'restaurant_id'))
+    events = [ChangeEvent(restaurant_id=restaurant or found[key],
+                          model=key[0], object_id=key[1], action=action)
+              for key, (action, restaurant) in pending.items()
+              if restaurant is not None or key in found]
+    if not events:
+        return
+    with transaction.atomic():
+        # noinspection PyUnresolvedReferences
+        list(Restaurant.objects.select_for_update().filter(
+            pk__in={event.restaurant_id for event in events}
+        ).order_by('pk').values_list('pk', flat=True))
+        # noinspection PyUnresolvedReferences
+        ChangeEvent.objects.bulk_create(events, batch_size=LOOKUP_BATCH)
+
+
+@receiver(catalog_changed)
+def record_changes(sender, created=False, deleted=False, **kwargs):
+    """Every object of catalog_changed changed, the ones of the sender
+    model were created if 'created', soft deleted if 'deleted'
+    """
+    own = {Menu: 'menus', Item: 'items', Ingredient: 'ingredients'}.get(
+        sender)
+    action = 'create' if created else 'delete' if deleted else 'update'
+    _record([(KEYS[key], pk, action if key == own else 'update', None)
+             for key in KEYS for pk in kwargs.get(key) or ()])
+
+
+@receiver(post_delete, sender=Menu)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Ingredient)
+def record_delete(sender, instance, **kwargs):
+    """Menu, Item or Ingredient deleted, purges of soft deleted rows were
+    recorded by the soft delete
+    """
+    if getattr(instance, 'deleted_at', None) is not None:
+        return
+    record_deletes(sender, {instance.pk: instance.restaurant_id})
+
+
+def record_deletes(model, restaurants):
+    """Records hard deletes, the ones done without the model signals
+    (queryset._raw_delete()) must call this themselves
+    :input: - model - Menu, Item or Ingredient
+            - restaurants - {pk: restaurant pk} of the deleted rows
+    """
+    _record([(model._meta.model_name, pk, 'delete', restaurant)
+             for pk, restaurant in restaurants.items()])
+
+
+def last_sequence():
+    """Returns sequence number of the last change of the current
+    restaurant, 0 if none
+    """
+    # noinspection PyUnresolvedReferences
+    return ChangeEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def serialize_change(event):
+    """Change dictionary of the feed and the webhooks"""
+    return {'seq': event.pk,
+            'model': event.model,
+            'id': event.object_id,
+            'action': event.action,
+            'at': event.created_at}
+
+
+def changes_since(since, limit=CHANGE_FEED_LIMIT):
+    """Changes of the current restaurant after a sequence number
+    :input: - since - sequence number
+            - limit - largest number of changes
+    :return: - dictionary - changes - list of serialize_change()
+                          - last - sequence number to ask from next
+    """
+    # noinspection PyUnresolvedReferences
+    events = list(ChangeEvent.objects.filter(pk__gt=since).order_by(
+        'pk')[:limit])
+    return {'changes': [serialize_change(event) for event in events],
+            'last': events[-1].pk if events else since}
+
+
+def coalesce(events, limit):
+    """Coalesces events in sequence order, one change per object, until
+    'limit' objects are changed
+    :input: - events - iterable of ChangeEvent, in sequence order
+            - limit - largest number of objects
+    :return: - tuple of list of {'model', 'id', 'action'} and sequence
+               number of the last event taken (None if none)
+    """
+    pending = {}
+    last = None
+    for event in events:
+        key = (event.model, event.object_id)
+        if key not in pending and len(pending) == limit:
+            break
+        merge(pending, key, event.action)
+        last = event.pk
+    return ([{'model': model, 'id': pk, 'action': action}
+             for (model, pk), (action, restaurant) in pending.items()],
+            last)
+
+
+def deliver(webhook, body, timeout=10):
+    """POSTs a JSON body to a webhook, signed with its secret
+    (X-Menu-Signature: sha256=<HMAC of the body>)
+    :raise: - OSError (urllib.error.URLError, HTTPError) if the delivery
+              failed or was not answered with 2xx
+    """
+    headers = {'Content-Type': 'application/json'}
+    if webhook.secret:
+        headers['X-Menu-Signature'] = 'sha256=' + hmac.new(
+            webhook.secret.encode(), body, hashlib.sha256).hexdigest()
+    request = urllib.request.Request(webhook.url, data=body, headers=headers,
+                                     method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def settled(webhook, settle, max_delay, now=None):
+    """Whether the pending changes of a webhook are due: the last one is
+    older than 'settle' seconds (the burst is over), or the first one older
+    than 'max_delay' seconds (a long burst is delivered in parts)
+    """
+    now = now or timezone.now()
+    # noinspection PyUnresolvedReferences
+    pending = ChangeEvent.objects.filter(
+        restaurant_id=webhook.restaurant_id,
+        pk__gt=webhook.last_sequence).aggregate(
+        first=Min('created_at'), last=Max('created_at'))
+    if pending['first'] is None:
+        return False
+    return pending['last'] <= now - datetime.timedelta(seconds=settle) or \
+        pending['first'] <= now - datetime.timedelta(seconds=max_delay)
+
+
+def dispatch(webhook, batch_size=200, timeout=10):
+    """Delivers the pending changes of a webhook, coalesced, at most
+    'batch_size' objects per delivery, and moves its last_sequence after
+    every successful one
+    :input: - webhook - Webhook
+            - batch_size - largest number of changes per delivery
+            - timeout - seconds per delivery
+    :return: - number of deliveries
+    :raise: - OSError if a delivery failed, the changes not delivered yet
+              are sent again on the next call
+    """
+    deliveries = 0
+    while True:
+        # A burst may repeat the same objects, read a few batches ahead
+        # noinspection PyUnresolvedReferences
+        events = ChangeEvent.objects.filter(
+            restaurant_id=webhook.restaurant_id,
+            pk__gt=webhook.last_sequence).order_by('pk').only(
+            'model', 'object_id', 'action')[:batch_size * 5]
+        changes, last = coalesce(events, batch_size)
+        if last is None:
+            return deliveries
+        body = json.dumps({'since': webhook.last_sequence, 'last': last,
+                           'changes': changes}).encode()
+        deliver(webhook, body, timeout=timeout)
+        webhook.last_sequence = last
+        webhook.save(update_fields=['last_sequence'])
+        deliveries += 1
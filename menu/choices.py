@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.db.models import Count, Max
+from django.forms import ModelChoiceField, ModelMultipleChoiceField, Select, \
+    SelectMultiple
+from django.forms.models import ModelChoiceIterator
+
+from .cache import render_cache
+
+import hashlib
+
+
+def choices_key(queryset):
+    """Returns the cache key of the choices of a queryset, derived from the
+    database so every worker process agrees on it: row count, highest pk
+    and, for models which have it, last updated_at. Renames of models
+    without updated_at (users) show up when the entry times out
+    (settings.MENU_CHOICES_TIMEOUT).
+    """
+    model = queryset.model
+    stats = {'count': Count('pk'), 'last_pk': Max('pk')}
+    if any(field.name == 'updated_at' for field in model._meta.fields):
+        stats['updated_at'] = Max('updated_at')
+    values = queryset.order_by().aggregate(**stats)
+    raw = ':'.join(str(values[name]) for name in sorted(values))
+    return 'menu:choices:{}:{}'.format(
+        model._meta.label_lower,
+        hashlib.md5((str(queryset.query) + raw).encode('utf-8')).hexdigest())
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """CachedModelChoiceIterator class
+    Inherit: - ModelChoiceIterator
+    - Yields (pk, label) pairs from the cache instead of the queryset.
+    """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from self.field.cached_choices()
+
+    def __len__(self):
+        return (len(self.field.cached_choices()) +
+                (1 if self.field.empty_label is not None else 0))
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(
+            self.field.cached_choices())
+
+
+class CachedChoicesMixin:
+    """CachedChoicesMixin class - the choices of a model choice field are
+    built once and kept in the render cache under a key which changes with
+    the rows (choices_key), for settings.MENU_CHOICES_TIMEOUT seconds.
+    Validation still looks up the submitted pks in the database.
+    """
+    iterator = CachedModelChoiceIterator
+
+    def cached_choices(self):
+        """Returns list of (pk, label) pairs of the field queryset"""
+        choices = getattr(self, '_cached_choices', None)
+        if choices is None:
+            key = choices_key(self.queryset)
+            cache = render_cache()
+            choices = cache.get(key)
+            if choices is None:
+                choices = [(obj.pk, self.label_from_instance(obj))
+                           for obj in self.queryset]
+                cache.set(key, choices, getattr(
+                    settings, 'MENU_CHOICES_TIMEOUT', 300))
+            self._cached_choices = choices
+        return choices
+
+    def __deepcopy__(self, memo):
+        result = super().__deepcopy__(memo)
+        result._cached_choices = None
+        return result
+
+
+class CachedModelChoiceField(CachedChoicesMixin, ModelChoiceField):
+    """ModelChoiceField with cached choices"""
+
+
+class CachedModelMultipleChoiceField(CachedChoicesMixin,
+                                     ModelMultipleChoiceField):
+    """ModelMultipleChoiceField with cached choices"""
+
+
+class AutocompleteMixin:
+    """AutocompleteMixin class - renders only the selected options plus a
+    search box filled from a prefix-search endpoint, so big catalogs do not
+    ship every option with the page.
+    """
+    template_name = 'menu/widgets/autocomplete_select.html'
+
+    def __init__(self, url, attrs=None, choices=()):
+        super().__init__(attrs, choices)
+        self.url = url
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(v) for v in value}
+        choices = self.choices
+        self.choices = [(option_value, label)
+                        for option_value, label in choices
+                        if str(option_value) in selected]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['url'] = self.url
+        return context
+
+
+class AutocompleteSelect(AutocompleteMixin, Select):
+    """Select with prefix search"""
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, SelectMultiple):
+    """SelectMultiple with prefix search"""
+
+
+def use_autocomplete(field, url, threshold):
+    """Swaps the widget of a cached choice field for the autocomplete one
+    when it has more than 'threshold' choices
+    :input: - field - CachedModelChoiceField / CachedModelMultipleChoiceField
+            - url - prefix-search endpoint
+            - threshold - number of choices, None to never switch
+    """
+    if threshold is None or len(field.cached_choices()) <= threshold:
+        return
+    widget_class = (AutocompleteSelectMultiple
+                    if isinstance(field, ModelMultipleChoiceField)
+                    else AutocompleteSelect)
+    widget = widget_class(url, attrs=field.widget.attrs)
+    widget.is_required = field.widget.is_required
+    widget.choices = field.choices
+    field.widget = widget
+
@@ -0,0 +1,76 @@
+from django.db.models import Count, Max
+
+from .models import Menu, Item
+from .tenants import current_restaurant
+
+import datetime
+import hashlib
+
+
+# Validators for the read views (django.views.decorators.http.condition).
+# Each function runs one query and never loads model instances, so a
+# matching If-None-Match / If-Modified-Since is answered with 304 before
+# anything is rendered. The ETag also covers the anonymous/authenticated
+# variant of a page.
+#
+# List pages only get an ETag: a deleted row does not move Max(updated_at),
+# but it does change the row count which is part of the ETag.
+
+
+def _etag(request, *parts):
+    variant = 'auth' if request.user.is_authenticated else 'anon'
+    raw = ':'.join(str(part) for part in
+                   parts + (current_restaurant.get(), variant))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def row_updated_at(request, model, pk):
+    """updated_at of one row, looked up once per request for both the ETag
+    and the Last-Modified function
+    """
+    looked_up = request.__dict__.setdefault('_updated_at', {})
+    key = (model, pk)
+    if key not in looked_up:
+        # noinspection PyUnresolvedReferences
+        looked_up[key] = model.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True).first()
+    return looked_up[key]
+
+
+def menu_list_etag(request):
+    """ETag of menu_list - live menus count and last update"""
+    today = datetime.date.today()
+    # noinspection PyUnresolvedReferences
+    stats = Menu.objects.live().aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+    return _etag(request, 'menus', today, stats['count'], stats['updated_at'])
+
+
+def item_list_etag(request):
+    """ETag of item_list - items count, last update and page cursor"""
+    # noinspection PyUnresolvedReferences
+    stats = Item.objects.aggregate(count=Count('pk'),
+                                   updated_at=Max('updated_at'))
+    return _etag(request, 'items', request.GET.get('after', ''),
+                 stats['count'], stats['updated_at'])
+
+
+def menu_last_modified(request, pk):
+    """Last-Modified of menu_detail, None (no validator) if missing"""
+    return row_updated_at(request, Menu, pk)
+
+
+def menu_etag(request, pk):
+    """ETag of menu_detail"""
+    updated_at = row_updated_at(request, Menu, pk)
+    return updated_at and _etag(request, 'menu', pk, updated_at)
+
+
+def item_last_modified(request, pk):
+    """Last-Modified of item_detail, None (no validator) if missing"""
+    return row_updated_at(request, Item, pk)
+
+
+def item_etag(request, pk):
+    """ETag of item_detail"""
+    updated_at = row_updated_at(request, Item, pk)
+    return updated_at and _etag(request, 'item', pk, updated_at)
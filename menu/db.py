@@ -0,0 +1,39 @@
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+def _install_check(connection):
+    """Wraps ensure_connection() of a connection, called before every
+    cursor is made, so a pending health check runs right before the first
+    query of a request
+    """
+    ensure_connection = connection.ensure_connection
+
+    def checked_ensure_connection():
+        if connection.health_check_pending:
+            connection.health_check_pending = False
+            if connection.connection is not None and \
+                    not connection.in_atomic_block and \
+                    not connection.is_usable():
+                connection.close()
+        ensure_connection()
+    connection.ensure_connection = checked_ensure_connection
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Health check of persistent connections (settings CONN_MAX_AGE > 0):
+    a connection dropped by the server or a proxy since the last request is
+    closed before the first query of the next one, which opens a new
+    connection instead of failing. The check ('SELECT 1' on PostgreSQL)
+    runs once per request, and not at all in requests without queries.
+    Enabled per database with 'CONN_HEALTH_CHECKS': True.
+    """
+    for connection in connections.all():
+        if connection.connection is None or \
+                not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not hasattr(connection, 'health_check_pending'):
+            _install_check(connection)
+        connection.health_check_pending = True
@@ -1,55 +1,124 @@
+from django.conf import settings
+from django.db import transaction
 from django.forms import DateField, ModelForm, ValidationError, SelectDateWidget
+from django.urls import reverse
 
-from .models import Menu, Item
+from .choices import CachedModelChoiceField, CachedModelMultipleChoiceField, \
+    use_autocomplete
+from .models import Menu, Item, Ingredient
 
 import datetime
 
 
+def year_range():
+    """Returns the years offered for the expiration date, this year and the
+    next two (computed per form, long-running workers cross new year)
+    """
+    year = datetime.date.today().year
+    return tuple(range(year, year + 3))
+
+
+def autocomplete(form, field_name, kind):
+    """Switches a field of the form to the autocomplete widget when the
+    catalog is bigger than settings.MENU_AUTOCOMPLETE_THRESHOLD
+    """
+    use_autocomplete(form.fields[field_name],
+                     reverse('menu:autocomplete', kwargs={'kind': kind}),
+                     getattr(settings, 'MENU_AUTOCOMPLETE_THRESHOLD', None))
+
+
+def validate_menu(items, expiration_date):
+    """Menu rules shared by MenuForm and the import_menu command
+    :input: - items - selected items
+            - expiration_date - date or None
+    :raise: - ValidationError
+    """
+    if expiration_date:
+        if expiration_date < datetime.date.today():
+            raise ValidationError('Expiration date already passed!!')
+    if items:
+        if len(items) < 1:
+            raise ValidationError("You must select one or more items!")
+    else:
+        raise ValidationError('You must select one or more items!')
+
+
+def validate_item(description, ingredients):
+    """Item rules shared by ItemForm and the import_menu command
+    :input: - description - text
+            - ingredients - selected ingredients
+    :raise: - ValidationError
+    """
+    if not description or len(description) < 10:
+        raise ValidationError('Description must contain at least 10 characters!')
+    if ingredients:
+        if len(ingredients) < 2:
+            raise ValidationError('You must select two or more ingredients!')
+
+
 class MenuForm(ModelForm):
     """MenuForm class
     Inherit: - ModelForm
     field: - expiration_date: - DateField with SelectDateWidget and range of years for selection
+           - items: - cached choices
     """
-    year = datetime.datetime.today().year
-    year_range = tuple([i for i in range(year, year + 3)])
     expiration_date = DateField(
-        required=False, widget=SelectDateWidget(years=year_range)
+        required=False, widget=SelectDateWidget(years=year_range())
     )
 
     class Meta:
         model = Menu
-        exclude = ('created_date',)
+        exclude = ('created_date', 'is_active', 'restaurant', 'deleted_at')
+        field_classes = {'items': CachedModelMultipleChoiceField}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['expiration_date'].widget.years = year_range()
+        # The class level queryset was built outside of any request
+        # noinspection PyUnresolvedReferences
+        self.fields['items'].queryset = Item.objects.all()
+        autocomplete(self, 'items', 'items')
 
     def clean(self):
         """clean method, overrides the super class clean() method.
         - Makes sure expiration date is not passed if there is one.
         - Makes sure that at least 1 item is selected.
+        - Brings an archived menu back, its expiration date is valid again.
         -:return: - cleaned_data
         """
         cleaned_data = super().clean()
-        items = cleaned_data.get('items')
-        expiration_date = cleaned_data.get('expiration_date')
-
-        if expiration_date:
-            if expiration_date < datetime.date.today():
-                raise ValidationError('Expiration date already passed!!')
-        if items:
-            if len(items) < 1:
-                raise ValidationError("You must select one or more items!")
-        else:
-            raise ValidationError('You must select one or more items!')
+        validate_menu(cleaned_data.get('items'),
+                      cleaned_data.get('expiration_date'))
+        self.instance.is_active = True
 
         return cleaned_data
 
+    def save(self, commit=True):
+        """Saves the menu and its items in one transaction, recorded as one
+        change and one version (menu.changes, menu.history)
+        """
+        with transaction.atomic():
+            return super().save(commit)
+
 
 class ItemForm(ModelForm):
     """ItemForm class
     Inherit: - ModelForm
+    field: - chef, ingredients: - cached choices
     """
 
     class Meta:
         model = Item
-        exclude = ('created_date',)
+        exclude = ('created_date', 'restaurant', 'deleted_at')
+        field_classes = {'chef': CachedModelChoiceField,
+                         'ingredients': CachedModelMultipleChoiceField}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # noinspection PyUnresolvedReferences
+        self.fields['ingredients'].queryset = Ingredient.objects.all()
+        autocomplete(self, 'chef', 'chefs')
+        autocomplete(self, 'ingredients', 'ingredients')
 
     def clean(self):
         """clean method, overrides the super class clean() method.
@@ -58,12 +127,14 @@ class ItemForm(ModelForm):
         -:return: - cleaned_data
         """
         cleaned_data = super().clean()
-        description = cleaned_data.get('description')
-        ingredients = cleaned_data.get('ingredients')
-        if not description or len(description) < 10:
-            raise ValidationError('Description must contain at least 10 characters!')
-        if ingredients:
-            if len(ingredients) < 2:
-                raise ValidationError('You must select two or more ingredients!')
+        validate_item(cleaned_data.get('description'),
+                      cleaned_data.get('ingredients'))
 
         return cleaned_data
+
+    def save(self, commit=True):
+        """Saves the item and its ingredients in one transaction, recorded
+        as one change (menu.changes)
+        """
+        with transaction.atomic():
+            return super().save(commit)
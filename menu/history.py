@@ -0,0 +1,169 @@
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .changes import queue_on_commit
+from .models import Menu, MenuVersion, Item, encode_pks
+from .signals import MenuItems, catalog_changed
+
+import datetime
+
+# Menus whose versions are recorded per batch of queries
+VERSION_BATCH = 500
+# Versions listed by the history page
+HISTORY_LIMIT = 20
+
+
+class PendingVersions(set):
+    """PendingVersions class - pks of the menus changed by one transaction,
+    whose versions record_versions() records when called
+    (transaction.on_commit)
+    Inherit: - set
+    """
+
+    def __call__(self):
+        record_versions(self)
+
+
+def version_state(menu):
+    """Returns the versioned fields of a Menu values() row or a
+    MenuVersion, items left out
+    """
+    if isinstance(menu, MenuVersion):
+        return (menu.season, menu.expiration_date, menu.is_active,
+                menu.is_deleted)
+    return (menu['season'], menu['expiration_date'], menu['is_active'],
+            menu['deleted_at'] is not None)
+
+
+def record_versions(menu_pks):
+    """Records a version of every menu whose season, expiration date,
+    status or live items differ from its last version, in four queries and
+    one insert per VERSION_BATCH menus. The item set is stored as a delta
+    against the snapshot of the last version while the delta is at most
+    half the size of that snapshot, as a new snapshot otherwise. The first
+    version of a menu is dated from its creation (like the versions
+    backfilled by migration 0015).
+    :input: - menu_pks - iterable of menu ids
+    """
+    menu_pks = list(menu_pks)
+    for start in range(0, len(menu_pks), VERSION_BATCH):
+        _record_batch(menu_pks[start:start + VERSION_BATCH])
+
+
+def _record_batch(menu_pks):
+    menus = {menu['pk']: menu for menu in Menu._base_manager.filter(
+        pk__in=menu_pks).values('pk', 'restaurant_id', 'season',
+                                'expiration_date', 'is_active',
+                                'deleted_at', 'created_date')}
+    if not menus:
+        return
+    items = {}
+    for menu_pk, item_pk in MenuItems.objects.filter(
+            menu_id__in=menus, item__deleted_at__isnull=True).values_list(
+            'menu_id', 'item_id'):
+        items.setdefault(menu_pk, set()).add(item_pk)
+    last = MenuVersion._base_manager.filter(pk__in=MenuVersion._base_manager
+                                            .filter(menu_id__in=menus)
+                                            .values('menu_id')
+                                            .annotate(last=Max('pk'))
+                                            .values('last'))
+    last = {version.menu_id: version
+            for version in last.select_related('base')}
+
+    now = timezone.now()
+    versions = []
+    for pk, menu in menus.items():
+        current = items.get(pk, set())
+        previous = last.get(pk)
+        if previous is not None and \
+                version_state(previous) == version_state(menu) and \
+                previous.item_pks == current:
+            continue
+        version = MenuVersion(
+            menu_id=pk, restaurant_id=menu['restaurant_id'],
+            recorded_at=now if previous else menu['created_date'],
+            season=menu['season'], expiration_date=menu['expiration_date'],
+            is_active=menu['is_active'],
+            is_deleted=menu['deleted_at'] is not None)
+        snapshot = previous and (previous.base or previous)
+        if snapshot is not None:
+            added = current - snapshot.item_pks
+            removed = snapshot.item_pks - current
+            if 2 * (len(added) + len(removed)) <= len(snapshot.item_pks):
+                version.base = snapshot
+                version.added = encode_pks(added)
+                version.removed = encode_pks(removed)
+        if version.base is None:
+            version.items = encode_pks(current)
+        versions.append(version)
+    MenuVersion._base_manager.bulk_create(versions)
+
+
+@receiver(catalog_changed)
+def menus_changed(sender, menus, **kwargs):
+    """Versions of the affected menus are recorded once the transaction
+    commits, a no-op for menus whose versioned state did not change
+    """
+    if menus:
+        queue_on_commit(PendingVersions, lambda pending: pending.update(menus))
+
+
+def parse_at(value):
+    """Returns the aware datetime of an ISO 8601 date and time, or of the
+    end of an ISO 8601 date, None for an empty value
+    :raise: - ValueError for anything else
+    """
+    if not value:
+        return None
+    at = parse_datetime(value)
+    if at is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('Invalid date: {}'.format(value))
+        at = datetime.datetime.combine(day, datetime.time.max)
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return at
+
+
+def _version_at(pk, at):
+    # noinspection PyUnresolvedReferences
+    versions = MenuVersion.objects.filter(menu_id=pk).select_related('base')
+    if at is not None:
+        versions = versions.filter(recorded_at__lte=at)
+    return versions.order_by('-recorded_at', '-pk').first()
+
+
+def menu_as_of(pk, at=None):
+    """Menu of the current restaurant as it was at a time, in two queries
+    however long its history is: the version with its snapshot, then the
+    items. Menus without any version (written around the signals) get one
+    first. Items keep their current name, purged ones are left out.
+    :input: - pk - menu id
+            - at - aware datetime, None for the last version
+    :return: - tuple of MenuVersion and list of Item, None if the menu did
+               not exist or was deleted at that time
+    """
+    version = _version_at(pk, at)
+    # noinspection PyUnresolvedReferences
+    if version is None and not MenuVersion.objects.filter(
+            menu_id=pk).exists() and Menu.objects.filter(pk=pk).exists():
+        record_versions([pk])
+        version = _version_at(pk, at)
+    if version is None or version.is_deleted:
+        return None
+    items = list(Item._base_manager.filter(
+        pk__in=version.item_pks).only('name').order_by('name', 'pk'))
+    return version, items
+
+
+def recorded_at(pk):
+    """Returns list of the times of the last HISTORY_LIMIT versions of a
+    menu, newest first
+    """
+    # noinspection PyUnresolvedReferences
+    return list(MenuVersion.objects.filter(menu_id=pk).order_by(
+        '-recorded_at').values_list('recorded_at', flat=True)[
+        :HISTORY_LIMIT])
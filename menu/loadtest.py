@@ -0,0 +1,532 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from .benchmarks import percentile
+from .models import Menu, Item, Ingredient
+from .signals import ItemIngredients, MenuItems
+
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import contextlib
+import http.client
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Weighted mix of the routes requested by run_site_load(), {view name:
+# weight}: mostly reads, menu_edit and item_edit post the current values of
+# a menu or an item back
+SITE_MIX = {
+    'menu_list': 30,
+    'menu_detail': 20,
+    'item_list': 10,
+    'item_detail': 15,
+    'search': 6,
+    'ingredient_menus': 3,
+    'autocomplete': 3,
+    'api_menus': 4,
+    'api_items': 3,
+    'menu_edit': 4,
+    'item_edit': 2,
+}
+# Number of menus, items and ingredients the site load picks from
+SITE_TARGETS = 200
+# WSGI servers started by serve()
+SERVERS = ('runserver', 'gunicorn', 'waitress')
+
+# Seconds added to every query by delay_query (stand-in for the round
+# trip to a network database), set by the load runs
+_query_latency = 0.0
+
+
+def delay_query(execute, sql, params, many, context):
+    if _query_latency:
+        time.sleep(_query_latency)
+    return execute(sql, params, many, context)
+
+
+def install_delay(sender, connection, **kwargs):
+    if delay_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(delay_query)
+
+
+def environ(path, query=''):
+    """Returns the WSGI environ of a GET request"""
+    return {'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False}
+
+
+def summary(timings, errors, opened, seconds):
+    return {'requests': len(timings),
+            'errors': len(errors),
+            'seconds': round(seconds, 3),
+            'rps': round(len(timings) / seconds, 1),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'connections': len(opened)}
+
+
+def run_load(paths, threads=8, requests=200, connect_latency=0.0,
+             query_latency=0.0):
+    """Sends GET requests through the WSGI handler from several threads,
+    like a threaded gunicorn worker. Unlike the test client, the handler
+    sends request_started/request_finished, so connections are opened,
+    health checked, kept or closed as configured.
+    :input: - paths - list of paths, requested round robin
+            - threads - concurrent threads
+            - requests - requests per thread
+            - connect_latency - seconds added to every new connection, a
+                                stand-in for a network database handshake
+            - query_latency - seconds added to every query
+    :return: - dictionary of requests, errors, seconds, rps, p50_ms,
+               p95_ms and connections (opened)
+    """
+    handler = WSGIHandler()
+    lock = threading.Lock()
+    timings = []
+    opened = []
+    errors = []
+
+    def created(sender, connection, **kwargs):
+        if connect_latency:
+            time.sleep(connect_latency)
+        with lock:
+            opened.append(connection.alias)
+
+    def worker(offset):
+        own = []
+        try:
+            for number in range(requests):
+                path = paths[(offset + number) % len(paths)]
+                statuses = []
+                start = time.perf_counter()
+                response = handler(environ(path),
+                                   lambda status, headers: statuses.append(
+                                       status))
+                for _ in response:
+                    pass
+                response.close()
+                own.append(time.perf_counter() - start)
+                if not statuses[0].startswith(('2', '3')):
+                    with lock:
+                        errors.append('{} {}'.format(path, statuses[0]))
+        finally:
+            connections.close_all()
+            with lock:
+                timings.extend(own)
+
+    global _query_latency
+    _query_latency = query_latency
+    connection_created.connect(created)
+    connection_created.connect(install_delay)
+    try:
+        pool = [threading.Thread(target=worker, args=(offset,))
+                for offset in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        seconds = time.perf_counter() - start
+    finally:
+        connection_created.disconnect(created)
+        connection_created.disconnect(install_delay)
+        _query_latency = 0.0
+    return summary(timings, errors, opened, seconds)
+
+
+def scope(path):
+    """Returns the ASGI scope of a GET request"""
+    return {'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80)}
+
+
+def run_asgi_load(paths, concurrency=64, requests=20, query_latency=0.0):
+    """Sends GET requests through the ASGI handler from 'concurrency'
+    clients on one event loop, like one uvicorn worker
+    :input: - paths - list of paths, requested round robin
+            - concurrency - concurrent clients
+            - requests - requests per client
+            - query_latency - seconds added to every query
+    :return: - same dictionary as run_load()
+    """
+    handler = ASGIHandler()
+    timings = []
+    opened = []
+    errors = []
+
+    def created(sender, connection, **kwargs):
+        opened.append(connection.alias)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def client(offset):
+        for number in range(requests):
+            path = paths[(offset + number) % len(paths)]
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+            start = time.perf_counter()
+            await handler(scope(path), receive, send)
+            timings.append(time.perf_counter() - start)
+            if statuses[0] >= 400:
+                errors.append('{} {}'.format(path, statuses[0]))
+
+    async def main():
+        await asyncio.gather(*(client(offset)
+                               for offset in range(concurrency)))
+
+    global _query_latency
+    _query_latency = query_latency
+    connection_created.connect(created)
+    connection_created.connect(install_delay)
+    try:
+        start = time.perf_counter()
+        asyncio.run(main())
+        seconds = time.perf_counter() - start
+    finally:
+        connection_created.disconnect(created)
+        connection_created.disconnect(install_delay)
+        _query_latency = 0.0
+    return summary(timings, errors, opened, seconds)
+
+
+def site_targets(limit=SITE_TARGETS):
+    """Loads the menus, items and ingredient names requested by the site
+    load, of the current restaurant
+    :input: - limit - number of rows of each kind
+    :return: - dictionary - menus - list of MenuForm data dictionaries
+                                    with 'pk'
+                          - items - list of ItemForm data dictionaries
+                                    with 'pk'
+                          - words - list of ingredient names
+    """
+    # noinspection PyUnresolvedReferences
+    menus = list(Menu.objects.live().order_by('-pk').values(
+        'pk', 'season', 'expiration_date')[:limit])
+    for menu in menus:
+        menu['items'] = []
+        menu['expiration_date'] = menu['expiration_date'] or ''
+    found = {menu['pk']: menu for menu in menus}
+    for menu_id, item_id in MenuItems.objects.filter(
+            menu_id__in=found).values_list('menu_id', 'item_id'):
+        found[menu_id]['items'].append(item_id)
+
+    # noinspection PyUnresolvedReferences
+    items = list(Item.objects.order_by('-pk').values(
+        'pk', 'name', 'description', 'standard', 'chef')[:limit])
+    for item in items:
+        item['ingredients'] = []
+    found = {item['pk']: item for item in items}
+    for item_id, ingredient_id in ItemIngredients.objects.filter(
+            item_id__in=found).values_list('item_id', 'ingredient_id'):
+        found[item_id]['ingredients'].append(ingredient_id)
+
+    # The first ingredients are the most used ones (menu.synthetic)
+    # noinspection PyUnresolvedReferences
+    words = list(Ingredient.objects.order_by('pk').values_list(
+        'name', flat=True)[:limit])
+    return {'menus': [menu for menu in menus if menu['items']],
+            'items': items, 'words': words}
+
+
+def site_request(name, targets, rng):
+    """Returns one request of a SITE_MIX route
+    :input: - name - view name
+            - targets - dictionary returned by site_targets()
+            - rng - random.Random
+    :return: - tuple of method, path and POST data (None for a GET)
+    """
+    if name in ('menu_detail', 'menu_edit'):
+        menu = rng.choice(targets['menus'])
+        path = reverse('menu:' + name, kwargs={'pk': menu['pk']})
+        if name == 'menu_edit':
+            return 'POST', path, {key: value for key, value in menu.items()
+                                  if key != 'pk'}
+        return 'GET', path, None
+    if name in ('item_detail', 'item_edit'):
+        item = rng.choice(targets['items'])
+        path = reverse('menu:' + name, kwargs={'pk': item['pk']})
+        if name == 'item_edit':
+            # Unchecked checkboxes are not posted
+            return 'POST', path, {key: value for key, value in item.items()
+                                  if key != 'pk' and value is not False}
+        return 'GET', path, None
+    query = {}
+    kwargs = {}
+    if name == 'search':
+        query['q'] = rng.choice(targets['words']).split()[-1][:4]
+    elif name == 'ingredient_menus':
+        query['contains'] = rng.choice(targets['words'])
+    elif name == 'autocomplete':
+        kwargs['kind'] = 'ingredients'
+        query['q'] = rng.choice(targets['words'])[:2]
+    path = reverse('menu:' + name, kwargs=kwargs)
+    if query:
+        path += '?' + urlencode(query)
+    return 'GET', path, None
+
+
+def plan_site_load(targets, mix, requests, seed):
+    """Returns list of 'requests' requests (view name, method, path, POST
+    data), routes drawn by weight, reproducible from 'seed'. Routes
+    without targets (no menus, items or ingredients) are left out.
+    :raise: - ValueError if no route is left
+    """
+    needs = {'menu_detail': 'menus', 'menu_edit': 'menus',
+             'item_detail': 'items', 'item_edit': 'items',
+             'search': 'words', 'ingredient_menus': 'words',
+             'autocomplete': 'words'}
+    # Items with less than two ingredients are not a valid ItemForm post
+    targets = dict(targets, items=[item for item in targets['items']
+                                   if len(item['ingredients']) >= 2])
+    mix = {name: weight for name, weight in mix.items()
+           if weight > 0 and (name not in needs or targets[needs[name]])}
+    if not mix:
+        raise ValueError('No route of the mix can be requested.')
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    return [(name,) + site_request(name, targets, rng) for name in names]
+
+
+class SiteClient:
+    """SiteClient class - one keep-alive HTTP connection with its own
+    cookies, like one browser. Posts carry the CSRF token cookie.
+    """
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+        # Page setting the CSRF token cookie
+        self.form_path = reverse('menu:menu_new')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method, path, data=None):
+        """Sends one request, reconnecting once if the server closed the
+        kept alive connection
+        :return: - status code
+        """
+        headers = {'Host': '{}:{}'.format(self.host, self.port)}
+        body = None
+        if data is not None:
+            if 'csrftoken' not in self.cookies:
+                self.request('GET', self.form_path)
+            body = urlencode(data, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '{}={}'.format(key, value)
+                for key, value in self.cookies.items())
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, self.prefix + path, body,
+                                        headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for key, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[key] = morsel.value
+                else:
+                    self.cookies.pop(key, None)
+        if response.will_close:
+            self.close()
+        return response.status
+
+
+def latencies(timings):
+    """Returns dictionary of requests, p50_ms, p95_ms and p99_ms"""
+    return {'requests': len(timings),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2)}
+
+
+def run_site_load(url, mix=None, threads=8, requests=200, seed=0,
+                  targets=None):
+    """Replays a weighted mix of the menu/urls.py routes against a running
+    server over HTTP, from several threads. Each thread is one client
+    (SiteClient) with its own request plan. A GET answering with a status
+    other than 2xx or 3xx, or an edit not redirecting (form errors) is an
+    error.
+    :input: - url - root url of the site, with the /r/<slug> prefix of a
+                    restaurant if any
+            - mix - {view name: weight}, SITE_MIX by default
+            - threads - concurrent clients
+            - requests - requests per client
+            - seed - random seed of the request plans
+            - targets - dictionary of site_targets(), loaded if None
+    :return: - dictionary of requests, errors, seconds, rps, p50_ms, p95_ms,
+               p99_ms and routes - {view name: latencies()}
+    """
+    if targets is None:
+        targets = site_targets()
+    plans = [plan_site_load(targets, mix or SITE_MIX, requests,
+                            seed * 1000 + offset)
+             for offset in range(threads)]
+    lock = threading.Lock()
+    timings = {}
+    errors = []
+
+    def worker(plan):
+        client = SiteClient(url)
+        own = []
+        try:
+            for name, method, path, data in plan:
+                start = time.perf_counter()
+                try:
+                    status = client.request(method, path, data)
+                except (http.client.HTTPException, OSError) as error:
+                    status = error
+                own.append((name, time.perf_counter() - start))
+                if not isinstance(status, int) or \
+                        not 200 <= status < 400 or \
+                        method == 'POST' and status != 302:
+                    with lock:
+                        errors.append('{} {} {}'.format(method, path,
+                                                        status))
+        finally:
+            client.close()
+            with lock:
+                for name, seconds in own:
+                    timings.setdefault(name, []).append(seconds)
+
+    pool = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    seconds = time.perf_counter() - start
+    every = [value for values in timings.values() for value in values]
+    result = latencies(every)
+    result.update({'errors': len(errors),
+                   'error_samples': errors[:10],
+                   'seconds': round(seconds, 3),
+                   'rps': round(len(every) / seconds, 1),
+                   'routes': {name: latencies(values)
+                              for name, values in sorted(timings.items())}})
+    return result
+
+
+def server_command(server, address, workers=2, threads=8):
+    """Returns the command line starting a WSGI server of mysite
+    :input: - server - one of SERVERS
+            - address - 'host:port'
+            - workers - processes (gunicorn)
+            - threads - threads per process (gunicorn, waitress)
+    """
+    if server == 'runserver':
+        return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+                'runserver', '--noreload', address]
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--bind', address,
+                '--workers', str(workers), '--threads', str(threads),
+                'mysite.wsgi:application']
+    if server == 'waitress':
+        return [sys.executable, '-m', 'waitress', '--listen=' + address,
+                '--threads={}'.format(threads), 'mysite.wsgi:application']
+    raise ValueError('Unknown server: {}'.format(server))
+
+
+def free_port():
+    """Returns a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(server, workers=2, threads=8, timeout=30):
+    """Starts a WSGI server of mysite on a free local port, with the
+    settings module of this process, and stops it at the end of the block
+    :return: - root url of the server
+    :raise: - RuntimeError if the server does not accept connections
+              within 'timeout' seconds
+    """
+    port = free_port()
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(
+            server_command(server, '127.0.0.1:{}'.format(port), workers,
+                           threads),
+            cwd=settings.BASE_DIR, env=env, stdout=log,
+            stderr=subprocess.STDOUT)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if process.poll() is not None:
+                    log.seek(0)
+                    raise RuntimeError('{} exited: {}'.format(
+                        server, log.read().decode(errors='replace')[-2000:]))
+                try:
+                    socket.create_connection(('127.0.0.1', port), 1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError('{} did not start in {}s'.format(
+                            server, timeout))
+                    time.sleep(0.1)
+            yield 'http://127.0.0.1:{}'.format(port)
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
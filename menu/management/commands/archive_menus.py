@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from menu.changes import record_deletes
+from menu.models import (ArchivedMenu, ArchivedMenuItem, Menu, MenuCard,
+                         MenuIngredient)
+from menu.signals import MenuItems
+from menu.synthetic import refresh_read_models
+
+import datetime
+
+
+class Command(BaseCommand):
+    """archive_menus command - meant to run daily from cron. Archives every
+    active menu whose expiration date has passed in one UPDATE, then sends
+    catalog_changed for them so the cards, caches and listing validators
+    follow. With --move-after DAYS, archived menus which expired more than
+    DAYS ago are moved, with their 'items' rows, to the ArchivedMenu and
+    ArchivedMenuItem tables, in batches.
+    """
+    help = 'Archives expired menus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date',
+                            help='Archive as of this date (YYYY-MM-DD), '
+                                 'today by default.')
+        parser.add_argument('--move-after', type=int,
+                            help='Move menus expired more than this many '
+                                 'days ago to the archive tables.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of menus refreshed or moved '
+                                 'per batch.')
+
+    def handle(self, *args, **options):
+        date = datetime.date.today()
+        if options['date']:
+            date = parse_date(options['date'])
+            if date is None:
+                raise CommandError('Invalid --date: {}'.format(
+                    options['date']))
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            # noinspection PyUnresolvedReferences
+            expired = Menu.objects.expired(date)
+            pks = list(expired.values_list('pk', flat=True))
+            expired.update(is_active=False)
+        refresh_read_models(pks, (), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            'Archived {} menus.'.format(len(pks))))
+
+        if options['move_after'] is not None:
+            moved = self.move(date - datetime.timedelta(options['move_after']),
+                              batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                'Moved {} menus to the archive tables.'.format(moved)))
+
+    def move(self, before, batch_size):
+        """Moves archived menus which expired before the date to the
+        archive tables, one transaction per batch. The moved rows and their
+        cards and ingredient index rows are removed with one DELETE per
+        table, without the per-instance signals and cascade collection of
+        queryset.delete(). Their change log entries are written directly.
+        :input: - before - date
+                - batch_size - menus per batch
+        :return: - number of menus moved
+        """
+        moved = 0
+        while True:
+            with transaction.atomic():
+                # noinspection PyUnresolvedReferences
+                menus = list(Menu.objects.filter(
+                    is_active=False, expiration_date__lt=before
+                ).order_by('pk').values(
+                    'pk', 'restaurant_id', 'season', 'created_date',
+                    'expiration_date'
+                )[:batch_size])
+                if not menus:
+                    return moved
+                pks = [menu['pk'] for menu in menus]
+                # noinspection PyUnresolvedReferences
+                ArchivedMenu.objects.bulk_create(
+                    [ArchivedMenu(id=menu['pk'],
+                                  restaurant_id=menu['restaurant_id'],
+                                  season=menu['season'],
+                                  created_date=menu['created_date'],
+                                  expiration_date=menu['expiration_date'])
+                     for menu in menus])
+                restaurants = {menu['pk']: menu['restaurant_id']
+                               for menu in menus}
+                rows = MenuItems.objects.filter(menu_id__in=pks).values_list(
+                    'menu_id', 'item_id')
+                # noinspection PyUnresolvedReferences
+                ArchivedMenuItem.objects.bulk_create(
+                    [ArchivedMenuItem(restaurant_id=restaurants[menu_id],
+                                      menu_id=menu_id, item_id=item_id)
+                     for menu_id, item_id in rows])
+                # noinspection PyUnresolvedReferences
+                for table in (MenuItems.objects.filter(menu_id__in=pks),
+                              MenuCard._base_manager.filter(menu_id__in=pks),
+                              MenuIngredient.objects.filter(menu_id__in=pks),
+                              Menu._base_manager.filter(pk__in=pks)):
+                    table._raw_delete(table.db)
+                record_deletes(Menu, restaurants)
+            moved += len(pks)
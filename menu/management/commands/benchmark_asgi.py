@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, \
+    teardown_test_environment
+
+from menu.benchmarks import bench_urls
+from menu.loadtest import run_asgi_load, run_load
+from menu.synthetic import seed_catalog
+
+import os
+import tempfile
+
+# Views which have an async version (menu.async_views)
+ASYNC_VIEWS = ('menu_list', 'menu_detail', 'item_list', 'item_detail')
+
+
+class Command(BaseCommand):
+    """benchmark_asgi command - seeds a synthetic catalog in a throwaway
+    test database and drives the views with an async version, once through
+    the WSGI handler from --threads threads (one threaded gunicorn worker,
+    MENU_ASYNC_THREADS by default) and once through the ASGI handler from
+    --concurrency clients (one uvicorn worker, blocking calls offloaded to
+    MENU_ASYNC_THREADS threads). Both runs use the production middleware,
+    without the debug toolbar, and persistent connections. --query-latency
+    stands in for the round trip to a network database.
+    """
+    help = 'Compares WSGI and ASGI throughput at high concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help='Concurrent ASGI clients.')
+        parser.add_argument('--requests', type=int, default=1280,
+                            help='Requests of each run.')
+        parser.add_argument('--items', type=int, default=1000,
+                            help='Size of the synthetic catalog.')
+        parser.add_argument('--threads', type=int,
+                            default=settings.MENU_ASYNC_THREADS,
+                            help='Threads of the WSGI run.')
+        parser.add_argument('--query-latency', type=float, default=2.0,
+                            help='Milliseconds added to every query.')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        concurrency = options['concurrency']
+        if min(threads, concurrency) < 1 or \
+                options['requests'] < max(threads, concurrency):
+            raise CommandError('--threads and --concurrency must be positive '
+                               'and not larger than --requests.')
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            path = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+            settings_dict.setdefault('TEST', {})['NAME'] = path
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        middleware = [name for name in settings.MIDDLEWARE
+                      if not name.startswith('debug_toolbar.')]
+        latency = options['query_latency'] / 1000.0
+        # Persistent, health checked connections, as deployed
+        saved = {key: settings_dict.get(key)
+                 for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        settings_dict.update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+        try:
+            seed_catalog(items=options['items'])
+            paths = [url for name, url, query in bench_urls()
+                     if name in ASYNC_VIEWS]
+            results = []
+            with override_settings(MIDDLEWARE=middleware):
+                result = run_load(
+                    paths, threads=threads,
+                    requests=options['requests'] // threads,
+                    query_latency=latency)
+                results.append(('WSGI x{}'.format(threads), result))
+                with override_settings(ROOT_URLCONF='mysite.urls_async'):
+                    result = run_asgi_load(
+                        paths, concurrency=concurrency,
+                        requests=options['requests'] // concurrency,
+                        query_latency=latency)
+                results.append(('ASGI x{}'.format(concurrency), result))
+            for label, result in results:
+                self.stdout.write(
+                    '{:<10} {rps:>8} req/s  p50 {p50_ms:>7} ms  '
+                    'p95 {p95_ms:>7} ms  {errors} errors'.format(
+                        label, **result))
+        finally:
+            settings_dict.update(saved)
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        wsgi, asgi = results[0][1], results[1][1]
+        self.stdout.write(self.style.SUCCESS(
+            'ASGI: {:+.1f}% throughput.'.format(
+                (asgi['rps'] / wsgi['rps'] - 1) * 100)))
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment
+
+from menu.benchmarks import load_baseline, regressions, run_benchmarks, \
+    save_results
+
+import os
+
+
+class Command(BaseCommand):
+    """benchmark_views command - seeds synthetic catalogs in a throwaway
+    test database and records query count, p50/p95 latency and peak memory
+    of every menu/urls.py route. Fails when a route regresses past the
+    JSON baseline.
+    """
+    help = 'Benchmarks every menu view against a JSON baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000',
+                            help='Comma separated catalog sizes (items).')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Requests per view.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed of the synthetic catalogs.')
+        parser.add_argument('--baseline',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'benchmark_baseline.json'),
+                            help='Baseline JSON file.')
+        parser.add_argument('--output',
+                            help='Also write this run to a JSON file.')
+        parser.add_argument('--threshold', type=float, default=1.5,
+                            help='Allowed p95 latency / peak memory ratio '
+                                 'against the baseline.')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store this run as the new baseline.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        baseline = load_baseline(options['baseline'])
+        if baseline is None and not options['update_baseline']:
+            raise CommandError(
+                'No baseline at {}, run with --update-baseline to record '
+                'one.'.format(options['baseline']))
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(sizes, repeat=options['repeat'],
+                                     seed=options['seed'],
+                                     log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            save_results(options['output'], results)
+        if options['update_baseline']:
+            save_results(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(
+                'Baseline written to {}.'.format(options['baseline'])))
+            return
+        found = regressions(results, baseline, options['threshold'])
+        if found:
+            raise CommandError('Regressions:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.assets import AssetError, build
+
+
+class Command(BaseCommand):
+    """build_static command - writes the CSS bundle (vendored stylesheets
+    checked against their integrity hash, local ones with rebased urls) and
+    the WebP image variants into settings.STATIC_BUILD_DIR. Run it before
+    collectstatic, which fingerprints and compresses them.
+    """
+    help = 'Builds the CSS bundle and WebP images for collectstatic.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-images', action='store_true',
+                            help='Skip the WebP image variants.')
+
+    def handle(self, *args, **options):
+        try:
+            result = build(images=not options['no_images'])
+        except (AssetError, OSError) as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            'Bundle {bundle} ({bytes} bytes), {images} WebP images.'.format(
+                **result)))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from menu.changes import dispatch, settled
+from menu.models import Webhook
+
+import time
+
+
+class Command(BaseCommand):
+    """dispatch_webhooks command - delivers the change log to the active
+    webhooks (menu.models.Webhook). A burst of changes (a season rollover
+    touching hundreds of items) is coalesced, one change per object, and
+    posted in batches of --batch-size objects once it settled: no new
+    change for --settle seconds, or the first waiting one older than
+    --max-delay seconds. Runs until stopped, one pass with --once. A failed
+    delivery is sent again on the next pass.
+    """
+    help = 'Delivers catalog changes to the webhooks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run one pass and exit.')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between two passes.')
+        parser.add_argument('--settle', type=float, default=2.0,
+                            help='Seconds without new changes before a '
+                                 'burst is delivered.')
+        parser.add_argument('--max-delay', type=float, default=30.0,
+                            help='Longest wait (seconds) of a change during '
+                                 'a burst.')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Largest number of changes per delivery.')
+        parser.add_argument('--timeout', type=float, default=10.0,
+                            help='Seconds per delivery.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        while True:
+            self.dispatch_all(options)
+            close_old_connections()
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def dispatch_all(self, options):
+        """One pass over the active webhooks"""
+        # noinspection PyUnresolvedReferences
+        for webhook in Webhook.objects.filter(is_active=True).order_by('pk'):
+            if not settled(webhook, options['settle'],
+                           options['max_delay']):
+                continue
+            try:
+                deliveries = dispatch(webhook,
+                                      batch_size=options['batch_size'],
+                                      timeout=options['timeout'])
+            except OSError as error:
+                self.stderr.write('{}: delivery failed, {}'.format(
+                    webhook.url, error))
+                continue
+            self.stdout.write('{}: {} deliveries, up to change {}.'.format(
+                webhook.url, deliveries, webhook.last_sequence))
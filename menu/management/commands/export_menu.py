@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.catalog import FORMATS, RowWriter, export_rows, guess_format
+from menu.tenants import restaurant_id, use_restaurant
+
+import time
+
+
+class Command(BaseCommand):
+    """export_menu command - streams the menu catalog to a CSV or JSON Lines
+    file in the format read by import_menu.
+    """
+    help = 'Exports the menu catalog to a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help="Output file, '-' (default) for stdout.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Output format, guessed from the file name '
+                                 'by default.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows read per batch.')
+        parser.add_argument('--restaurant',
+                            help='Slug of the exported restaurant, the '
+                                 'default restaurant if not set.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        try:
+            restaurant = restaurant_id(options['restaurant'])
+        except LookupError as error:
+            raise CommandError(error)
+        start = time.perf_counter()
+        stream = self.stdout if path == '-' else open(path, 'w', newline='',
+                                                      encoding='utf-8')
+        rows = 0
+        try:
+            writer = RowWriter(stream, fmt)
+            with use_restaurant(restaurant):
+                for row in export_rows(chunk_size=options['batch_size']):
+                    writer.write(row)
+                    rows += 1
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        elapsed = time.perf_counter() - start
+
+        report = self.stderr if path == '-' else self.stdout
+        report.write('Exported {} rows in {:.2f}s ({:.0f} rows/s).'.format(
+            rows, elapsed, rows / elapsed if elapsed else 0))
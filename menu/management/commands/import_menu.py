@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.catalog import FORMATS, CatalogImporter, RowError, guess_format, \
+    read_rows
+from menu.tenants import restaurant_id, use_restaurant
+
+import sys
+import time
+
+
+class Command(BaseCommand):
+    """import_menu command - bulk imports menus, items and ingredients from
+    a CSV or JSON Lines file (see menu.catalog.FIELDS).
+    """
+    help = 'Imports menu catalog rows from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format, guessed from the file name '
+                                 'by default.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per batch.')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Skip rows breaking the form rules instead '
+                                 'of rolling back the whole import.')
+        parser.add_argument('--restaurant',
+                            help='Slug of the restaurant importing the rows, '
+                                 'the default restaurant if not set.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        try:
+            restaurant = restaurant_id(options['restaurant'])
+        except LookupError as error:
+            raise CommandError(error)
+        importer = CatalogImporter(batch_size=options['batch_size'],
+                                   skip_invalid=options['skip_invalid'])
+        start = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='',
+                                                    encoding='utf-8')
+        try:
+            with use_restaurant(restaurant):
+                rows = importer.run(read_rows(stream, fmt))
+        except RowError as error:
+            raise CommandError('{} Nothing was imported.'.format(error))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.perf_counter() - start
+
+        for error in importer.errors:
+            self.stderr.write('Skipped {}'.format(error))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported {} rows in {:.2f}s ({:.0f} rows/s).'.format(
+                rows, elapsed, rows / elapsed if elapsed else 0)))
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.loadtest import SERVERS, SITE_MIX, run_site_load, serve, \
+    site_targets
+from menu.tenants import restaurant_id, use_restaurant
+
+import contextlib
+
+
+class Command(BaseCommand):
+    """load_site command - replays a weighted mix of the menu/urls.py
+    routes (menu.loadtest.SITE_MIX: mostly reads, some menu and item
+    edits) over HTTP against --url, or against a runserver, gunicorn or
+    waitress server it starts on a free port with the current settings,
+    and reports the throughput and the latency percentiles of every
+    route. Edits post the current values back, so the catalog (see
+    seed_catalog) does not drift between runs. With the development
+    settings debug_toolbar is rendered into every page, run it with
+    --settings mysite.deploy_settings to measure the deployed stack.
+    """
+    help = 'Load tests the site over HTTP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Root url of a running site.')
+        parser.add_argument('--server', choices=SERVERS,
+                            default='runserver',
+                            help='Server started when no --url is given.')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Server processes (gunicorn).')
+        parser.add_argument('--server-threads', type=int, default=8,
+                            help='Threads per server process (gunicorn, '
+                                 'waitress).')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per client.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed of the request plans.')
+        parser.add_argument('--mix',
+                            help='Comma separated view=weight pairs '
+                                 'overriding the default weights, 0 drops '
+                                 'a route.')
+        parser.add_argument('--restaurant',
+                            help='Slug of the loaded restaurant, requested '
+                                 'under /r/<slug>/.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['requests'] < 1:
+            raise CommandError('--threads and --requests must be positive.')
+        mix = dict(SITE_MIX)
+        for pair in (options['mix'] or '').split(','):
+            if not pair.strip():
+                continue
+            name, _, weight = pair.partition('=')
+            if name.strip() not in SITE_MIX or not weight.strip().isdigit():
+                raise CommandError('Invalid --mix entry: {}'.format(pair))
+            mix[name.strip()] = int(weight)
+        try:
+            restaurant = restaurant_id(options['restaurant'])
+        except LookupError as error:
+            raise CommandError(error)
+        with use_restaurant(restaurant):
+            targets = site_targets()
+        prefix = '/r/{}'.format(options['restaurant']) \
+            if options['restaurant'] else ''
+
+        if options['url']:
+            server = contextlib.nullcontext(options['url'].rstrip('/'))
+        else:
+            server = serve(options['server'], workers=options['workers'],
+                           threads=options['server_threads'])
+        try:
+            with server as url:
+                result = run_site_load(
+                    url + prefix, mix=mix, threads=options['threads'],
+                    requests=options['requests'], seed=options['seed'],
+                    targets=targets)
+        except (RuntimeError, ValueError) as error:
+            raise CommandError(error)
+
+        for name, route in result['routes'].items():
+            self.stdout.write(
+                '{:<18} {requests:>7}  p50 {p50_ms:>8} ms  '
+                'p95 {p95_ms:>8} ms  p99 {p99_ms:>8} ms'.format(
+                    name, **route))
+        for error in result['error_samples']:
+            self.stderr.write(error)
+        style = self.style.SUCCESS if not result['errors'] \
+            else self.style.ERROR
+        self.stdout.write(style(
+            '{requests} requests in {seconds}s: {rps} req/s  '
+            'p50 {p50_ms} ms  p95 {p95_ms} ms  p99 {p99_ms} ms  '
+            '{errors} errors'.format(**result)))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment
+
+from menu.benchmarks import bench_urls
+from menu.loadtest import run_load
+from menu.synthetic import seed_catalog
+
+import os
+import tempfile
+
+# Read-only views requested by the load test
+LOAD_VIEWS = ('menu_list', 'menu_detail', 'item_list', 'item_detail',
+              'api_menus')
+
+
+class Command(BaseCommand):
+    """loadtest command - seeds a synthetic catalog in a throwaway test
+    database and drives the read-only views from several threads, once
+    opening a connection per request (CONN_MAX_AGE=0) and once with
+    persistent, health checked connections. SQLite test databases are
+    kept in a file, so connections really are opened and closed;
+    --connect-latency stands in for the handshake of a network database.
+    """
+    help = 'Compares per-request and persistent database connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per thread.')
+        parser.add_argument('--items', type=int, default=1000,
+                            help='Size of the synthetic catalog.')
+        parser.add_argument('--conn-max-age', type=int, default=600,
+                            help='CONN_MAX_AGE of the persistent run.')
+        parser.add_argument('--connect-latency', type=float, default=0.0,
+                            help='Milliseconds added to every new '
+                                 'connection.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['requests'] < 1:
+            raise CommandError('--threads and --requests must be positive.')
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            path = os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3')
+            settings_dict.setdefault('TEST', {})['NAME'] = path
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        saved = {key: settings_dict.get(key)
+                 for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        try:
+            seed_catalog(items=options['items'])
+            paths = [url for name, url, query in bench_urls()
+                     if name in LOAD_VIEWS]
+            results = []
+            for label, max_age in (('per request', 0),
+                                   ('persistent', options['conn_max_age'])):
+                settings_dict['CONN_MAX_AGE'] = max_age
+                settings_dict['CONN_HEALTH_CHECKS'] = bool(max_age)
+                result = run_load(
+                    paths, threads=options['threads'],
+                    requests=options['requests'],
+                    connect_latency=options['connect_latency'] / 1000.0)
+                results.append((label, result))
+                self.stdout.write(
+                    '{:<12} {rps:>8} req/s  p50 {p50_ms:>7} ms  '
+                    'p95 {p95_ms:>7} ms  {connections:>6} connections  '
+                    '{errors} errors'.format(label, **result))
+        finally:
+            settings_dict.update(saved)
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        base, persistent = results[0][1], results[1][1]
+        self.stdout.write(self.style.SUCCESS(
+            'Persistent connections: {:+.1f}% throughput.'.format(
+                (persistent['rps'] / base['rps'] - 1) * 100)))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from menu.models import Menu, Item
+from menu.trash import PURGE_BATCH, purge
+
+import datetime
+
+
+class Command(BaseCommand):
+    """purge_deleted command - meant to run daily from cron. Hard deletes
+    the menus and items soft deleted (menu.trash) more than --days days
+    ago, in every restaurant, with their through rows, --batch-size rows
+    per transaction. Until then they can be restored.
+    """
+    help = 'Purges soft deleted menus and items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep rows deleted less than this many '
+                                 'days ago.')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH,
+                            help='Number of rows deleted per transaction.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days must not be negative and '
+                               '--batch-size must be positive.')
+        before = timezone.now() - datetime.timedelta(options['days'])
+        menus = purge(Menu, before, batch_size=options['batch_size'])
+        items = purge(Item, before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Purged {} menus and {} items.'.format(menus, items)))
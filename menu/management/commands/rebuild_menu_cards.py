@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from menu.cards import build_cards
+from menu.models import Menu
+
+
+class Command(BaseCommand):
+    """rebuild_menu_cards command - rebuilds the whole MenuCard read model
+    in batches of menus.
+    """
+    help = 'Rebuilds the denormalized menu cards of every menu.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of menus rebuilt per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # noinspection PyUnresolvedReferences
+        pks = list(Menu.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            build_cards(pks[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt {} menu cards.'.format(len(pks))))
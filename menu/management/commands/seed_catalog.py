@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.synthetic import seed_catalog
+from menu.tenants import restaurant_id, use_restaurant
+
+import time
+
+
+class Command(BaseCommand):
+    """seed_catalog command - writes a synthetic catalog, reproducible from
+    --seed: chef users, a Zipf distributed ingredient vocabulary, items and
+    menus with expiration dates spread over --years, with bulk_create in
+    batches of --batch-size rows. Run it again with another seed to grow
+    the catalog.
+    """
+    help = 'Generates a synthetic menu catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000,
+                            help='Number of items.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed.')
+        parser.add_argument('--menus', type=int,
+                            help='Number of menus, items / 20 by default.')
+        parser.add_argument('--ingredients', type=int,
+                            help='Size of the ingredient vocabulary, '
+                                 'items / 4 by default.')
+        parser.add_argument('--chefs', type=int,
+                            help='Number of chef users, items / 200 by '
+                                 'default.')
+        parser.add_argument('--years', type=int, default=3,
+                            help='Menu expiration dates are spread over '
+                                 'this many years.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows per INSERT.')
+        parser.add_argument('--restaurant',
+                            help='Slug of the seeded restaurant, the '
+                                 'default restaurant if not set.')
+
+    def handle(self, *args, **options):
+        for key in ('items', 'menus', 'ingredients', 'chefs', 'years',
+                    'batch_size'):
+            if options[key] is not None and options[key] < 1:
+                raise CommandError('--{} must be positive.'.format(
+                    key.replace('_', '-')))
+        try:
+            restaurant = restaurant_id(options['restaurant'])
+        except LookupError as error:
+            raise CommandError(error)
+        start = time.perf_counter()
+        with use_restaurant(restaurant):
+            counts = seed_catalog(
+                items=options['items'], seed=options['seed'],
+                menus=options['menus'], ingredients=options['ingredients'],
+                chefs=options['chefs'], years=options['years'],
+                batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Created {chefs} chefs, {ingredients} ingredients, {items} items '
+            'and {menus} menus in {seconds:.2f}s.'.format(
+                seconds=time.perf_counter() - start, **counts)))
@@ -0,0 +1,237 @@
+from django.conf import settings
+from django.urls import get_script_prefix, set_script_prefix
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .offload import offload
+from .perf import RequestTimings, current
+from .routers import pinned
+from .tenants import current_restaurant, resolve_restaurant
+
+import json
+import logging
+import random
+import time
+
+logger = logging.getLogger('menu.perf')
+
+
+class PerformanceMiddleware:
+    """PerformanceMiddleware class - per-request timings for production,
+    where debug_toolbar is not installed.
+    - Wall time of every request is measured.
+    - Sampled requests (settings.MENU_PERF_SAMPLE_RATE) also record DB
+      query count and SQL time (menu.perf.record_query, installed on every
+      connection), template render time and response size. They are logged
+      as one JSON line on the 'menu.perf' logger and sent in a
+      Server-Timing header (settings.MENU_PERF_SERVER_TIMING).
+    - Requests slower than settings.MENU_PERF_SLOW_MS are logged as
+      warnings, sampled ones with their full SQL list.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'MENU_PERF_SAMPLE_RATE', 1.0)
+        self.slow = getattr(settings, 'MENU_PERF_SLOW_MS', 500) / 1000.0
+        self.server_timing = getattr(settings, 'MENU_PERF_SERVER_TIMING',
+                                     True)
+        if iscoroutinefunction(get_response):
+            # Lets Django call the async path without a thread switch
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        timings = self.start()
+        token = current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, start, timings)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        timings = self.start()
+        token = current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, start, timings)
+
+    def start(self):
+        """Returns the RequestTimings of a sampled request, None otherwise.
+        Queries are recorded by menu.perf.record_query, in whichever thread
+        the request runs them.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return RequestTimings()
+
+    def finish(self, request, response, start, timings):
+        """Adds the Server-Timing header and logs the request"""
+        duration = time.perf_counter() - start
+        if timings is None:
+            if duration >= self.slow:
+                self.log(request, response, duration, None)
+            return response
+        if self.server_timing:
+            response['Server-Timing'] = (
+                'db;dur={:.1f};desc="{} queries", tpl;dur={:.1f}, '
+                'total;dur={:.1f}'.format(
+                    timings.db_time * 1000, len(timings.queries),
+                    timings.template_time * 1000, duration * 1000))
+        self.log(request, response, duration, timings)
+        return response
+
+    def log(self, request, response, duration, timings):
+        """Writes the JSON log line of a request
+        :input: - timings - RequestTimings, None for unsampled requests
+        """
+        slow = duration >= self.slow
+        level = logging.WARNING if slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        match = request.resolver_match
+        record = {'method': request.method,
+                  'path': request.path,
+                  'view': match.view_name if match else None,
+                  'status': response.status_code,
+                  'total_ms': round(duration * 1000, 2),
+                  'slow': slow}
+        if timings is not None:
+            record.update({
+                'db_queries': len(timings.queries),
+                'db_ms': round(timings.db_time * 1000, 2),
+                'template_ms': round(timings.template_time * 1000, 2),
+                'bytes': (None if response.streaming
+                          else len(response.content))})
+            if slow:
+                record['sql'] = [{'sql': sql, 'ms': round(seconds * 1000, 2)}
+                                 for sql, seconds in timings.queries]
+        logger.log(level, json.dumps(record))
+
+
+class ReplicaPinMiddleware:
+    """ReplicaPinMiddleware class - read-your-writes for the read replicas
+    of menu.routers.ReplicaRouter.
+    - The redirect answering a successful write (POST, ...) sets a cookie
+      living settings.MENU_DB_PIN_SECONDS, the page it redirects to and
+      the next requests of that client read from the primary until it
+      expires. Forms re-rendered with errors (200) do not pin.
+    - Nothing happens while settings.MENU_DB_REPLICAS is empty.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'menu_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'MENU_DB_PIN_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = pinned.set(self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            pinned.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = pinned.set(self.cookie_name in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            pinned.reset(token)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if settings.MENU_DB_REPLICAS and \
+                request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') \
+                and 300 <= response.status_code < 400:
+            response.set_cookie(self.cookie_name, '1',
+                                max_age=self.pin_seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+class TenantMiddleware:
+    """TenantMiddleware class - selects the restaurant of the request
+    (menu.tenants.resolve_restaurant) for the restaurant scoped managers
+    and the cache keys, by /r/<slug>/ path prefix or by host. Resolutions
+    are cached, so a request normally makes no query for it. A path prefix
+    is added to the script prefix, reverse() keeps it in the links.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token, prefix = self.start(*resolve_restaurant(request))
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(token, prefix)
+
+    async def __acall__(self, request):
+        token, prefix = self.start(
+            *await offload(resolve_restaurant, request))
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(token, prefix)
+
+    def start(self, restaurant, path_prefix):
+        prefix = get_script_prefix()
+        if path_prefix:
+            set_script_prefix(prefix + path_prefix)
+        return current_restaurant.set(restaurant), prefix
+
+    def finish(self, token, prefix):
+        current_restaurant.reset(token)
+        set_script_prefix(prefix)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """AsyncWhiteNoiseMiddleware class
+    Inherit: - whitenoise.middleware.WhiteNoiseMiddleware
+    - Also runs in an async middleware chain (mysite.asgi): static files
+      are looked up in memory and answered directly, other requests are
+      awaited without a thread switch.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
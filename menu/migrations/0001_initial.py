@@ -1,10 +1,4 @@
-<<<<<<< HEAD
-# -*- coding: utf-8 -*-
-# Generated by Django 1.11.18 on 2019-03-06 18:42
-from __future__ import unicode_literals
-=======
 # Generated by Django 2.1.7 on 2019-03-22 03:58
->>>>>>> 9b76021d33d7825fe2f65d9ea5e4c94223e77fbb
 
 from django.conf import settings
 from django.db import migrations, models
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['expiration_date', 'created_date'], name='menu_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(expiration_date__isnull=True), fields=['season'], name='menu_no_exp_season_idx'),
+        ),
+    ]
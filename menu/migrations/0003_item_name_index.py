@@ -0,0 +1,17 @@
+# Generated by Django 2.2.10 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_menu_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['name', 'id'], name='item_name_id_idx'),
+        ),
+    ]
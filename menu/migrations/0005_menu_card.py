@@ -0,0 +1,66 @@
+# Generated by Django 2.2.10 on 2026-10-18 07:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+import json
+
+
+def build_cards(apps, schema_editor):
+    """Builds the cards of the existing menus (menu.cards with the
+    historical models)
+    """
+    Menu = apps.get_model('menu', 'Menu')
+    MenuCard = apps.get_model('menu', 'MenuCard')
+    pks = list(Menu.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), 500):
+        menus = Menu.objects.filter(
+            pk__in=pks[start:start + 500]
+        ).prefetch_related('items__chef', 'items__ingredients')
+        cards = []
+        for menu in menus:
+            items = sorted(menu.items.all(),
+                           key=lambda item: (item.name, item.pk))
+            payload = [{'pk': item.pk,
+                        'name': item.name,
+                        'chef': item.chef.username,
+                        'ingredients': [ingredient.name for ingredient
+                                        in item.ingredients.all()]}
+                       for item in items]
+            cards.append(MenuCard(menu_id=menu.pk,
+                                  season=menu.season,
+                                  created_date=menu.created_date,
+                                  expiration_date=menu.expiration_date,
+                                  payload=json.dumps(payload,
+                                                     separators=(',', ':'))))
+        MenuCard.objects.bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuCard',
+            fields=[
+                ('menu', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='menu.Menu')),
+                ('season', models.CharField(max_length=20)),
+                ('created_date', models.DateTimeField()),
+                ('expiration_date', models.DateField(blank=True, null=True)),
+                ('payload', models.TextField(default='[]')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(fields=['expiration_date', 'created_date'], name='card_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(condition=models.Q(expiration_date__isnull=True), fields=['season'], name='card_no_exp_season_idx'),
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
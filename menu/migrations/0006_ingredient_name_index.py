@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0005_menu_card'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(db_index=True, max_length=180),
+        ),
+    ]
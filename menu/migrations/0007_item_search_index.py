@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Full-text index of items, FTS5 on SQLite and tsvector + GIN on
+    PostgreSQL (other databases use the in-process trigram index)
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE menu_item_fts USING fts5("
+            "name, description, ingredients, "
+            "tokenize='unicode61', prefix='2 3 4')")
+        schema_editor.execute(
+            "INSERT INTO menu_item_fts (rowid, name, description, ingredients) "
+            "SELECT item.id, item.name, item.description, "
+            "COALESCE((SELECT group_concat(ingredient.name, ' ') "
+            "FROM menu_item_ingredients link "
+            "JOIN menu_ingredient ingredient "
+            "ON ingredient.id = link.ingredient_id "
+            "WHERE link.item_id = item.id), '') "
+            "FROM menu_item item")
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE menu_item_search ("
+            "item_id integer PRIMARY KEY "
+            "REFERENCES menu_item (id) ON DELETE CASCADE "
+            "DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)")
+        schema_editor.execute(
+            "CREATE INDEX menu_item_search_gin "
+            "ON menu_item_search USING GIN (document)")
+        schema_editor.execute(
+            "INSERT INTO menu_item_search (item_id, document) "
+            "SELECT item.id, "
+            "setweight(to_tsvector('simple', item.name), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE((SELECT "
+            "string_agg(ingredient.name, ' ') "
+            "FROM menu_item_ingredients link "
+            "JOIN menu_ingredient ingredient "
+            "ON ingredient.id = link.ingredient_id "
+            "WHERE link.item_id = item.id), '')), 'B') || "
+            "setweight(to_tsvector('simple', item.description), 'C') "
+            "FROM menu_item item")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE menu_item_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE menu_item_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0006_ingredient_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.10 on 2026-10-18 07:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def build_index(apps, schema_editor):
+    """Indexes the existing menus (menu.allergens with the historical
+    models)
+    """
+    Menu = apps.get_model('menu', 'Menu')
+    MenuIngredient = apps.get_model('menu', 'MenuIngredient')
+    counts = Menu.items.through.objects.filter(
+        item__ingredients__isnull=False
+    ).values('menu_id', 'item__ingredients').annotate(
+        items=Count('item_id', distinct=True)).order_by()
+    MenuIngredient.objects.bulk_create(
+        [MenuIngredient(menu_id=row['menu_id'],
+                        ingredient_id=row['item__ingredients'],
+                        items=row['items'])
+         for row in counts.iterator()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_index', to='menu.Ingredient')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_index', to='menu.Menu')),
+            ],
+            options={
+                'unique_together': {('ingredient', 'menu')},
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+import datetime
+
+
+def archive_expired(apps, schema_editor):
+    """Archives the menus (and cards) which expired before the migration"""
+    today = datetime.date.today()
+    for name in ('Menu', 'MenuCard'):
+        model = apps.get_model('menu', name)
+        model.objects.filter(expiration_date__lte=today).update(
+            is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0008_menu_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMenu',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('season', models.CharField(max_length=20)),
+                ('created_date', models.DateTimeField()),
+                ('expiration_date', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedMenuItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_exp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_no_exp_season_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menucard',
+            name='card_exp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menucard',
+            name='card_no_exp_season_idx',
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='menucard',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expiration_date', 'created_date'], name='menu_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('expiration_date__isnull', True), ('is_active', True)), fields=['season'], name='menu_no_exp_season_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expiration_date', 'created_date'], name='card_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(condition=models.Q(('expiration_date__isnull', True), ('is_active', True)), fields=['season'], name='card_no_exp_season_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedmenuitem',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_menus', to='menu.item'),
+        ),
+        migrations.AddField(
+            model_name='archivedmenuitem',
+            name='menu',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='menu.archivedmenu'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedmenuitem',
+            unique_together={('menu', 'item')},
+        ),
+        migrations.RunPython(archive_expired, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import menu.tenants
+
+import re
+
+# Models scoped by restaurant
+SCOPED = ('ingredient', 'item', 'menu', 'menucard')
+# Words as split by the FTS5 unicode61 tokenizer (no underscore)
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def restaurant_words(restaurant_id, text):
+    """menu.search.restaurant_words() as of this migration"""
+    return ' '.join('r{}x{}'.format(restaurant_id, word)
+                    for word in TOKEN_RE.findall(text.lower()))
+
+
+def restaurant_field(**kwargs):
+    return models.ForeignKey(
+        db_index=False, on_delete=django.db.models.deletion.CASCADE,
+        related_name='+', to='menu.restaurant', **kwargs)
+
+
+def assign_default_restaurant(apps, schema_editor):
+    """Existing rows belong to the default restaurant"""
+    Restaurant = apps.get_model('menu', 'Restaurant')
+    slug = getattr(settings, 'MENU_DEFAULT_RESTAURANT', 'main')
+    restaurant = Restaurant.objects.get_or_create(
+        slug=slug, defaults={'name': slug.title()})[0]
+    for name in SCOPED:
+        apps.get_model('menu', name).objects.update(restaurant=restaurant)
+
+
+def reindex_items(apps, schema_editor):
+    """Search index documents hold restaurant prefixed words
+    (menu.search.restaurant_words)
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor not in ('sqlite', 'postgresql'):
+        return
+    Item = apps.get_model('menu', 'Item')
+    ingredients = {}
+    for item_pk, name in Item.ingredients.through.objects.order_by(
+            'ingredient__name').values_list('item_id', 'ingredient__name'):
+        ingredients.setdefault(item_pk, []).append(name)
+    rows = [(pk, restaurant_words(restaurant, name),
+             restaurant_words(restaurant, description),
+             restaurant_words(restaurant, ' '.join(ingredients.get(pk, []))))
+            for pk, restaurant, name, description in Item.objects.values_list(
+                'pk', 'restaurant_id', 'name', 'description').iterator()]
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('DELETE FROM menu_item_fts')
+            cursor.executemany(
+                'INSERT INTO menu_item_fts '
+                '(rowid, name, description, ingredients) '
+                'VALUES (%s, %s, %s, %s)', rows)
+        else:
+            cursor.execute('DELETE FROM menu_item_search')
+            cursor.executemany(
+                "INSERT INTO menu_item_search (item_id, document) VALUES "
+                "(%s, setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C'))",
+                [(pk, name, ingredients, description)
+                 for pk, name, description, ingredients in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0009_menu_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Restaurant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+                ('host', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+            ],
+        ),
+    ] + [
+        migrations.AddField(
+            model_name=name,
+            name='restaurant',
+            field=restaurant_field(null=True),
+        )
+        for name in SCOPED
+    ] + [
+        migrations.RunPython(assign_default_restaurant,
+                             migrations.RunPython.noop),
+    ] + [
+        migrations.AlterField(
+            model_name=name,
+            name='restaurant',
+            field=restaurant_field(
+                default=menu.tenants.current_restaurant_id),
+        )
+        for name in SCOPED
+    ] + [
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_name_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_exp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_no_exp_season_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menucard',
+            name='card_exp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menucard',
+            name='card_no_exp_season_idx',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=180),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['restaurant', 'name'], name='ingredient_rest_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['restaurant', 'name', 'id'], name='item_rest_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['restaurant', 'updated_at'], name='item_rest_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['restaurant', 'expiration_date', 'created_date'], name='menu_rest_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('expiration_date__isnull', True), ('is_active', True)), fields=['restaurant', 'season'], name='menu_rest_no_exp_season_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['restaurant', 'expiration_date', 'created_date'], name='card_rest_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menucard',
+            index=models.Index(condition=models.Q(('expiration_date__isnull', True), ('is_active', True)), fields=['restaurant', 'season'], name='card_rest_no_exp_season_idx'),
+        ),
+        migrations.RunPython(reindex_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0010_restaurants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['restaurant', 'id'], name='ingredient_rest_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['restaurant', 'id'], name='item_rest_id_idx'),
+        ),
+    ]
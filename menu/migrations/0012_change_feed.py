@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import menu.tenants
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0011_tenant_pk_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Webhook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500)),
+                ('secret', models.CharField(blank=True, max_length=100)),
+                ('last_sequence', models.BigIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('restaurant', models.ForeignKey(db_index=False, default=menu.tenants.current_restaurant_id, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='menu.restaurant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('create', 'create'), ('update', 'update'), ('delete', 'delete')], max_length=6)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('restaurant', models.ForeignKey(db_index=False, default=menu.tenants.current_restaurant_id, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='menu.restaurant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['restaurant', 'id'], name='change_rest_seq_idx'),
+        ),
+    ]
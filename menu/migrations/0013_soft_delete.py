@@ -0,0 +1,79 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('menu', '0012_change_feed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_rest_name_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_rest_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_rest_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_rest_exp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_rest_no_exp_season_idx',
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='chef',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant', 'name', 'id'], name='item_rest_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant', 'updated_at'], name='item_rest_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant', 'id'], name='item_rest_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='item_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('is_active', True)), fields=['restaurant', 'expiration_date', 'created_date'], name='menu_rest_exp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('expiration_date__isnull', True), ('is_active', True)), fields=['restaurant', 'season'], name='menu_rest_no_exp_season_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='menu_deleted_idx'),
+        ),
+    ]
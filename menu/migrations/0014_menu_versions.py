@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import menu.tenants
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0013_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('season', models.CharField(max_length=20)),
+                ('expiration_date', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('items', models.TextField(blank=True)),
+                ('added', models.TextField(blank=True)),
+                ('removed', models.TextField(blank=True)),
+                ('base', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='menu.menuversion')),
+                ('menu', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='versions', to='menu.menu')),
+                ('restaurant', models.ForeignKey(db_index=False, default=menu.tenants.current_restaurant_id, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='menu.restaurant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='menuversion',
+            index=models.Index(fields=['restaurant', 'menu', 'recorded_at'], name='version_rest_menu_at_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# Menus per batch of backfilled versions
+BATCH = 500
+
+
+def encode_pks(pks):
+    """menu.models.encode_pks() as of this migration"""
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    gaps = []
+    previous = 0
+    for pk in sorted(pks):
+        gap = pk - previous
+        encoded = ''
+        while True:
+            gap, digit = divmod(gap, 36)
+            encoded = digits[digit] + encoded
+            if not gap:
+                break
+        gaps.append(encoded)
+        previous = pk
+    return ','.join(gaps)
+
+
+def backfill_versions(apps, schema_editor):
+    """Every menu without a version gets a snapshot of its current state,
+    dated from its creation, so point-in-time reads work before its first
+    change
+    """
+    Menu = apps.get_model('menu', 'Menu')
+    MenuVersion = apps.get_model('menu', 'MenuVersion')
+    MenuItems = Menu.items.through
+    pks = list(Menu.objects.exclude(
+        pk__in=MenuVersion.objects.values('menu_id')).order_by(
+        'pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), BATCH):
+        batch = pks[start:start + BATCH]
+        items = {}
+        for menu_pk, item_pk in MenuItems.objects.filter(
+                menu_id__in=batch,
+                item__deleted_at__isnull=True).values_list(
+                'menu_id', 'item_id'):
+            items.setdefault(menu_pk, []).append(item_pk)
+        MenuVersion.objects.bulk_create([
+            MenuVersion(menu_id=menu.pk, restaurant_id=menu.restaurant_id,
+                        recorded_at=menu.created_date, season=menu.season,
+                        expiration_date=menu.expiration_date,
+                        is_active=menu.is_active,
+                        is_deleted=menu.deleted_at is not None,
+                        items=encode_pks(items.get(menu.pk, [])))
+            for menu in Menu.objects.filter(pk__in=batch)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0014_menu_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+import menu.tenants
+
+# Archive models scoped by restaurant
+ARCHIVED = ('archivedmenu', 'archivedmenuitem')
+
+
+def restaurant_field(**kwargs):
+    return models.ForeignKey(
+        db_index=False, on_delete=django.db.models.deletion.CASCADE,
+        related_name='+', to='menu.restaurant', **kwargs)
+
+
+def copy_restaurant(apps, schema_editor):
+    """Archived menus belong to the restaurant of their items (their Menu
+    rows are gone), menus without items to the default restaurant, and
+    archived through rows to the restaurant of their menu
+    """
+    Restaurant = apps.get_model('menu', 'Restaurant')
+    ArchivedMenu = apps.get_model('menu', 'ArchivedMenu')
+    ArchivedMenuItem = apps.get_model('menu', 'ArchivedMenuItem')
+    ArchivedMenu.objects.update(restaurant=Subquery(
+        ArchivedMenuItem.objects.filter(menu=OuterRef('pk')).values(
+            'item__restaurant')[:1]))
+    menus = ArchivedMenu.objects.filter(restaurant__isnull=True)
+    if menus.exists():
+        slug = getattr(settings, 'MENU_DEFAULT_RESTAURANT', 'main')
+        menus.update(restaurant=Restaurant.objects.get_or_create(
+            slug=slug, defaults={'name': slug.title()})[0])
+    ArchivedMenuItem.objects.update(restaurant=Subquery(
+        ArchivedMenu.objects.filter(pk=OuterRef('menu')).values(
+            'restaurant')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0015_backfill_menu_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=name,
+            name='restaurant',
+            field=restaurant_field(null=True),
+        )
+        for name in ARCHIVED
+    ] + [
+        migrations.RunPython(copy_restaurant, migrations.RunPython.noop),
+    ] + [
+        migrations.AlterField(
+            model_name=name,
+            name='restaurant',
+            field=restaurant_field(
+                default=menu.tenants.current_restaurant_id),
+        )
+        for name in ARCHIVED
+    ] + [
+        migrations.AddIndex(
+            model_name='archivedmenu',
+            index=models.Index(fields=['restaurant', 'id'], name='archived_rest_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmenuitem',
+            index=models.Index(fields=['restaurant', 'menu'], name='archived_item_rest_menu_idx'),
+        ),
+    ]
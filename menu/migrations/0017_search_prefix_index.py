@@ -0,0 +1,78 @@
+from django.db import migrations
+
+import re
+
+# Words as split by the FTS5 unicode61 tokenizer (no underscore)
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+# FTS5 prefix indexes: 'r000012x' (8 bytes) plus query words of 2 to 4
+# letters. The ones of migration 0007 ('2 3 4') never served a query, every
+# term starts with its restaurant.
+PREFIX = '10 11 12'
+
+
+def restaurant_words(restaurant_id, text, digits):
+    """menu.search.restaurant_words() as of this migration (digits 6) and
+    before it (digits 0)
+    """
+    return ' '.join('r{:0{}d}x{}'.format(restaurant_id, digits, word)
+                    for word in TOKEN_RE.findall(text.lower()))
+
+
+def rebuild_search_index(apps, schema_editor, digits, prefix):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ('sqlite', 'postgresql'):
+        return
+    Item = apps.get_model('menu', 'Item')
+    ingredients = {}
+    for item_pk, name in Item.ingredients.through.objects.order_by(
+            'ingredient__name').values_list('item_id', 'ingredient__name'):
+        ingredients.setdefault(item_pk, []).append(name)
+    rows = [(pk, restaurant_words(restaurant, name, digits),
+             restaurant_words(restaurant, description, digits),
+             restaurant_words(restaurant, ' '.join(ingredients.get(pk, [])),
+                              digits))
+            for pk, restaurant, name, description in Item.objects.filter(
+                deleted_at__isnull=True).values_list(
+                'pk', 'restaurant_id', 'name', 'description').iterator()]
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('DROP TABLE menu_item_fts')
+            cursor.execute(
+                "CREATE VIRTUAL TABLE menu_item_fts USING fts5("
+                "name, description, ingredients, "
+                "tokenize='unicode61', prefix='{}')".format(prefix))
+            cursor.executemany(
+                'INSERT INTO menu_item_fts '
+                '(rowid, name, description, ingredients) '
+                'VALUES (%s, %s, %s, %s)', rows)
+        else:
+            cursor.execute('DELETE FROM menu_item_search')
+            cursor.executemany(
+                "INSERT INTO menu_item_search (item_id, document) VALUES "
+                "(%s, setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C'))",
+                [(pk, name, ingredients, description)
+                 for pk, name, description, ingredients in rows])
+
+
+def pad_restaurants(apps, schema_editor):
+    """Indexed words get a fixed width restaurant prefix, the FTS5 prefix
+    indexes are sized for it
+    """
+    rebuild_search_index(apps, schema_editor, 6, PREFIX)
+
+
+def unpad_restaurants(apps, schema_editor):
+    rebuild_search_index(apps, schema_editor, 0, '2 3 4')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0016_archive_restaurant'),
+    ]
+
+    operations = [
+        migrations.RunPython(pad_restaurants, unpad_restaurants),
+    ]
@@ -1,42 +1,226 @@
 from django.db import models
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .tenants import TenantManager, current_restaurant_id
+
+import datetime
+import json
+
+
+class Restaurant(models.Model):
+    """Restaurant model class - tenant owning menus, items and ingredients
+    Inherit: - models.Model
+    fields: - name: - CharField
+            - slug: - SlugField, selects the restaurant by path (/r/<slug>/)
+            - host: - CharField, selects the restaurant by host name
+    """
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(unique=True)
+    host = models.CharField(max_length=255, unique=True,
+                            blank=True, null=True)
+
+    def __str__(self):
+        """Returns name field name"""
+        return self.name
+
+
+def restaurant_field():
+    """Returns the restaurant foreign key of a scoped model, filled with the
+    current restaurant. Not indexed on its own: every index of the scoped
+    models leads with it.
+    """
+    return models.ForeignKey(Restaurant, on_delete=models.CASCADE,
+                             default=current_restaurant_id, db_index=False,
+                             related_name='+')
+
+
+class LiveManager(TenantManager):
+    """LiveManager class
+    Inherit: - TenantManager
+    - Default manager of the soft deleted models (menu.trash): rows of the
+      current restaurant which are not deleted, answered from the partial
+      indexes. 'all_objects' managers see the deleted rows as well.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class MenuQuerySet(models.QuerySet):
+    """MenuQuerySet class
+    Inherit: - models.QuerySet
+    - Filtering and ordering used by the menu list, pushed into the database
+      so only live menus are loaded.
+    """
+
+    def active(self):
+        """Menus not archived by the archive_menus command"""
+        return self.filter(is_active=True)
+
+    def current(self):
+        """Active menus with an expiration date which has not passed yet,
+        newest first (menu_exp_created_idx)
+        """
+        return self.active().filter(
+            expiration_date__gt=datetime.date.today()
+        ).order_by('-created_date')
+
+    def without_expiration(self):
+        """Active menus saved without expiration date, sorted by season
+        (menu_no_exp_season_idx)
+        """
+        return self.active().filter(
+            expiration_date__isnull=True).order_by('season')
+
+    def expired(self, date=None):
+        """Active menus whose expiration date has passed on date (today by
+        default), the ones archive_menus archives (menu_exp_created_idx)
+        """
+        return self.active().filter(
+            expiration_date__lte=date or datetime.date.today())
+
+    def with_items(self):
+        """Menus with their 'items' loaded in one extra query"""
+        return self.prefetch_related('items')
+
+    def live(self):
+        """Active menus which have not expired yet or have no expiration
+        date
+        """
+        return self.active().filter(
+            models.Q(expiration_date__gt=datetime.date.today()) |
+            models.Q(expiration_date__isnull=True))
+
+    def containing(self, ingredients):
+        """Menus with an item using any of the ingredients (names),
+        answered from the MenuIngredient index
+        """
+        # noinspection PyUnresolvedReferences
+        return self.filter(pk__in=MenuIngredient.objects.filter(
+            ingredient__in=Ingredient.objects.filter(name__in=ingredients)
+        ).values('menu_id'))
+
+    def free_of(self, ingredients):
+        """Menus with no item using any of the ingredients (names),
+        answered from the MenuIngredient index
+        """
+        # noinspection PyUnresolvedReferences
+        return self.exclude(pk__in=MenuIngredient.objects.filter(
+            ingredient__in=Ingredient.objects.filter(name__in=ingredients)
+        ).values('menu_id'))
 
 
 class Menu(models.Model):
     """Menu model class
     Inherit: - models.Model
-    fields: - season: - CharField
+    fields: - restaurant: - ForeignKey
+            - season: - CharField
             - items: ManyToManyField
             -created_date: DateTimeField
             -expiration_date: DateField
+            -updated_at: DateTimeField
+            -is_active: BooleanField, False once archived by the
+                        archive_menus command
+            -deleted_at: DateTimeField, set once soft deleted (menu.trash)
     """
+    restaurant = restaurant_field()
     season = models.CharField(max_length=20)
     items = models.ManyToManyField('Item', related_name='items')
     created_date = models.DateTimeField(default=timezone.now)
     expiration_date = models.DateField(help_text='MM/DD/YYYY',
                                        blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    is_active = models.BooleanField(default=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = LiveManager.from_queryset(MenuQuerySet)()
+    all_objects = TenantManager.from_queryset(MenuQuerySet)()
+
+    class Meta:
+        # Partial indexes: archived and deleted menus leave the listing
+        # indexes, only deleted ones are in the purge index
+        indexes = [
+            models.Index(fields=['restaurant', 'expiration_date',
+                                 'created_date'],
+                         name='menu_rest_exp_created_idx',
+                         condition=models.Q(is_active=True,
+                                            deleted_at__isnull=True)),
+            models.Index(fields=['restaurant', 'season'],
+                         name='menu_rest_no_exp_season_idx',
+                         condition=models.Q(expiration_date__isnull=True,
+                                            is_active=True,
+                                            deleted_at__isnull=True)),
+            models.Index(fields=['deleted_at'], name='menu_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         """Returns season field name"""
         return self.season
 
 
+class ItemQuerySet(models.QuerySet):
+    """ItemQuerySet class
+    Inherit: - models.QuerySet
+    """
+
+    def with_relations(self):
+        """Items joined with their chef and with 'ingredients' loaded
+        in one extra query
+        """
+        return self.select_related('chef').prefetch_related(
+            item_ingredients())
+
+
 class Item(models.Model):
     """Item model class
     Inherit: -models.Model
-    fields: - name: - CharField
+    fields: - restaurant: - ForeignKey
+            - name: - CharField
             - description: - TextField
-            - chef: - ForeignKey
+            - chef: - ForeignKey, null once the chef user is deleted
+                      (the item is soft deleted with it)
             - standard: - BooleanField
             - ingredients: - ManyToManyField
+            - updated_at: - DateTimeField
+            - deleted_at: - DateTimeField, set once soft deleted
+                            (menu.trash)
     """
+    restaurant = restaurant_field()
     name = models.CharField(max_length=180)
     description = models.TextField()
-    chef = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    # Deleting a user soft deletes their items (menu.trash.chef_deleting)
+    # instead of cascading over the items and their through rows
+    chef = models.ForeignKey('auth.User', on_delete=models.DO_NOTHING,
+                             null=True)
     created_date = models.DateTimeField(default=timezone.now)
     standard = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     ingredients = models.ManyToManyField(
         'Ingredient', related_name='ingredients')
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = LiveManager.from_queryset(ItemQuerySet)()
+    all_objects = TenantManager.from_queryset(ItemQuerySet)()
+
+    class Meta:
+        # Partial indexes: deleted items leave the listing indexes, only
+        # they are in the purge index
+        indexes = [
+            models.Index(fields=['restaurant', 'name', 'id'],
+                         name='item_rest_name_id_idx',
+                         condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['restaurant', 'updated_at'],
+                         name='item_rest_updated_idx',
+                         condition=models.Q(deleted_at__isnull=True)),
+            # Keyset pages by pk (api_items)
+            models.Index(fields=['restaurant', 'id'],
+                         name='item_rest_id_idx',
+                         condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['deleted_at'], name='item_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         """Returns name field name"""
@@ -46,10 +230,347 @@ class Item(models.Model):
 class Ingredient(models.Model):
     """Ingredient model class
     Inherit: - models.Model
-    field: - name: - CharField
+    field: - restaurant: - ForeignKey
+           - name: - CharField
+           - updated_at: - DateTimeField
     """
+    restaurant = restaurant_field()
     name = models.CharField(max_length=180)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'name'],
+                         name='ingredient_rest_name_idx'),
+            # Keyset pages by pk (api_ingredients)
+            models.Index(fields=['restaurant', 'id'],
+                         name='ingredient_rest_id_idx'),
+        ]
 
     def __str__(self):
         """Return name field name"""
         return self.name
+
+
+def item_ingredients():
+    """Returns the prefetch of Item.ingredients. The items are scoped
+    already, with the restaurant filter of the Ingredient manager SQLite
+    walks every ingredient of the restaurant instead of the few of the
+    items.
+    """
+    return models.Prefetch('ingredients',
+                           queryset=Ingredient._base_manager.all())
+
+
+class MenuCardQuerySet(models.QuerySet):
+    """MenuCardQuerySet class
+    Inherit: - models.QuerySet
+    - Same listing rules as MenuQuerySet, answered from the card table.
+    """
+
+    def current(self):
+        """Cards of active menus which have not expired yet, newest first"""
+        return self.filter(
+            is_active=True, expiration_date__gt=datetime.date.today()
+        ).order_by('-created_date')
+
+    def without_expiration(self):
+        """Cards of active menus without expiration date, sorted by
+        season
+        """
+        return self.filter(
+            is_active=True, expiration_date__isnull=True).order_by('season')
+
+
+class MenuCard(models.Model):
+    """MenuCard model class - denormalized read model of one menu, rebuilt
+    by menu.cards whenever the menu, its items or their ingredients change.
+    Inherit: - models.Model
+    fields: - menu: - OneToOneField (primary key)
+            - restaurant: - ForeignKey, copy of Menu.restaurant
+            - season: - CharField
+            - created_date: - DateTimeField
+            - expiration_date: - DateField
+            - payload: - TextField, JSON list of the menu items with
+                         their pk, name, chef and ingredient names
+            - updated_at: - DateTimeField
+            - is_active: - BooleanField, copy of Menu.is_active
+    """
+    menu = models.OneToOneField(Menu, on_delete=models.CASCADE,
+                                primary_key=True, related_name='card')
+    restaurant = restaurant_field()
+    season = models.CharField(max_length=20)
+    created_date = models.DateTimeField()
+    expiration_date = models.DateField(blank=True, null=True)
+    payload = models.TextField(default='[]')
+    updated_at = models.DateTimeField(auto_now=True)
+    is_active = models.BooleanField(default=True)
+
+    objects = TenantManager.from_queryset(MenuCardQuerySet)()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'expiration_date',
+                                 'created_date'],
+                         name='card_rest_exp_created_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['restaurant', 'season'],
+                         name='card_rest_no_exp_season_idx',
+                         condition=models.Q(expiration_date__isnull=True,
+                                            is_active=True)),
+        ]
+
+    def __str__(self):
+        """Returns season field name"""
+        return self.season
+
+    @cached_property
+    def items(self):
+        """Returns list of item dictionaries (pk, name, chef, ingredients)"""
+        return json.loads(self.payload)
+
+    @property
+    def item_names(self):
+        """Returns list of item names"""
+        return [item['name'] for item in self.items]
+
+
+class MenuIngredient(models.Model):
+    """MenuIngredient model class - reverse index of ingredient -> menus,
+    one row per ingredient used by at least one item of a menu. Rebuilt per
+    menu by menu.allergens whenever the menu items or their ingredients
+    change.
+    Inherit: - models.Model
+    fields: - ingredient: - ForeignKey
+            - menu: - ForeignKey
+            - items: - PositiveIntegerField, number of menu items using
+                       the ingredient
+    """
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='menu_index')
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE,
+                             related_name='ingredient_index')
+    items = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('ingredient', 'menu'),)
+
+    def __str__(self):
+        """Returns ingredient and menu"""
+        return '{} in {}'.format(self.ingredient_id, self.menu_id)
+
+
+class ArchivedMenu(models.Model):
+    """ArchivedMenu model class - menu moved out of the Menu table by the
+    archive_menus command (--move-after), keeping its primary key.
+    Inherit: - models.Model
+    fields: - id: - IntegerField, pk of the archived menu
+            - restaurant: - ForeignKey
+            - season: - CharField
+            - created_date: - DateTimeField
+            - expiration_date: - DateField
+            - archived_at: - DateTimeField
+    """
+    id = models.IntegerField(primary_key=True)
+    restaurant = restaurant_field()
+    season = models.CharField(max_length=20)
+    created_date = models.DateTimeField()
+    expiration_date = models.DateField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'id'],
+                         name='archived_rest_id_idx'),
+        ]
+
+    def __str__(self):
+        """Returns season field name"""
+        return self.season
+
+
+class ArchivedMenuItem(models.Model):
+    """ArchivedMenuItem model class - 'items' through row of an archived
+    menu
+    Inherit: - models.Model
+    fields: - restaurant: - ForeignKey
+            - menu: - ForeignKey
+            - item: - ForeignKey
+    """
+    restaurant = restaurant_field()
+    menu = models.ForeignKey(ArchivedMenu, on_delete=models.CASCADE,
+                             related_name='items')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE,
+                             related_name='archived_menus')
+
+    objects = TenantManager()
+
+    class Meta:
+        unique_together = (('menu', 'item'),)
+        indexes = [
+            models.Index(fields=['restaurant', 'menu'],
+                         name='archived_item_rest_menu_idx'),
+        ]
+
+    def __str__(self):
+        """Returns menu and item"""
+        return '{} in {}'.format(self.item_id, self.menu_id)
+
+
+class ChangeEvent(models.Model):
+    """ChangeEvent model class - append-only log of the catalog changes,
+    written by menu.changes once the changing transaction commits. The pk
+    is the sequence number: the events of a restaurant are numbered in
+    commit order, so "changes since N" never misses one.
+    Inherit: - models.Model
+    fields: - id: - BigAutoField, sequence number
+            - restaurant: - ForeignKey
+            - model: - CharField, 'menu', 'item' or 'ingredient'
+            - object_id: - IntegerField, pk of the changed object
+            - action: - CharField, 'create', 'update' or 'delete'
+            - created_at: - DateTimeField
+    """
+    ACTIONS = (('create', 'create'), ('update', 'update'),
+               ('delete', 'delete'))
+
+    id = models.BigAutoField(primary_key=True)
+    restaurant = restaurant_field()
+    model = models.CharField(max_length=10)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'id'],
+                         name='change_rest_seq_idx'),
+        ]
+
+    def __str__(self):
+        """Returns sequence number, action and object"""
+        return '{} {} {} {}'.format(self.pk, self.action, self.model,
+                                    self.object_id)
+
+
+class Webhook(models.Model):
+    """Webhook model class - url receiving the changes of a restaurant,
+    delivered in coalesced batches by the dispatch_webhooks command
+    Inherit: - models.Model
+    fields: - restaurant: - ForeignKey
+            - url: - URLField
+            - secret: - CharField, key of the X-Menu-Signature HMAC of
+                        every delivery (none if blank)
+            - last_sequence: - BigIntegerField, last delivered ChangeEvent
+            - is_active: - BooleanField
+    """
+    restaurant = restaurant_field()
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=100, blank=True)
+    last_sequence = models.BigIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        """Returns url field name"""
+        return self.url
+
+
+
+# Digits of the base 36 numbers of encode_pks()
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_pks(pks):
+    """Returns the pks, sorted, as the base 36 gaps between them:
+    [3, 7, 8, 40] -> '3,4,1,w'. Dense pk ranges take two characters per pk.
+    """
+    gaps = []
+    previous = 0
+    for pk in sorted(pks):
+        gap = pk - previous
+        digits = ''
+        while True:
+            gap, digit = divmod(gap, 36)
+            digits = DIGITS[digit] + digits
+            if not gap:
+                break
+        gaps.append(digits)
+        previous = pk
+    return ','.join(gaps)
+
+
+def decode_pks(value):
+    """Returns set of the pks of an encode_pks() string"""
+    pks = set()
+    pk = 0
+    for gap in value.split(',') if value else ():
+        pk += int(gap, 36)
+        pks.add(pk)
+    return pks
+
+
+class MenuVersion(models.Model):
+    """MenuVersion model class - state of a menu after a committed change of
+    its season, expiration date, status or item set, recorded by
+    menu.history. The item set is a snapshot, or a delta against the
+    snapshot of an earlier version ('base'), so any version is rebuilt from
+    two rows. Kept when the menu is moved to the archive tables or purged.
+    Inherit: - models.Model
+    fields: - menu: - ForeignKey, without constraint
+            - restaurant: - ForeignKey
+            - recorded_at: - DateTimeField
+            - season: - CharField
+            - expiration_date: - DateField
+            - is_active: - BooleanField
+            - is_deleted: - BooleanField, menu soft deleted
+            - base: - ForeignKey, snapshot of a delta, null for a snapshot
+            - items: - TextField, encode_pks() of the items of a snapshot
+            - added: - TextField, encode_pks() of the items of a delta
+                       missing from its base
+            - removed: - TextField, encode_pks() of the items of the base
+                         missing from a delta
+    """
+    menu = models.ForeignKey(Menu, on_delete=models.DO_NOTHING,
+                             db_constraint=False, related_name='versions')
+    restaurant = restaurant_field()
+    recorded_at = models.DateTimeField(default=timezone.now)
+    season = models.CharField(max_length=20)
+    expiration_date = models.DateField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    is_deleted = models.BooleanField(default=False)
+    base = models.ForeignKey('self', on_delete=models.DO_NOTHING,
+                             db_constraint=False, blank=True, null=True,
+                             related_name='+')
+    items = models.TextField(blank=True)
+    added = models.TextField(blank=True)
+    removed = models.TextField(blank=True)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            # Point-in-time reads (menu.history.menu_as_of)
+            models.Index(fields=['restaurant', 'menu', 'recorded_at'],
+                         name='version_rest_menu_at_idx'),
+        ]
+
+    def __str__(self):
+        """Returns season and recorded_at"""
+        return '{} at {}'.format(self.season, self.recorded_at)
+
+    @cached_property
+    def item_pks(self):
+        """Returns set of the item pks, the base of a delta is read from
+        'base' (select_related)
+        """
+        if self.base_id is None:
+            return decode_pks(self.items)
+        return (self.base.item_pks | decode_pks(self.added)) - \
+            decode_pks(self.removed)
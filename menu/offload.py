@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import close_old_connections
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import threading
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the thread pool running blocking calls of the async views,
+    settings.MENU_ASYNC_THREADS threads (16 by default). Each thread keeps
+    its own database connection, so this also bounds the connections one
+    ASGI worker opens.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MENU_ASYNC_THREADS', 16),
+                thread_name_prefix='menu-offload')
+        return _executor
+
+
+def _call(func, args, kwargs):
+    # Like request_started and request_finished for a worker thread: drops
+    # connections which are broken or older than CONN_MAX_AGE before they
+    # are used, and closes them afterwards when CONN_MAX_AGE is 0, so idle
+    # threads do not hold connections borrowed from a pool
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def offload(func, *args, **kwargs):
+    """Runs a blocking function (ORM, cache, template rendering) in the
+    bounded thread pool and returns its result. Context variables (request
+    timings of menu.perf) are carried over to the thread.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), functools.partial(context.run, _call, func, args,
+                                          kwargs))
@@ -0,0 +1,85 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Encodes the ordering values of the last row of a page
+    :input: - values - list of JSON serializable values
+    :return: - url safe cursor string
+    """
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decodes a cursor made by encode_cursor()
+    :input: - cursor - cursor string from the query string
+            - size - expected number of values
+    :return: - list of values or None if the cursor is missing or broken
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def clean_cursor(model, fields, values):
+    """Converts decoded cursor values to the types of their fields
+    :input: - model - model of the paginated queryset
+            - fields - ordering fields ('pk' allowed)
+            - values - values from decode_cursor()
+    :return: - list of values or None if one is null or of a wrong type
+               (forged cursor)
+    """
+    cleaned = []
+    for name, value in zip(fields, values):
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        if value is None or isinstance(value, (list, dict)):
+            return None
+        try:
+            cleaned.append(field.to_python(value))
+        except ValidationError:
+            return None
+    return cleaned
+
+
+def keyset_page(queryset, fields, cursor=None, size=50):
+    """Keyset (seek) pagination, rows are ordered by 'fields' and the page
+    starts right after the row the cursor points at, so the database walks
+    the index instead of counting an OFFSET.
+    :input: - queryset - queryset to paginate
+            - fields - ordering fields, the last one must be unique (pk)
+            - cursor - cursor string from the query string, a broken one
+                       gives the first page
+            - size - page size
+    :return: - (list of rows, cursor of the next page or None)
+    """
+    queryset = queryset.order_by(*fields)
+    values = decode_cursor(cursor, len(fields))
+    if values is not None:
+        values = clean_cursor(queryset.model, fields, values)
+    if values is not None:
+        # (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ...
+        condition = Q()
+        for i, field in enumerate(fields):
+            step = Q(**{field + '__gt': values[i]})
+            for prev, value in zip(fields[:i], values[:i]):
+                step &= Q(**{prev: value})
+            condition |= step
+        queryset = queryset.filter(condition)
+    rows = list(queryset[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(
+            [getattr(rows[-1], field) for field in fields])
+    return rows, next_cursor
@@ -0,0 +1,85 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, \
+    reraise
+
+import contextvars
+import time
+
+# Timings of the request being handled, None outside of a sampled request
+current = contextvars.ContextVar('menu_perf', default=None)
+
+
+class RequestTimings:
+    """RequestTimings class - counters filled while one request is handled
+    fields: - queries - list of (sql, seconds) of every executed statement
+            - db_time - seconds spent in the database
+            - template_time - seconds spent rendering top level templates
+    """
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.queries.append((sql, duration))
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection, times the queries of sampled
+    requests (also in the threads of menu.offload, which copy the context)
+    """
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_record_query(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    """TimedTemplate class
+    Inherit: - django.template.backends.django.Template
+    - Adds its render time to the timings of the current request.
+    """
+
+    def render(self, context=None, request=None):
+        timings = current.get()
+        if timings is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """TimedDjangoTemplates class - DjangoTemplates backend returning
+    TimedTemplate, so PerformanceMiddleware can report template time.
+    Included and extended templates are counted in their top level one.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name),
+                                 self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from contextvars import ContextVar
+import asyncio
+import functools
+import random
+
+# True while a view decorated with replica_reads runs
+reading_replica = ContextVar('reading_replica', default=False)
+# True for the requests of a client which wrote in the last
+# MENU_DB_PIN_SECONDS (menu.middleware.ReplicaPinMiddleware)
+pinned = ContextVar('pinned', default=False)
+
+
+def replica_reads(view):
+    """Decorator of read-only views whose queries may go to a replica,
+    sync or async. Outside of these views (forms, writes, signal
+    receivers, management commands) everything uses the primary.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = reading_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                reading_replica.reset(token)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = reading_replica.set(True)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                reading_replica.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """ReplicaRouter class - database router of settings.DATABASE_ROUTERS
+    - Reads of replica_reads views go to a random database of
+      settings.MENU_DB_REPLICAS, unless the request is pinned to the
+      primary after a write.
+    - Everything else, and every write, goes to the primary ('default').
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.MENU_DB_REPLICAS
+        if replicas and reading_replica.get() and not pinned.get():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,292 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Item
+from .signals import ItemIngredients, catalog_changed
+from .tenants import current_restaurant_id
+
+import re
+import threading
+
+# Result limit of search()
+SEARCH_LIMIT = 50
+# Query words shorter than this are ignored, a one letter prefix matches
+# most of the catalog and has no prefix index
+MIN_TOKEN_LENGTH = 2
+# Matches ranked by the SQLite backend, newest first. Ranking every match
+# of a common prefix costs ~100 ms at 100k items, 2000 stay under 15 ms.
+SEARCH_CANDIDATES = 2000
+
+# Words as split by the FTS5 unicode61 tokenizer (no underscore)
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+# Digits of the restaurant pk prefixed to the indexed words. A fixed width
+# gives the prefix of a query word a known length: the FTS5 prefix indexes
+# (migration 0017) cover 'r000012x' plus words of 2 to 4 letters.
+RESTAURANT_DIGITS = 6
+
+
+def tokenize(text):
+    """Returns list of lower case words of a text"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def restaurant_words(restaurant_id, text):
+    """Returns the words of a text as indexed by the full-text backends,
+    each one prefixed with the restaurant ('r000012xsoup'), so a prefix
+    query only walks the terms of one restaurant, whatever the size of the
+    others
+    """
+    return ' '.join('r{:0{}d}x{}'.format(restaurant_id, RESTAURANT_DIGITS,
+                                         word)
+                    for word in tokenize(text))
+
+
+def query_tokens(query):
+    """Returns the words of a search query, short ones dropped"""
+    return [token for token in tokenize(query)
+            if len(token) >= MIN_TOKEN_LENGTH]
+
+
+def documents(item_pks):
+    """Yields (pk, restaurant pk, name, description, ingredient names) of
+    existing items which are not soft deleted
+    :input: - item_pks - iterable of item ids, None for every item of every
+                         restaurant (the indexes are shared)
+    """
+    items = Item._base_manager.filter(deleted_at__isnull=True).order_by('pk')
+    links = ItemIngredients.objects.order_by('ingredient__name')
+    if item_pks is not None:
+        items = items.filter(pk__in=item_pks)
+        links = links.filter(item_id__in=item_pks)
+    ingredients = {}
+    for item_pk, name in links.values_list('item_id', 'ingredient__name'):
+        ingredients.setdefault(item_pk, []).append(name)
+    for pk, restaurant, name, description in items.values_list(
+            'pk', 'restaurant_id', 'name', 'description'):
+        yield (pk, restaurant, name, description,
+               ' '.join(ingredients.get(pk, [])))
+
+
+class SQLiteSearch:
+    """SQLiteSearch class - FTS5 table menu_item_fts (rowid = item pk,
+    created by migration 0007, prefix indexes sized by migration 0017)
+    holding restaurant_words() of the items.
+    """
+
+    def index(self, item_pks):
+        """Reindexes the items, items which no longer exist are removed"""
+        item_pks = list(item_pks)
+        with connection.cursor() as cursor:
+            for start in range(0, len(item_pks), 500):
+                chunk = item_pks[start:start + 500]
+                cursor.execute(
+                    'DELETE FROM menu_item_fts WHERE rowid IN ({})'.format(
+                        ', '.join(['%s'] * len(chunk))), chunk)
+            cursor.executemany(
+                'INSERT INTO menu_item_fts '
+                '(rowid, name, description, ingredients) '
+                'VALUES (%s, %s, %s, %s)',
+                [(pk, restaurant_words(restaurant, name),
+                  restaurant_words(restaurant, description),
+                  restaurant_words(restaurant, ingredients))
+                 for pk, restaurant, name, description, ingredients
+                 in documents(item_pks)])
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Returns list of matching item pks of the current restaurant,
+        best match first among the newest SEARCH_CANDIDATES matches
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        match = ' '.join('"{}"*'.format(word) for word in restaurant_words(
+            current_restaurant_id(), ' '.join(tokens)).split())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM (SELECT rowid, '
+                'bm25(menu_item_fts, 10.0, 1.0, 5.0) AS score '
+                'FROM menu_item_fts WHERE menu_item_fts MATCH %s '
+                'ORDER BY rowid DESC LIMIT %s) ORDER BY score LIMIT %s',
+                [match, SEARCH_CANDIDATES, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearch:
+    """PostgresSearch class - menu_item_search table holding a weighted
+    tsvector of restaurant_words() per item behind a GIN index (created by
+    migration 0007).
+    """
+    document_sql = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')")
+
+    def index(self, item_pks):
+        """Reindexes the items, items which no longer exist are removed"""
+        item_pks = list(item_pks)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM menu_item_search '
+                           'WHERE item_id = ANY(%s)', [item_pks])
+            cursor.executemany(
+                'INSERT INTO menu_item_search (item_id, document) '
+                'VALUES (%s, {})'.format(self.document_sql),
+                [(pk, restaurant_words(restaurant, name),
+                  restaurant_words(restaurant, ingredients),
+                  restaurant_words(restaurant, description))
+                 for pk, restaurant, name, description, ingredients
+                 in documents(item_pks)])
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Returns list of matching item pks of the current restaurant,
+        best match first
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join('{}:*'.format(word) for word in restaurant_words(
+            current_restaurant_id(), ' '.join(tokens)).split())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT item_id FROM menu_item_search, "
+                "to_tsquery('simple', %s) query WHERE document @@ query "
+                "ORDER BY ts_rank(document, query) DESC, item_id LIMIT %s",
+                [tsquery, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TrigramSearch:
+    """TrigramSearch class - in-process trigram index for tests and for
+    databases without full-text search. Built from the database on first
+    use and kept in sync with index().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.words = None
+        self.restaurants = {}
+        self.trigrams = {}
+
+    @staticmethod
+    def word_trigrams(word):
+        padded = '  ' + word
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _add(self, pk, restaurant, words):
+        self.words[pk] = words
+        self.restaurants[pk] = restaurant
+        for word in words:
+            for trigram in self.word_trigrams(word):
+                self.trigrams.setdefault(trigram, set()).add(pk)
+
+    def _remove(self, pk):
+        self.restaurants.pop(pk, None)
+        for word in self.words.pop(pk, ()):
+            for trigram in self.word_trigrams(word):
+                self.trigrams.get(trigram, set()).discard(pk)
+
+    def _load(self):
+        if self.words is None:
+            self.words = {}
+            for pk, restaurant, *texts in documents(None):
+                self._add(pk, restaurant, tokenize(' '.join(texts)))
+
+    def rebuild(self):
+        """Drops the index, it is built again on next use"""
+        with self.lock:
+            self.words = None
+            self.restaurants = {}
+            self.trigrams = {}
+
+    def index(self, item_pks):
+        """Reindexes the items, items which no longer exist are removed"""
+        with self.lock:
+            if self.words is None:
+                return
+            item_pks = set(item_pks)
+            for pk in item_pks:
+                self._remove(pk)
+            for pk, restaurant, *texts in documents(item_pks):
+                self._add(pk, restaurant, tokenize(' '.join(texts)))
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Returns list of matching item pks of the current restaurant,
+        items with more words starting with the query tokens first
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        restaurant = current_restaurant_id()
+        with self.lock:
+            self._load()
+            candidates = None
+            for token in tokens:
+                # A word starting with the token holds all its trigrams,
+                # including the ones padded at the word start
+                for trigram in self.word_trigrams(token):
+                    found = self.trigrams.get(trigram, set())
+                    candidates = (set(found) if candidates is None
+                                  else candidates & found)
+            scored = []
+            for pk in candidates or ():
+                if self.restaurants[pk] != restaurant:
+                    continue
+                words = self.words[pk]
+                hits = [sum(word.startswith(token) for word in words)
+                        for token in tokens]
+                if all(hits):
+                    scored.append((-sum(hits), pk))
+        return [pk for score, pk in sorted(scored)[:limit]]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the search backend: settings.MENU_SEARCH_BACKEND (dotted
+    path) if set, FTS5 on SQLite, tsvector on PostgreSQL, trigrams otherwise
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = getattr(settings, 'MENU_SEARCH_BACKEND', None)
+            if path:
+                _backend = import_string(path)()
+            elif connection.vendor == 'sqlite':
+                _backend = SQLiteSearch()
+            elif connection.vendor == 'postgresql':
+                _backend = PostgresSearch()
+            else:
+                _backend = TrigramSearch()
+        return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting=None, **kwargs):
+    """Forgets the backend when MENU_SEARCH_BACKEND is changed"""
+    global _backend
+    if setting in (None, 'MENU_SEARCH_BACKEND'):
+        with _backend_lock:
+            _backend = None
+
+
+def search_items(query, limit=SEARCH_LIMIT):
+    """Returns list of items matching every word of the query as a prefix
+    of their name, description or ingredient names, best match first
+    """
+    pks = get_backend().search(query, limit)
+    # noinspection PyUnresolvedReferences
+    items = Item.objects.in_bulk(pks)
+    return [items[pk] for pk in pks if pk in items]
+
+
+@receiver(catalog_changed)
+def reindex_items(sender, items, **kwargs):
+    """Keeps the search index in sync with item, ingredient and
+    membership writes
+    """
+    if items:
+        get_backend().index(items)
@@ -0,0 +1,166 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Menu, Item, Ingredient
+
+# Sent once per catalog write with the pks of every object whose rendered
+# output may have changed. Arguments: - menus - set of menu pks
+#                                     - items - set of item pks
+#                                     - ingredients - set of ingredient pks
+# An ingredient change already lists the items using it and the menus
+# using those items, so receivers never have to walk the relations again.
+# created is True when the pks of the sender model itself were just
+# created or restored, deleted when they were just soft deleted
+# (menu.changes, menu.trash).
+catalog_changed = Signal()
+
+MenuItems = Menu.items.through
+ItemIngredients = Item.ingredients.through
+
+
+def menus_of_items(item_pks):
+    """Returns set of menu pks which contain any of the items"""
+    if not item_pks:
+        return set()
+    return set(MenuItems.objects.filter(
+        item_id__in=item_pks).values_list('menu_id', flat=True))
+
+
+def items_of_ingredients(ingredient_pks):
+    """Returns set of item pks which use any of the ingredients"""
+    if not ingredient_pks:
+        return set()
+    return set(ItemIngredients.objects.filter(
+        ingredient_id__in=ingredient_pks).values_list('item_id', flat=True))
+
+
+def affected(menus=(), items=(), ingredients=()):
+    """Expands changed objects to everything rendering them
+    :input: - menus, items, ingredients - iterables of changed pks
+    :return: - dictionary with menus, items and ingredients pk sets
+    """
+    ingredients = set(ingredients)
+    items = set(items) | items_of_ingredients(ingredients)
+    menus = set(menus) | menus_of_items(items)
+    return {'menus': menus, 'items': items, 'ingredients': ingredients}
+
+
+def send_catalog_changed(sender, menus=(), items=(), ingredients=(),
+                         created=False, deleted=False):
+    """Expands the changed pks with affected() and sends catalog_changed.
+    Bulk writes (queryset.update(), bulk_create()) skip the model signals
+    and must call this themselves.
+    """
+    changed = affected(menus, items, ingredients)
+    if any(changed.values()):
+        catalog_changed.send(sender=sender, created=created,
+                             deleted=deleted, **changed)
+
+
+def _changed_kwargs(instance):
+    """Returns the send_catalog_changed() keyword for a model instance"""
+    key = {Menu: 'menus', Item: 'items', Ingredient: 'ingredients'}[
+        type(instance)]
+    return {key: [instance.pk]}
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Ingredient)
+def catalog_saved(sender, instance, created, **kwargs):
+    """Menu, Item or Ingredient saved"""
+    send_catalog_changed(sender, created=created, **_changed_kwargs(instance))
+
+
+@receiver(pre_delete, sender=Menu)
+@receiver(pre_delete, sender=Item)
+@receiver(pre_delete, sender=Ingredient)
+def catalog_deleting(sender, instance, **kwargs):
+    """Menu, Item or Ingredient about to be deleted - the through rows are
+    still there, so the affected objects are collected now. Rows purged
+    after a soft delete are skipped, it refreshed everything already.
+    """
+    if getattr(instance, 'deleted_at', None) is not None:
+        return
+    instance._catalog_affected = affected(**_changed_kwargs(instance))
+
+
+@receiver(post_delete, sender=Menu)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Ingredient)
+def catalog_deleted(sender, instance, **kwargs):
+    """Menu, Item or Ingredient deleted"""
+    if getattr(instance, 'deleted_at', None) is not None:
+        return
+    changed = getattr(instance, '_catalog_affected', None)
+    if changed is None:
+        changed = affected(**_changed_kwargs(instance))
+    catalog_changed.send(sender=sender, **changed)
+
+
+@receiver(post_save, sender=User)
+def chef_saved(sender, instance, created, update_fields, **kwargs):
+    """Chef renamed - item pages show the chef. Saves of other fields only
+    (last_login on every login) are skipped.
+    """
+    if not created and (update_fields is None or
+                        'username' in update_fields):
+        # noinspection PyUnresolvedReferences
+        send_catalog_changed(sender, items=Item.objects.filter(
+            chef=instance).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=MenuItems)
+def menu_items_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Menu.items changed from either side"""
+    if action == 'pre_clear':
+        # pk_set is None on clear, remember what is about to be removed
+        if reverse:
+            instance._catalog_cleared = menus_of_items([instance.pk])
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_catalog_cleared', set())
+    if reverse:
+        # instance is an Item, pk_set holds menu pks
+        send_catalog_changed(sender, menus=pk_set)
+    else:
+        send_catalog_changed(sender, menus=[instance.pk])
+
+
+@receiver(m2m_changed, sender=ItemIngredients)
+def item_ingredients_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Item.ingredients changed from either side"""
+    if action == 'pre_clear':
+        if reverse:
+            instance._catalog_cleared = items_of_ingredients([instance.pk])
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_catalog_cleared', set())
+    if reverse:
+        # instance is an Ingredient, pk_set holds item pks
+        send_catalog_changed(sender, items=pk_set)
+    else:
+        send_catalog_changed(sender, items=[instance.pk])
+
+
+@receiver(catalog_changed)
+def touch_updated_at(sender, menus, items, **kwargs):
+    """Moves updated_at of every affected menu and item, so the validators
+    of pages showing related objects (items of a menu, ingredients and chef
+    of an item) change as well. update() sends no signals.
+    """
+    now = timezone.now()
+    if menus:
+        # noinspection PyUnresolvedReferences
+        Menu.objects.filter(pk__in=menus).update(updated_at=now)
+    if items:
+        # noinspection PyUnresolvedReferences
+        Item.objects.filter(pk__in=items).update(updated_at=now)
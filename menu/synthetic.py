@@ -0,0 +1,187 @@
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Menu, Item, Ingredient
+from .signals import ItemIngredients, MenuItems, catalog_changed
+
+import datetime
+import itertools
+import random
+
+BASE_INGREDIENTS = (
+    'salt', 'pepper', 'butter', 'garlic', 'onion', 'tomato', 'basil',
+    'cheese', 'cream', 'milk', 'eggs', 'flour', 'sugar', 'rice', 'chicken',
+    'beef', 'pork', 'salmon', 'shrimp', 'peanuts', 'almonds', 'walnuts',
+    'lemon', 'lime', 'honey', 'vinegar', 'olive oil', 'parsley', 'thyme',
+    'rosemary', 'chili', 'ginger', 'soy', 'sesame', 'mushrooms', 'spinach',
+    'potato', 'carrot', 'celery', 'corn', 'beans', 'chocolate', 'vanilla',
+    'cinnamon', 'yogurt', 'bacon', 'avocado', 'cucumber', 'apple', 'mint',
+)
+INGREDIENT_STYLES = ('', 'fresh', 'smoked', 'dried', 'roasted', 'pickled',
+                     'wild', 'sweet', 'spicy', 'organic')
+DISHES = ('Soup', 'Salad', 'Burger', 'Pasta', 'Pie', 'Curry', 'Stew',
+          'Sandwich', 'Tart', 'Risotto', 'Tacos', 'Bowl', 'Sundae', 'Float',
+          'Shake', 'Pancakes', 'Omelette', 'Skewers', 'Wrap', 'Cake')
+SEASONS = ('Spring', 'Summer', 'Autumn', 'Winter', 'Brunch', 'Holiday',
+           'Happy hour', 'Kids', 'Late night', 'Tasting')
+
+
+def zipf_picker(rng, size, exponent=1.1):
+    """Returns a function picking k distinct indexes out of range(size),
+    index i is picked with weight 1 / (i + 1) ** exponent, so a few
+    ingredients are reused everywhere and most are rare
+    """
+    cum_weights = list(itertools.accumulate(
+        1.0 / (rank ** exponent) for rank in range(1, size + 1)))
+
+    def pick(k):
+        k = min(k, size)
+        picked = set()
+        while len(picked) < k:
+            picked.update(rng.choices(range(size), cum_weights=cum_weights,
+                                      k=k - len(picked)))
+        return sorted(picked)
+    return pick
+
+
+def ingredient_names(count):
+    """Returns 'count' distinct ingredient names, plain ones first"""
+    names = []
+    for number in itertools.count(1):
+        for style in INGREDIENT_STYLES:
+            for base in BASE_INGREDIENTS:
+                name = ' '.join(part for part in (style, base) if part)
+                names.append(name if number == 1
+                             else '{} {}'.format(name, number))
+                if len(names) == count:
+                    return names
+
+
+def _next_pk(model):
+    # Base manager, pks are unique across restaurants
+    return (model._base_manager.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+
+def seed_catalog(items=100, seed=0, menus=None, ingredients=None, chefs=None,
+                 years=3, batch_size=None):
+    """Writes a synthetic catalog with bulk_create, reproducible from 'seed'.
+    Rows get explicit pks after the current maximum (bulk_create does not
+    return pks on every backend), so run it where nobody else writes.
+    :input: - items - number of items
+            - seed - random seed
+            - menus - number of menus (items / 20 by default)
+            - ingredients - size of the ingredient vocabulary (items / 4)
+            - chefs - number of chef users (items / 200)
+            - years - menu expiration dates are spread over this many years
+                      around today
+            - batch_size - rows per INSERT, None for the backend limit
+    :return: - dictionary of created row counts
+    """
+    rng = random.Random(seed)
+    menus = menus or max(2, items // 20)
+    ingredients = ingredients or max(20, items // 4)
+    chefs = chefs or max(3, items // 200)
+    now = timezone.now()
+    today = datetime.date.today()
+
+    with transaction.atomic():
+        first = _next_pk(User)
+        # noinspection PyUnresolvedReferences
+        User.objects.bulk_create(
+            [User(pk=first + n, username='chef-{}-{}'.format(seed, first + n),
+                  password='!')
+             for n in range(chefs)], batch_size=batch_size)
+        chef_pks = list(range(first, first + chefs))
+
+        first = _next_pk(Ingredient)
+        # noinspection PyUnresolvedReferences
+        Ingredient.objects.bulk_create(
+            [Ingredient(pk=first + n, name=name)
+             for n, name in enumerate(ingredient_names(ingredients))],
+            batch_size=batch_size)
+        pick_ingredients = zipf_picker(rng, ingredients)
+
+        first_item = _next_pk(Item)
+        item_rows = []
+        link_rows = []
+        for n in range(items):
+            pk = first_item + n
+            item_rows.append(Item(
+                pk=pk,
+                name='{} {} {}'.format(
+                    rng.choice(BASE_INGREDIENTS).title(),
+                    rng.choice(DISHES), pk),
+                description=' '.join(rng.choice(BASE_INGREDIENTS)
+                                     for _ in range(rng.randint(8, 40))),
+                chef_id=rng.choice(chef_pks),
+                standard=rng.random() < 0.1,
+                created_date=now - datetime.timedelta(
+                    days=rng.randint(0, 365 * years))))
+            for index in pick_ingredients(rng.randint(2, 8)):
+                link_rows.append(ItemIngredients(
+                    item_id=pk, ingredient_id=first + index))
+        # noinspection PyUnresolvedReferences
+        Item.objects.bulk_create(item_rows, batch_size=batch_size)
+        ItemIngredients.objects.bulk_create(link_rows, batch_size=batch_size)
+
+        first_menu = _next_pk(Menu)
+        menu_rows = []
+        link_rows = []
+        for n in range(menus):
+            pk = first_menu + n
+            kind = rng.random()
+            if kind < 0.3:
+                expiration_date = None
+            else:
+                # Mostly expired history, some current menus
+                expiration_date = today + datetime.timedelta(
+                    days=rng.randint(-365 * years, 180))
+            menu_rows.append(Menu(
+                pk=pk,
+                season='{} {}'.format(rng.choice(SEASONS), pk),
+                created_date=now - datetime.timedelta(
+                    days=rng.randint(0, 365 * years)),
+                expiration_date=expiration_date))
+            size = min(items, rng.randint(5, 40))
+            for index in rng.sample(range(items), size):
+                link_rows.append(MenuItems(menu_id=pk,
+                                           item_id=first_item + index))
+        # noinspection PyUnresolvedReferences
+        Menu.objects.bulk_create(menu_rows, batch_size=batch_size)
+        MenuItems.objects.bulk_create(link_rows, batch_size=batch_size)
+
+        _reset_sequences()
+        refresh_read_models(range(first_menu, first_menu + menus),
+                            range(first_item, first_item + items),
+                            created=True)
+    return {'chefs': chefs, 'ingredients': ingredients, 'items': items,
+            'menus': menus}
+
+
+def _reset_sequences():
+    """Moves the pk sequences past the explicit pks (PostgreSQL)"""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [User, Ingredient, Item, Menu])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def refresh_read_models(menu_pks, item_pks, batch_size=500, created=False):
+    """Sends catalog_changed in batches for rows written with bulk_create,
+    so caches, menu cards and the search and ingredient indexes catch up
+    (created - the rows are new ones)
+    """
+    menu_pks = list(menu_pks)
+    item_pks = list(item_pks)
+    for start in range(0, len(item_pks), batch_size):
+        catalog_changed.send(sender=Item, menus=set(), ingredients=set(),
+                             items=set(item_pks[start:start + batch_size]),
+                             created=created)
+    for start in range(0, len(menu_pks), batch_size):
+        catalog_changed.send(sender=Menu, items=set(), ingredients=set(),
+                             menus=set(menu_pks[start:start + batch_size]),
+                             created=created)
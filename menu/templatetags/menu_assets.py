@@ -0,0 +1,48 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+import functools
+
+register = template.Library()
+
+
+@functools.lru_cache(maxsize=None)
+def bundle_collected():
+    """True if the CSS bundle was built and collected (checked once)"""
+    return staticfiles_storage.exists(settings.MENU_CSS_BUNDLE)
+
+
+@receiver(setting_changed)
+def reset_bundle_collected(**kwargs):
+    bundle_collected.cache_clear()
+
+
+@register.simple_tag
+def stylesheets():
+    """<link> tags of the site CSS: the bundle of build_static when
+    settings.MENU_USE_CSS_BUNDLE is set, otherwise every source of
+    settings.MENU_CSS_SOURCES (vendored ones from their CDN)
+    :raise: - ImproperlyConfigured - bundle expected but not collected
+                                     (bin/post_compile did not run)
+    """
+    if getattr(settings, 'MENU_USE_CSS_BUNDLE', False):
+        if not bundle_collected():
+            raise ImproperlyConfigured(
+                'MENU_USE_CSS_BUNDLE is set but {} was not collected, run '
+                'build_static before collectstatic.'.format(
+                    settings.MENU_CSS_BUNDLE))
+        return format_html('<link rel="stylesheet" href="{}">',
+                           static(settings.MENU_CSS_BUNDLE))
+    return format_html_join(
+        '\n', '<link rel="stylesheet" href="{}"{}>',
+        ((path, format_html(' integrity="{}" crossorigin="anonymous"',
+                            integrity) if integrity else '')
+         if path.startswith(('http://', 'https://', '//'))
+         else (static(path), '')
+         for path, integrity in settings.MENU_CSS_SOURCES))
@@ -0,0 +1,142 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+
+from contextvars import ContextVar
+import contextlib
+import re
+
+# Restaurant pk of the current request (menu.middleware.TenantMiddleware).
+# None outside of requests: management commands and the shell see every
+# restaurant, unless they select one with use_restaurant().
+current_restaurant = ContextVar('current_restaurant', default=None)
+
+# Path prefix selecting a restaurant by slug: /r/<slug>/menu/1/
+PATH_PREFIX_RE = re.compile(r'^/r/(?P<slug>[-\w]+)/')
+# Seconds the restaurants are cached by restaurants()
+RESOLVE_TIMEOUT = 300
+
+
+def make_key(key, key_prefix, version):
+    """Cache KEY_FUNCTION (settings.CACHES) - every key is namespaced by the
+    current restaurant, so cached pages, fragments and choices of one
+    restaurant are never served to another one
+    """
+    restaurant = current_restaurant.get()
+    return '{}:{}:{}:{}'.format(key_prefix, version,
+                                '-' if restaurant is None else restaurant,
+                                key)
+
+
+def restaurants():
+    """Returns dictionary of the restaurant pks - 'default': pk of
+    settings.MENU_DEFAULT_RESTAURANT (created on first use), 'slugs' and
+    'hosts': {slug or host: pk}. Loaded in two queries and cached for
+    RESOLVE_TIMEOUT seconds, requests resolve their restaurant without
+    querying.
+    """
+    with use_restaurant(None):
+        found = cache.get('menu:tenant:restaurants')
+        if found is None:
+            model = apps.get_model('menu', 'Restaurant')
+            slug = settings.MENU_DEFAULT_RESTAURANT
+            # noinspection PyUnresolvedReferences
+            found = {'default': model.objects.get_or_create(
+                         slug=slug, defaults={'name': slug.title()})[0].pk,
+                     'slugs': {}, 'hosts': {}}
+            # noinspection PyUnresolvedReferences
+            for pk, slug, host in model.objects.values_list(
+                    'pk', 'slug', 'host'):
+                found['slugs'][slug] = pk
+                if host:
+                    found['hosts'][host.lower()] = pk
+            cache.set('menu:tenant:restaurants', found, RESOLVE_TIMEOUT)
+    return found
+
+
+@receiver(post_save, sender='menu.Restaurant')
+@receiver(post_delete, sender='menu.Restaurant')
+def forget(sender, **kwargs):
+    """Restaurant saved or deleted - drops the cached restaurants"""
+    with use_restaurant(None):
+        cache.delete('menu:tenant:restaurants')
+
+
+def default_restaurant_id():
+    """Returns pk of the restaurant of requests matching no other one"""
+    return restaurants()['default']
+
+
+def restaurant_id(slug=None):
+    """Returns pk of the restaurant with the slug, the default restaurant
+    without one (management commands, --restaurant)
+    :raise: - LookupError for an unknown slug
+    """
+    if slug is None:
+        return default_restaurant_id()
+    try:
+        return restaurants()['slugs'][slug]
+    except KeyError:
+        raise LookupError('Unknown restaurant: {}'.format(slug))
+
+
+def current_restaurant_id():
+    """Default of the restaurant foreign keys - the current restaurant, the
+    default one outside of requests
+    """
+    restaurant = current_restaurant.get()
+    if restaurant is None:
+        restaurant = default_restaurant_id()
+    return restaurant
+
+
+@contextlib.contextmanager
+def use_restaurant(restaurant_id):
+    """Scopes the queries and writes of the block to a restaurant
+    (None for every restaurant)
+    """
+    token = current_restaurant.set(restaurant_id)
+    try:
+        yield
+    finally:
+        current_restaurant.reset(token)
+
+
+def resolve_restaurant(request):
+    """Finds the restaurant of a request:
+    - /r/<slug>/ path prefix, which is stripped from request.path_info,
+    - otherwise the host of the request (Restaurant.host),
+    - otherwise settings.MENU_DEFAULT_RESTAURANT.
+    :return: - tuple of restaurant pk and path prefix ('' if none)
+    :raise: - Http404 for an unknown slug
+    """
+    found = restaurants()
+    match = PATH_PREFIX_RE.match(request.path_info)
+    if match:
+        pk = found['slugs'].get(match.group('slug'))
+        if pk is None:
+            raise Http404('No restaurant matches the given query.')
+        request.path_info = request.path_info[match.end() - 1:]
+        return pk, match.group(0)[1:]
+    host = request.get_host().rsplit(':', 1)[0].lower()
+    return found['hosts'].get(host, found['default']), ''
+
+
+class TenantManager(models.Manager):
+    """TenantManager class
+    Inherit: - models.Manager
+    - Default manager of the restaurant scoped models: inside a request
+      only the rows of the current restaurant are visible, for the views,
+      forms and related managers alike.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        restaurant = current_restaurant.get()
+        if restaurant is not None:
+            queryset = queryset.filter(restaurant_id=restaurant)
+        return queryset
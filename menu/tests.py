@@ -1,10 +1,54 @@
+from django.apps import apps
 from django.contrib.auth.models import User
-from django.test import TestCase
-from django.core.urlresolvers import reverse
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.models.signals import pre_delete
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-from .models import Menu, Item, Ingredient
+from .assets import AssetError, build, fetch
+from .benchmarks import regressions, run_benchmarks
+from .cache import render_cache
+from .choices import AutocompleteSelectMultiple
+from .db import check_connections
+from .forms import MenuForm, ItemForm
+from .history import menu_as_of
+from .loadtest import SITE_MIX, plan_site_load, run_site_load, site_targets
+from .middleware import AsyncWhiteNoiseMiddleware, \
+    PerformanceMiddleware, ReplicaPinMiddleware, TenantMiddleware
+from .models import (ArchivedMenu, ChangeEvent, Menu, MenuCard,
+                     MenuIngredient, MenuVersion, Item, Ingredient,
+                     Restaurant, Webhook, decode_pks, encode_pks)
+from .offload import offload
+from .pagination import encode_cursor
+from .search import restaurant_words, search_items
+from .signals import MenuItems, catalog_changed
+from .tenants import restaurant_id, use_restaurant
+from .templatetags.menu_assets import stylesheets
+from .trash import restore, soft_delete
 
+from asgiref.sync import iscoroutinefunction
+from PIL import Image
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
 import datetime
+import hashlib
+import hmac
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
 
 
 class BaseTest(TestCase):
@@ -14,6 +58,8 @@ class BaseTest(TestCase):
     """
 
     def setUp(self):
+        render_cache().clear()
+        caches['fragments'].clear()
         self.user = User.objects.create_user(
             username='tomika',
             email='example@mail.com',
@@ -72,6 +118,32 @@ class MenuTest(BaseTest):
         # noinspection PyUnresolvedReferences
         self.assertEqual(len(Menu.objects.all()), 2)
 
+    def test_menu_list_filtering_and_ordering(self):
+        """Menu list filtering test
+        1. expired menus are left out
+        2. current menus are ordered by created date (newest first)
+        3. menus without expiration date are ordered by season
+        """
+        today = datetime.date.today()
+        # noinspection PyUnresolvedReferences
+        older = Menu.objects.create(
+            season='Spring', expiration_date=today + datetime.timedelta(1),
+            created_date=timezone.now() - datetime.timedelta(1))
+        # noinspection PyUnresolvedReferences
+        newer = Menu.objects.create(
+            season='Autumn', expiration_date=today + datetime.timedelta(1))
+        # noinspection PyUnresolvedReferences
+        tea = Menu.objects.create(season='Tea')
+        # noinspection PyUnresolvedReferences
+        brunch = Menu.objects.create(season='Brunch')
+
+        resp = self.client.get(reverse('menu:menu_list'))
+        self.assertEqual([card.menu_id for card in resp.context['menus']],
+                         [newer.pk, older.pk])
+        self.assertEqual([card.menu_id for card in resp.context['no_date']],
+                         [brunch.pk, tea.pk])
+        self.assertNotContains(resp, self.menu_1.season)
+
     def test_menu_detail_view(self):
         """Menu detail test
         1. status_code test
@@ -167,6 +239,41 @@ class ItemTest(BaseTest):
         # noinspection PyUnresolvedReferences
         self.assertEqual(len(Item.objects.all()), 2)
 
+    @patch('menu.views.ITEMS_PER_PAGE', 1)
+    def test_item_list_keyset_pagination(self):
+        """Item list pagination test
+        1. pages are ordered by name
+        2. next page cursor continues after the last item
+        3. last page has no next page cursor
+        """
+        resp = self.client.get(reverse('menu:item_list'))
+        self.assertEqual(list(resp.context['items']), [self.item_2])
+        self.assertTrue(resp.context['next_cursor'])
+
+        resp_2 = self.client.get(reverse('menu:item_list'),
+                                 {'after': resp.context['next_cursor']})
+        self.assertEqual(list(resp_2.context['items']), [self.item_1])
+        self.assertIsNone(resp_2.context['next_cursor'])
+
+    def test_item_list_broken_cursor(self):
+        """Item list broken cursor test - falls back to the first page"""
+        resp = self.client.get(reverse('menu:item_list'), {'after': '%%%'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['items']), 2)
+
+    def test_item_list_forged_cursor(self):
+        """Item list forged cursor test - values of the wrong type or null
+        fall back to the first page, on the page and in the API
+        """
+        for values in (['a', 'x'], ['a', None], [['a'], 1]):
+            cursor = encode_cursor(values)
+            resp = self.client.get(reverse('menu:item_list'),
+                                   {'after': cursor})
+            self.assertEqual(len(resp.context['items']), 2, values)
+            resp_2 = self.client.get(reverse('menu:api_items'),
+                                     {'after': encode_cursor(values[1:])})
+            self.assertEqual(resp_2.status_code, 200, values)
+
     def test_item_detail_view(self):
         """Item detail test
         1. status_code test
@@ -243,3 +350,1673 @@ class ItemTest(BaseTest):
         self.assertEqual(len(Item.objects.all()), 1)
         self.assertEqual(resp_2.status_code, 302)
         self.assertRedirects(resp_2, '/menu/items/')
+
+
+class QueryCountTest(BaseTest):
+    """QueryCountTest test class
+    Inherit: - BaseTest
+    - Pins the number of queries of the read and delete confirmation views,
+      so related objects are never loaded one query per row.
+    """
+
+    def test_menu_list_queries(self):
+        """Menu list - ETag + one query per menu card group"""
+        # noinspection PyUnresolvedReferences
+        Menu.objects.update(
+            expiration_date=datetime.date.today() + datetime.timedelta(1))
+        # noinspection PyUnresolvedReferences
+        Menu.objects.create(season='Tea').items.add(self.item_2)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('menu:menu_list'))
+
+    def test_menu_detail_queries(self):
+        """Menu detail - validators + menu card"""
+        self.menu_2.items.add(Item.objects.create(
+            name='Tea', description='Green tea', chef=self.user))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('menu:menu_detail',
+                                    kwargs={'pk': self.menu_2.pk}))
+
+    def test_delete_menu_queries(self):
+        """Delete menu confirmation - menu + items"""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('menu:menu_delete',
+                                    kwargs={'pk': self.menu_2.pk}))
+
+    def test_item_list_queries(self):
+        """Item list - ETag + one query for the page"""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('menu:item_list'))
+
+    def test_item_detail_queries(self):
+        """Item detail - validators + item joined with chef + ingredients"""
+        with self.assertNumQueries(3):
+            self.client.get(reverse('menu:item_detail',
+                                    kwargs={'pk': self.item_2.pk}))
+
+    def test_delete_item_queries(self):
+        """Delete item confirmation - item joined with chef + ingredients"""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('menu:item_delete',
+                                    kwargs={'pk': self.item_2.pk}))
+
+
+class RenderCacheTest(BaseTest):
+    """RenderCacheTest test class
+    Inherit: - BaseTest
+    - Detail pages are served from the render cache until a change moves
+      updated_at of the object.
+    """
+
+    def test_menu_detail_cached(self):
+        """Second menu detail request only looks up the validators"""
+        url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertContains(resp, self.item_2.name)
+
+    def test_item_edit_invalidates_item_and_menu(self):
+        """Renaming an item shows up on its detail page and its menus"""
+        item_url = reverse('menu:item_detail', kwargs={'pk': self.item_2.pk})
+        menu_url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        self.client.get(item_url)
+        self.client.get(menu_url)
+
+        self.item_2.name = 'Cordon bleu'
+        self.item_2.save()
+        self.assertContains(self.client.get(item_url), 'Cordon bleu')
+        self.assertContains(self.client.get(menu_url), 'Cordon bleu')
+
+    def test_ingredient_edit_invalidates_items_and_menus(self):
+        """Renaming an ingredient touches every item and menu using it"""
+        url = reverse('menu:item_detail', kwargs={'pk': self.item_2.pk})
+        self.client.get(url)
+
+        self.ingredient_2.name = 'paprika'
+        self.ingredient_2.save()
+        self.item_2.refresh_from_db()
+        self.menu_2.refresh_from_db()
+        self.assertGreaterEqual(self.item_2.updated_at,
+                                self.ingredient_2.updated_at)
+        self.assertGreaterEqual(self.menu_2.updated_at,
+                                self.ingredient_2.updated_at)
+        self.assertContains(self.client.get(url), 'paprika')
+
+    def test_key_follows_database(self):
+        """A change made by another process (no signal here) is seen"""
+        url = reverse('menu:item_detail', kwargs={'pk': self.item_2.pk})
+        self.client.get(url)
+        # noinspection PyUnresolvedReferences
+        Item.objects.filter(pk=self.item_2.pk).update(
+            name='Cordon bleu', updated_at=timezone.now())
+        self.assertContains(self.client.get(url), 'Cordon bleu')
+
+    def test_login_keeps_pages(self):
+        """Logging in saves last_login only, items are not touched"""
+        self.item_1.refresh_from_db()
+        updated_at = self.item_1.updated_at
+        self.client.login(username='tomika', password='tomika')
+        self.item_1.refresh_from_db()
+        self.assertEqual(self.item_1.updated_at, updated_at)
+
+    def test_m2m_change_invalidates_menu(self):
+        """Removing an item from a menu from the item side"""
+        url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        self.client.get(url)
+        # noinspection PyUnresolvedReferences
+        self.item_2.items.clear()
+        self.assertNotContains(self.client.get(url), self.item_2.name)
+
+    def test_delete_invalidates_menu(self):
+        """Deleting an item drops it from the cached menu page"""
+        url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        self.client.get(url)
+        self.item_2.delete()
+        self.assertNotContains(self.client.get(url), self.item_2.name)
+
+
+class ConditionalGetTest(BaseTest):
+    """ConditionalGetTest test class
+    Inherit: - BaseTest
+    - Read views answer 304 Not Modified from their validators alone.
+    """
+
+    def test_menu_detail_not_modified(self):
+        """Menu detail - 304 until the menu or one of its items changes"""
+        url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        resp = self.client.get(url)
+        self.assertTrue(resp.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            resp_2 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_2.status_code, 304)
+
+        self.item_2.name = 'Cordon bleu'
+        self.item_2.save()
+        resp_3 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_3.status_code, 200)
+
+    def test_item_detail_m2m_change(self):
+        """Item detail - adding an ingredient changes the validators"""
+        url = reverse('menu:item_detail', kwargs={'pk': self.item_1.pk})
+        resp = self.client.get(url)
+        self.item_1.ingredients.add(self.ingredient_2)
+        resp_2 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_2.status_code, 200)
+
+    def test_menu_list_delete_changes_etag(self):
+        """Menu list - deleting a live menu changes the ETag"""
+        # noinspection PyUnresolvedReferences
+        Menu.objects.create(season='Tea')
+        url = reverse('menu:menu_list')
+        resp = self.client.get(url)
+        with self.assertNumQueries(1):
+            resp_2 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_2.status_code, 304)
+
+        # noinspection PyUnresolvedReferences
+        Menu.objects.get(season='Tea').delete()
+        resp_3 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_3.status_code, 200)
+
+    def test_item_list_not_modified(self):
+        """Item list - 304 for the same page"""
+        url = reverse('menu:item_list')
+        resp = self.client.get(url)
+        resp_2 = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp_2.status_code, 304)
+
+
+class MenuCardTest(BaseTest):
+    """MenuCardTest test class
+    Inherit: - BaseTest
+    - Menu cards follow writes on menus, items and ingredients.
+    """
+
+    def test_card_built_on_write(self):
+        """Card holds the items with chef and ingredients sorted by name"""
+        # noinspection PyUnresolvedReferences
+        card = MenuCard.objects.get(pk=self.menu_2.pk)
+        self.assertEqual(card.season, 'Winter')
+        self.assertEqual(card.item_names, ['Gordon bleu', 'Soup'])
+        self.assertEqual(card.items[0]['chef'], 'tomika')
+        self.assertEqual(sorted(card.items[0]['ingredients']),
+                         ['pepper', 'salt'])
+
+    def test_card_follows_ingredient_and_membership(self):
+        """Ingredient rename and item removal reach the card"""
+        self.ingredient_1.name = 'sea salt'
+        self.ingredient_1.save()
+        self.menu_2.items.remove(self.item_2)
+        # noinspection PyUnresolvedReferences
+        card = MenuCard.objects.get(pk=self.menu_2.pk)
+        self.assertEqual(card.item_names, ['Soup'])
+        self.assertEqual(card.items[0]['ingredients'], ['sea salt'])
+
+    def test_card_deleted_with_menu(self):
+        """Deleting a menu removes its card"""
+        self.menu_1.delete()
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(MenuCard.objects.filter(pk=self.menu_1.pk).exists())
+
+    def test_rebuild_menu_cards_command(self):
+        """Rebuild command restores missing cards"""
+        # noinspection PyUnresolvedReferences
+        MenuCard.objects.all().delete()
+        call_command('rebuild_menu_cards', batch_size=1, stdout=StringIO())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(MenuCard.objects.count(), 2)
+
+
+class ApiTest(BaseTest):
+    """ApiTest test class
+    Inherit: - BaseTest
+    - JSON endpoints for menus, items and ingredients.
+    """
+
+    def test_menus_api(self):
+        """Menus come with their item ids and names"""
+        resp = self.client.get(reverse('menu:api_menus'))
+        self.assertEqual(resp.status_code, 200)
+        menu = resp.json()['results'][1]
+        self.assertEqual(menu['season'], 'Winter')
+        self.assertEqual(menu['items'],
+                         [{'id': self.item_2.pk, 'name': 'Gordon bleu'},
+                          {'id': self.item_1.pk, 'name': 'Soup'}])
+
+    def test_items_api_cursor_and_fields(self):
+        """Cursor pagination and field selection"""
+        resp = self.client.get(reverse('menu:api_items'),
+                               {'limit': 1, 'fields': 'id,ingredients'})
+        data = resp.json()
+        self.assertEqual(data['results'], [
+            {'id': self.item_1.pk,
+             'ingredients': [{'id': self.ingredient_1.pk, 'name': 'salt'}]}])
+
+        resp_2 = self.client.get(data['next'])
+        data_2 = resp_2.json()
+        self.assertEqual([row['id'] for row in data_2['results']],
+                         [self.item_2.pk])
+        self.assertIsNone(data_2['next'])
+
+    def test_fields_skip_relations(self):
+        """Relations left out of ?fields= are not loaded"""
+        with self.assertNumQueries(1):
+            self.client.get(reverse('menu:api_items'), {'fields': 'id,name'})
+
+    def test_ingredients_api_stream(self):
+        """Streaming mode returns the whole list as one JSON document"""
+        resp = self.client.get(reverse('menu:api_ingredients'),
+                               {'stream': 1, 'fields': 'name'})
+        self.assertTrue(resp.streaming)
+        data = json.loads(b''.join(resp.streaming_content).decode('utf-8'))
+        self.assertEqual(data['results'],
+                         [{'name': 'salt'}, {'name': 'pepper'}])
+
+    @patch('menu.api.API_STREAM_CHUNK', 1)
+    def test_items_api_stream_chunks(self):
+        """Streaming items in chunks of one row"""
+        resp = self.client.get(reverse('menu:api_items'), {'stream': 1})
+        data = json.loads(b''.join(resp.streaming_content).decode('utf-8'))
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(len(data['results'][1]['ingredients']), 2)
+
+
+class ChangeFeedTest(BaseTest):
+    """ChangeFeedTest test class
+    Inherit: - BaseTest
+    - Change log written on commit, change feed and webhook deliveries.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+        # noinspection PyUnresolvedReferences
+        self.last = ChangeEvent.objects.order_by('pk').last().pk
+
+    def events(self):
+        """Returns list of (model, object_id, action) after setUp"""
+        # noinspection PyUnresolvedReferences
+        return list(ChangeEvent.objects.filter(pk__gt=self.last).order_by(
+            'pk').values_list('model', 'object_id', 'action'))
+
+    def test_changes_coalesced_per_transaction(self):
+        """One event per object and transaction, a delete wins"""
+        item_pk = self.item_1.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            # noinspection PyUnresolvedReferences
+            menu = Menu.objects.create(season='Fall')
+            menu.items.add(self.item_2)
+            self.item_1.delete()
+        self.assertCountEqual(self.events(), [
+            ('menu', menu.pk, 'create'),
+            ('item', item_pk, 'delete'),
+            ('menu', self.menu_1.pk, 'update'),
+            ('menu', self.menu_2.pk, 'update')])
+
+    def test_rollback_records_nothing(self):
+        """Changes of a rolled back transaction are not logged"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    # noinspection PyUnresolvedReferences
+                    Ingredient.objects.create(name='thyme')
+                    raise ValueError
+        self.assertEqual(self.events(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            # noinspection PyUnresolvedReferences
+            ingredient = Ingredient.objects.create(name='sage')
+        self.assertEqual(self.events(),
+                         [('ingredient', ingredient.pk, 'create')])
+
+    def test_feed(self):
+        """Changes since N of the current restaurant, never cached"""
+        url = reverse('menu:api_changes')
+        resp = self.client.get(url)
+        self.assertEqual(resp.json(), {'changes': [], 'last': self.last})
+        self.assertIn('no-cache', resp['Cache-Control'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient_2.save()
+        resp = self.client.get(url, {'since': self.last, 'timeout': 0})
+        data = resp.json()
+        self.assertCountEqual(
+            [(change['model'], change['id'], change['action'])
+             for change in data['changes']],
+            [('ingredient', self.ingredient_2.pk, 'update'),
+             ('item', self.item_2.pk, 'update'),
+             ('menu', self.menu_2.pk, 'update')])
+        self.assertEqual(data['last'], data['changes'][-1]['seq'])
+        # noinspection PyUnresolvedReferences
+        Restaurant.objects.create(name='Other', slug='other')
+        resp = self.client.get('/r/other' + url, {'since': 0, 'timeout': 0})
+        self.assertEqual(resp.json(), {'changes': [], 'last': 0})
+        resp = self.client.get(url, {'since': 'x'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_feed_waits_for_changes(self):
+        """An empty feed is answered at once by sync workers, looked at
+        again until the timeout by gevent ones
+        """
+        empty = {'changes': [], 'last': self.last}
+        feed = {'changes': [{'seq': self.last + 1}], 'last': self.last + 1}
+        with patch('menu.api.changes_since', side_effect=[
+                empty, feed]) as since:
+            resp = self.client.get(reverse('menu:api_changes'),
+                                   {'since': self.last, 'timeout': 5})
+        self.assertEqual(resp.json(), empty)
+        self.assertEqual(since.call_count, 1)
+        with override_settings(MENU_CHANGE_FEED_WAIT=25), \
+                patch('menu.api.CHANGE_POLL_INTERVAL', 0.01), \
+                patch('menu.api.changes_since', side_effect=[
+                    empty, feed]) as since:
+            resp = self.client.get(reverse('menu:api_changes'),
+                                   {'since': self.last, 'timeout': 5})
+        self.assertEqual(resp.json(), feed)
+        self.assertEqual(since.call_count, 2)
+
+    def test_webhook_batches(self):
+        """A burst is delivered coalesced in signed batches, a failed
+        delivery is sent again on the next pass
+        """
+        received = []
+        statuses = [500]
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                received.append((self.headers['X-Menu-Signature'], body))
+                self.send_response(statuses.pop() if statuses else 204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        # noinspection PyUnresolvedReferences
+        webhook = Webhook.objects.create(
+            url='http://127.0.0.1:{}/hook'.format(server.server_port),
+            secret='key', last_sequence=self.last)
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.item_1.save()
+                self.item_2.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient_2.save()
+
+        err = StringIO()
+        call_command('dispatch_webhooks', once=True, settle=0,
+                     batch_size=4, stdout=StringIO(), stderr=err)
+        self.assertIn('delivery failed', err.getvalue())
+        webhook.refresh_from_db()
+        self.assertEqual(webhook.last_sequence, self.last)
+        received.clear()
+
+        call_command('dispatch_webhooks', once=True, settle=0,
+                     batch_size=4, stdout=StringIO())
+        self.assertEqual(len(received), 2)
+        bodies = [json.loads(body) for signature, body in received]
+        for signature, body in received:
+            self.assertEqual(signature, 'sha256=' + hmac.new(
+                b'key', body, hashlib.sha256).hexdigest())
+        # 14 events of 4 objects, then the ingredient
+        self.assertCountEqual(
+            [(change['model'], change['id']) for change in
+             bodies[0]['changes']],
+            [('item', self.item_1.pk), ('item', self.item_2.pk),
+             ('menu', self.menu_1.pk), ('menu', self.menu_2.pk)])
+        self.assertEqual(bodies[1]['changes'], [
+            {'model': 'ingredient', 'id': self.ingredient_2.pk,
+             'action': 'update'}])
+        self.assertEqual(bodies[1]['since'], bodies[0]['last'])
+        webhook.refresh_from_db()
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(webhook.last_sequence,
+                         ChangeEvent.objects.order_by('pk').last().pk)
+        call_command('dispatch_webhooks', once=True, settle=60,
+                     stdout=StringIO())
+        self.assertEqual(len(received), 2)
+
+
+class ArchiveTest(BaseTest):
+    """ArchiveTest test class
+    Inherit: - BaseTest
+    - archive_menus management command.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+            # noinspection PyUnresolvedReferences
+            self.menu_3 = Menu.objects.create(
+                season='Spring',
+                expiration_date=datetime.date.today() + datetime.timedelta(1))
+            self.menu_3.items.add(self.item_2)
+
+    def test_archive_expired(self):
+        """Expired menus and their cards are archived"""
+        out = StringIO()
+        call_command('archive_menus', stdout=out)
+        self.assertIn('Archived 2 menus.', out.getvalue())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(
+            list(Menu.objects.filter(is_active=True).values_list(
+                'pk', flat=True)), [self.menu_3.pk])
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(
+            list(MenuCard.objects.filter(is_active=True).values_list(
+                'pk', flat=True)), [self.menu_3.pk])
+        resp = self.client.get(reverse('menu:menu_list'))
+        self.assertEqual([card.menu_id for card in resp.context['menus']],
+                         [self.menu_3.pk])
+
+        out = StringIO()
+        call_command('archive_menus', stdout=out)
+        self.assertIn('Archived 0 menus.', out.getvalue())
+
+    def test_archive_without_expiration(self):
+        """Menus without expiration date are never archived, archiving a
+        listed menu changes the menu list ETag
+        """
+        # noinspection PyUnresolvedReferences
+        menu = Menu.objects.create(season='Tea')
+        etag = self.client.get(reverse('menu:menu_list'))['ETag']
+        call_command('archive_menus', date=str(
+            datetime.date.today() + datetime.timedelta(7)), stdout=StringIO())
+        menu.refresh_from_db()
+        self.assertTrue(menu.is_active)
+        self.menu_3.refresh_from_db()
+        self.assertFalse(self.menu_3.is_active)
+        resp = self.client.get(reverse('menu:menu_list'))
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertFalse(resp.context['menus'])
+
+    def test_move_old_menus(self):
+        """Menus expired long enough ago move to the archive tables, their
+        rows are deleted without per-instance signals
+        """
+        # noinspection PyUnresolvedReferences
+        Menu.objects.filter(pk=self.menu_2.pk).update(
+            expiration_date=datetime.date.today() - datetime.timedelta(40))
+        deleting = []
+        pre_delete.connect(
+            lambda instance, **kwargs: deleting.append(instance),
+            sender=Menu, weak=False, dispatch_uid='test_move_old_menus')
+        self.addCleanup(pre_delete.disconnect, sender=Menu,
+                        dispatch_uid='test_move_old_menus')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_menus', move_after=30, batch_size=1,
+                         stdout=StringIO())
+        self.assertEqual(deleting, [])
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(MenuCard.objects.filter(pk=self.menu_2.pk).exists())
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(MenuIngredient.objects.filter(
+            menu_id=self.menu_2.pk).exists())
+        self.assertFalse(MenuItems.objects.filter(
+            menu_id=self.menu_2.pk).exists())
+        # noinspection PyUnresolvedReferences
+        self.assertTrue(ChangeEvent.objects.filter(
+            model='menu', object_id=self.menu_2.pk, action='delete').exists())
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(Menu.objects.filter(pk=self.menu_2.pk).exists())
+        # noinspection PyUnresolvedReferences
+        archived = ArchivedMenu.objects.get(pk=self.menu_2.pk)
+        self.assertEqual(archived.season, 'Winter')
+        self.assertEqual(
+            sorted(archived.items.values_list('item_id', flat=True)),
+            [self.item_1.pk, self.item_2.pk])
+        # noinspection PyUnresolvedReferences
+        self.assertTrue(Menu.objects.filter(pk=self.menu_1.pk).exists())
+
+    def test_edit_brings_menu_back(self):
+        """Saving an archived menu with a valid date makes it active"""
+        call_command('archive_menus', stdout=StringIO())
+        resp = self.client.post(
+            reverse('menu:menu_edit', kwargs={'pk': self.menu_1.pk}), {
+                'season': 'Summer',
+                'items': [self.item_1.pk],
+                'expiration_date': datetime.date.today() +
+                datetime.timedelta(3)})
+        self.assertEqual(resp.status_code, 302)
+        self.menu_1.refresh_from_db()
+        self.assertTrue(self.menu_1.is_active)
+        # noinspection PyUnresolvedReferences
+        self.assertTrue(MenuCard.objects.get(pk=self.menu_1.pk).is_active)
+
+class SoftDeleteTest(BaseTest):
+    """SoftDeleteTest test class
+    Inherit: - BaseTest
+    - Soft delete, restore and purge of menus and items.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+
+    def card_items(self, menu):
+        """Returns item names on the card of a menu"""
+        # noinspection PyUnresolvedReferences
+        return MenuCard.objects.get(pk=menu.pk).item_names
+
+    def test_forms_leave_deleted_at_out(self):
+        """Deleting is not an edit, the forms have no deleted_at field"""
+        self.assertNotIn('deleted_at', MenuForm().fields)
+        self.assertNotIn('deleted_at', ItemForm().fields)
+        resp = self.client.get(reverse('menu:item_edit',
+                                       kwargs={'pk': self.item_1.pk}))
+        self.assertNotContains(resp, 'deleted_at')
+
+    def test_delete_item_view(self):
+        """The item is hidden everywhere, its through rows are kept and a
+        delete change is logged
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('menu:item_delete',
+                                            kwargs={'pk': self.item_2.pk}))
+        self.assertRedirects(resp, reverse('menu:item_list'))
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(Item.objects.filter(pk=self.item_2.pk).exists())
+        # noinspection PyUnresolvedReferences
+        self.assertIsNotNone(
+            Item.all_objects.get(pk=self.item_2.pk).deleted_at)
+        self.assertEqual(list(self.menu_2.items.all()), [self.item_1])
+        self.assertTrue(MenuItems.objects.filter(
+            item_id=self.item_2.pk).exists())
+        self.assertEqual(self.card_items(self.menu_2), ['Soup'])
+        self.assertEqual([item.pk for item in search_items('gord')], [])
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(MenuIngredient.objects.filter(
+            ingredient=self.ingredient_2).exists())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(ChangeEvent.objects.filter(
+            object_id=self.item_2.pk, model='item').latest('pk').action,
+            'delete')
+        resp = self.client.get(reverse('menu:item_detail',
+                                       kwargs={'pk': self.item_2.pk}))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_delete_menu_view(self):
+        """The menu and its card are gone, its items are not"""
+        resp = self.client.post(reverse('menu:menu_delete',
+                                        kwargs={'pk': self.menu_2.pk}))
+        self.assertRedirects(resp, reverse('menu:menu_list'))
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(MenuCard.objects.filter(pk=self.menu_2.pk).exists())
+        resp = self.client.get(reverse('menu:menu_detail',
+                                       kwargs={'pk': self.menu_2.pk}))
+        self.assertEqual(resp.status_code, 404)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Item.objects.count(), 2)
+
+    def test_restore(self):
+        """Restoring is one UPDATE, the item is back on its menus"""
+        soft_delete(Item, [self.item_2.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(restore(Item, [self.item_2.pk, self.item_1.pk]),
+                             [self.item_2.pk])
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith(
+                       'UPDATE "menu_item" SET "deleted_at"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.card_items(self.menu_2),
+                         ['Gordon bleu', 'Soup'])
+        self.assertEqual([item.pk for item in search_items('gord')],
+                         [self.item_2.pk])
+
+    def test_purge_deleted(self):
+        """Rows deleted long enough ago are hard deleted in batches"""
+        soft_delete(Item, [self.item_1.pk, self.item_2.pk])
+        soft_delete(Menu, [self.menu_1.pk])
+        out = StringIO()
+        call_command('purge_deleted', stdout=out)
+        self.assertIn('Purged 0 menus and 0 items.', out.getvalue())
+        # noinspection PyUnresolvedReferences
+        Item.all_objects.filter(pk=self.item_1.pk).update(
+            deleted_at=timezone.now() - datetime.timedelta(31))
+        # noinspection PyUnresolvedReferences
+        Menu.all_objects.update(
+            deleted_at=timezone.now() - datetime.timedelta(31))
+        out = StringIO()
+        call_command('purge_deleted', batch_size=1, stdout=out)
+        self.assertIn('Purged 2 menus and 1 items.', out.getvalue())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(list(Item.all_objects.values_list('pk', flat=True)),
+                         [self.item_2.pk])
+        self.assertFalse(MenuItems.objects.exists())
+
+    def test_chef_deleted(self):
+        """Deleting a chef soft deletes their items in one UPDATE, they
+        are not restored without a chef
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+        self.assertFalse([query['sql'] for query in queries.captured_queries
+                          if query['sql'].startswith((
+                              'DELETE FROM "menu_item',
+                              'DELETE FROM "menu_menu_items"'))])
+        # noinspection PyUnresolvedReferences
+        items = Item.all_objects.order_by('pk')
+        self.assertEqual([(item.chef_id, item.deleted_at is None)
+                          for item in items], [(None, False)] * 2)
+        self.assertEqual(self.card_items(self.menu_2), [])
+        self.assertEqual(restore(Item, [self.item_1.pk]), [])
+
+
+class MenuHistoryTest(BaseTest):
+    """MenuHistoryTest test class
+    Inherit: - BaseTest
+    - Menu versions recorded on commit and point-in-time reads.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+
+    def versions(self, menu):
+        """Returns list of the versions of a menu, oldest first"""
+        # noinspection PyUnresolvedReferences
+        return list(MenuVersion.objects.filter(menu=menu).select_related(
+            'base').order_by('pk'))
+
+    def test_encode_pks(self):
+        """Sorted pks are stored as base 36 gaps"""
+        self.assertEqual(encode_pks([40, 3, 8, 7]), '3,4,1,w')
+        self.assertEqual(decode_pks(encode_pks(range(1, 2000, 7))),
+                         set(range(1, 2000, 7)))
+        self.assertEqual(decode_pks(''), set())
+
+    def test_versions_recorded_on_commit(self):
+        """Only changes of the versioned state are recorded, once per
+        transaction
+        """
+        self.assertEqual(self.versions(self.menu_2)[-1].item_pks,
+                         {self.item_1.pk, self.item_2.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient_1.name = 'sea salt'
+            self.ingredient_1.save()
+        self.assertEqual(len(self.versions(self.menu_2)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.menu_2.season = 'Fall'
+                self.menu_2.save()
+                self.menu_2.items.remove(self.item_1)
+        versions = self.versions(self.menu_2)
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(versions[-1].season, 'Fall')
+        self.assertEqual(versions[-1].item_pks, {self.item_2.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.menu_2.items.add(self.item_1)
+                    raise ValueError
+        self.assertEqual(len(self.versions(self.menu_2)), 2)
+
+    def test_point_in_time_reads(self):
+        """Any version is rebuilt from two rows, in two queries"""
+        # noinspection PyUnresolvedReferences
+        items = [Item.objects.create(name='Dish {}'.format(number),
+                                     description='-', chef=self.user)
+                 for number in range(8)]
+        for item in items:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.menu_2.items.add(item)
+        for item in items[:3]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.menu_2.items.remove(item)
+        versions = self.versions(self.menu_2)
+        self.assertEqual(len(versions), 12)
+        self.assertTrue(any(version.base_id for version in versions))
+        self.assertTrue(all(version.base is None or
+                            version.base.base_id is None
+                            for version in versions))
+        for added, version in enumerate(versions[:9]):
+            with self.assertNumQueries(2):
+                found, found_items = menu_as_of(self.menu_2.pk,
+                                                version.recorded_at)
+            self.assertEqual(found.pk, version.pk)
+            self.assertEqual({item.pk for item in found_items},
+                             {self.item_1.pk, self.item_2.pk} |
+                             {item.pk for item in items[:added]})
+        version, found_items = menu_as_of(self.menu_2.pk)
+        self.assertEqual(len(found_items), 7)
+        self.assertIsNone(menu_as_of(
+            self.menu_2.pk, versions[0].recorded_at -
+            datetime.timedelta(seconds=1)))
+
+    def test_deleted_menu(self):
+        """A soft deleted menu is gone from then on, not before"""
+        before = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete(Menu, [self.menu_1.pk])
+        self.assertIsNone(menu_as_of(self.menu_1.pk))
+        version, items = menu_as_of(self.menu_1.pk, before)
+        self.assertEqual(version.season, 'Summer')
+        self.assertEqual(items, [self.item_1])
+
+    def test_history_view(self):
+        """The page and the API read the menu as of ?at="""
+        url = reverse('menu:menu_history', kwargs={'pk': self.menu_2.pk})
+        before = self.versions(self.menu_2)[0].recorded_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_2.items.remove(self.item_2)
+        resp = self.client.get(url)
+        self.assertTemplateUsed(resp, 'menu/menu_history.html')
+        self.assertNotContains(resp, 'Gordon bleu')
+        self.assertEqual(len(resp.context['versions']), 2)
+        resp = self.client.get(url, {'at': before.isoformat()})
+        self.assertContains(resp, 'Gordon bleu')
+        resp = self.client.get(url, {'at': 'July 4th'})
+        self.assertEqual(resp.status_code, 400)
+
+        url = reverse('menu:api_menu_history',
+                      kwargs={'pk': self.menu_2.pk})
+        resp = self.client.get(url, {'at': before.isoformat()})
+        self.assertEqual([item['name'] for item in resp.json()['items']],
+                         ['Gordon bleu', 'Soup'])
+        resp = self.client.get(url, {'at': '2000-01-01'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_backfill(self):
+        """Menus from before the history get a version as of their
+        creation
+        """
+        backfill = import_module(
+            'menu.migrations.0015_backfill_menu_versions')
+        # noinspection PyUnresolvedReferences
+        MenuVersion.objects.filter(menu=self.menu_2).delete()
+        backfill.backfill_versions(apps, None)
+        versions = self.versions(self.menu_2)
+        self.assertEqual(len(versions), 1)
+        self.assertEqual(versions[0].recorded_at, self.menu_2.created_date)
+        self.assertEqual(versions[0].item_pks,
+                         {self.item_1.pk, self.item_2.pk})
+        self.assertEqual(len(self.versions(self.menu_1)), 1)
+
+    def test_menu_without_versions(self):
+        """Menus written around the signals get a first version on read"""
+        # noinspection PyUnresolvedReferences
+        Menu.objects.bulk_create([Menu(season='Tea')])
+        # noinspection PyUnresolvedReferences
+        menu = Menu.objects.get(season='Tea')
+        resp = self.client.get(reverse('menu:menu_history',
+                                       kwargs={'pk': menu.pk}))
+        self.assertContains(resp, 'Tea')
+        self.assertEqual(len(self.versions(menu)), 1)
+
+
+class MenuFormVersionTest(TransactionTestCase):
+    """MenuFormVersionTest test class
+    Inherit: - TransactionTestCase, the versions are recorded as each
+               transaction commits
+    - Form edits of a menu.
+    """
+    setUp = BaseTest.setUp
+    versions = MenuHistoryTest.versions
+
+    def test_form_edit_records_one_version(self):
+        """The menu and its items are saved in one transaction"""
+        recorded = len(self.versions(self.menu_2))
+        resp = self.client.post(
+            reverse('menu:menu_edit', kwargs={'pk': self.menu_2.pk}), {
+                'season': 'Fall',
+                'items': [self.item_2.pk],
+                'expiration_date': datetime.date.today() +
+                datetime.timedelta(3)})
+        self.assertEqual(resp.status_code, 302)
+        versions = self.versions(self.menu_2)
+        self.assertEqual(len(versions), recorded + 1)
+        self.assertEqual(versions[-1].season, 'Fall')
+        self.assertEqual(versions[-1].item_pks, {self.item_2.pk})
+
+
+class MenuBulkEditTest(BaseTest):
+    """MenuBulkEditTest test class
+    Inherit: - BaseTest
+    - bulk_edit_menus view.
+    """
+
+    def post(self, changes):
+        """Posts the changes, returns response and captured queries"""
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(reverse('menu:menu_bulk_edit'),
+                                    {'changes': json.dumps(changes)})
+        return resp, [query['sql'] for query in queries.captured_queries]
+
+    def test_bulk_edit(self):
+        """Diffs of many menus are applied with one INSERT and one DELETE
+        on the through table and one catalog_changed per menu
+        """
+        sent = []
+
+        def receiver(sender, menus, **kwargs):
+            sent.append(sorted(menus))
+        catalog_changed.connect(receiver)
+        self.addCleanup(catalog_changed.disconnect, receiver)
+        expiration = datetime.date.today() + datetime.timedelta(10)
+        resp, queries = self.post([
+            {'menu': self.menu_1.pk, 'add': [self.item_2.pk, self.item_1.pk],
+             'expiration_date': str(expiration)},
+            {'menu': self.menu_2.pk, 'season': 'Fall',
+             'remove': [self.item_1.pk]},
+        ])
+        self.assertRedirects(resp, reverse('menu:menu_list'))
+        self.assertEqual(sent, [[self.menu_1.pk], [self.menu_2.pk]])
+        through = '"{}"'.format(Menu.items.through._meta.db_table)
+        writes = [sql.split()[0] for sql in queries
+                  if through in sql.split('(')[0] and
+                  not sql.startswith('SELECT')]
+        self.assertEqual(writes, ['INSERT', 'DELETE'])
+
+        self.menu_1.refresh_from_db()
+        self.assertEqual(self.menu_1.expiration_date, expiration)
+        self.assertEqual(sorted(self.menu_1.items.values_list('pk', flat=True)),
+                         [self.item_1.pk, self.item_2.pk])
+        # noinspection PyUnresolvedReferences
+        card = MenuCard.objects.get(pk=self.menu_2.pk)
+        self.assertEqual(card.season, 'Fall')
+        self.assertEqual(card.item_names, ['Gordon bleu'])
+
+    def test_bulk_edit_invalid(self):
+        """Invalid changes are rejected and nothing is written"""
+        for changes in ([{'menu': self.menu_1.pk,
+                          'remove': [self.item_1.pk]}],
+                        [{'menu': self.menu_2.pk, 'season': 'Fall'},
+                         {'menu': 0, 'add': [self.item_1.pk]}],
+                        [{'menu': self.menu_2.pk, 'add': ['x']}],
+                        [{'menu': self.menu_2.pk,
+                          'expiration_date': '2000-01-01'}],
+                        {'menu': self.menu_2.pk}):
+            resp, queries = self.post(changes)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.context['form'].errors)
+        self.menu_2.refresh_from_db()
+        self.assertEqual(self.menu_2.season, 'Winter')
+        self.assertEqual(self.menu_1.items.count(), 1)
+
+class RestaurantTest(BaseTest):
+    """RestaurantTest test class
+    Inherit: - BaseTest
+    - Requests only see the rows of the restaurant of their path prefix or
+      host, the rows of BaseTest belong to the default restaurant.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # noinspection PyUnresolvedReferences
+        self.harbor = Restaurant.objects.create(
+            name='Harbor', slug='harbor', host='harbor.example.com')
+        with use_restaurant(self.harbor.pk):
+            # noinspection PyUnresolvedReferences
+            self.harbor_item = Item.objects.create(
+                name='Soup', description='Fish soup of the day',
+                chef=self.user)
+            # noinspection PyUnresolvedReferences
+            self.harbor_menu = Menu.objects.create(season='Harbor')
+            self.harbor_menu.items.add(self.harbor_item)
+
+    def test_path_prefix(self):
+        """/r/<slug>/ lists the restaurant menus and keeps the prefix"""
+        resp = self.client.get('/r/harbor/')
+        self.assertEqual([card.menu_id for card in resp.context['no_date']],
+                         [self.harbor_menu.pk])
+        self.assertContains(resp, '/r/harbor/menu/{}/'.format(
+            self.harbor_menu.pk))
+        # noinspection PyUnresolvedReferences
+        Menu.objects.create(season='Tea')
+        resp = self.client.get('/')
+        self.assertNotContains(resp, 'Harbor')
+        self.assertEqual(self.client.get('/r/nowhere/').status_code, 404)
+        self.assertEqual(reverse('menu:menu_list'), '/')
+
+    @override_settings(ALLOWED_HOSTS=['.example.com', 'testserver'])
+    def test_host(self):
+        """Host names select their restaurant, rows of others are 404"""
+        url = reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        resp = self.client.get(url, HTTP_HOST='harbor.example.com')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(reverse('menu:item_list'),
+                               HTTP_HOST='harbor.example.com')
+        self.assertEqual(list(resp.context['items']), [self.harbor_item])
+        resp = self.client.get(reverse('menu:item_list'),
+                               HTTP_HOST='other.example.com')
+        self.assertNotIn(self.harbor_item, resp.context['items'])
+
+    def test_search_and_choices(self):
+        """Search and form choices stay in the restaurant"""
+        resp = self.client.get('/r/harbor/menu/search/', {'q': 'soup'})
+        self.assertEqual(resp.context['items'], [self.harbor_item])
+        resp = self.client.get(reverse('menu:search'), {'q': 'soup'})
+        self.assertEqual(resp.context['items'], [self.item_1])
+        resp = self.client.get('/r/harbor/menu/new/')
+        self.assertEqual(
+            [pk for pk, label in resp.context['form'].fields['items'].choices],
+            [self.harbor_item.pk])
+
+    def test_write(self):
+        """Rows created under a prefix belong to its restaurant"""
+        self.client.login(username='tomika', password='tomika')
+        resp = self.client.post('/r/harbor/menu/item/new/', {
+            'name': 'Chowder',
+            'description': 'Clam chowder with bread',
+            'chef': self.user.pk,
+            'ingredients': [self.ingredient_1.pk, self.ingredient_2.pk]})
+        self.assertEqual(resp.status_code, 200)
+        with use_restaurant(self.harbor.pk):
+            # noinspection PyUnresolvedReferences
+            ingredients = [Ingredient.objects.create(name=name).pk
+                           for name in ('clam', 'cream')]
+        resp = self.client.post('/r/harbor/menu/item/new/', {
+            'name': 'Chowder',
+            'description': 'Clam chowder with bread',
+            'chef': self.user.pk,
+            'ingredients': ingredients})
+        # noinspection PyUnresolvedReferences
+        item = Item.objects.get(name='Chowder')
+        self.assertEqual(item.restaurant_id, self.harbor.pk)
+        self.assertRedirects(resp, '/r/harbor/menu/item/{}/'.format(item.pk))
+
+    def test_import_restaurant(self):
+        """import_menu writes to the --restaurant"""
+        stream = StringIO(json.dumps({
+            'item': 'Soup', 'description': 'Fish soup of the day',
+            'chef': 'tomika', 'ingredients': ['salt', 'fish']}) + '\n')
+        with patch('sys.stdin', stream):
+            call_command('import_menu', '-', format='jsonl',
+                         restaurant='harbor', stdout=StringIO())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(
+            Ingredient.objects.get(name='fish').restaurant_id, self.harbor.pk)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Ingredient.objects.filter(name='salt').count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('import_menu', '-', restaurant='nowhere',
+                         format='jsonl', stdout=StringIO())
+
+    def test_archive_keeps_restaurant(self):
+        """Moved menus and their items stay in their restaurant"""
+        # noinspection PyUnresolvedReferences
+        Menu.objects.filter(pk=self.harbor_menu.pk).update(
+            is_active=False,
+            expiration_date=datetime.date.today() - datetime.timedelta(40))
+        call_command('archive_menus', move_after=30, stdout=StringIO())
+        with use_restaurant(self.harbor.pk):
+            # noinspection PyUnresolvedReferences
+            archived = ArchivedMenu.objects.get()
+            self.assertEqual(archived.pk, self.harbor_menu.pk)
+            self.assertEqual(list(archived.items.values_list(
+                'restaurant_id', 'item_id')),
+                [(self.harbor.pk, self.harbor_item.pk)])
+        with use_restaurant(restaurant_id()):
+            # noinspection PyUnresolvedReferences
+            self.assertFalse(ArchivedMenu.objects.exists())
+
+class CatalogCommandTest(BaseTest):
+    """CatalogCommandTest test class
+    Inherit: - BaseTest
+    - import_menu / export_menu management commands.
+    """
+
+    def write_file(self, suffix, content):
+        """Writes a temporary input file, returns its path"""
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_csv(self):
+        """CSV import reuses ingredients, creates items and menus"""
+        expiration = datetime.date.today() + datetime.timedelta(30)
+        path = self.write_file('.csv', (
+            'menu,expiration_date,item,description,chef,standard,ingredients\n'
+            'Spring,{0},Salad,Green garden salad,tomika,true,salt|lettuce\n'
+            'Spring,{0},Soup,Chicken soup,tomika,false,salt|pepper\n'
+            ',,Tea,Cup of green tea,tomika,false,tea|water\n'
+        ).format(expiration))
+        out = StringIO()
+        call_command('import_menu', path, stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+
+        # noinspection PyUnresolvedReferences
+        menu = Menu.objects.get(season='Spring')
+        self.assertEqual(menu.expiration_date, expiration)
+        self.assertEqual(sorted(str(item) for item in menu.items.all()),
+                         ['Salad', 'Soup'])
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Ingredient.objects.filter(name='salt').count(), 1)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Item.objects.filter(name='Soup').count(), 1)
+        # noinspection PyUnresolvedReferences
+        self.assertTrue(Item.objects.get(name='Salad').standard)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(MenuCard.objects.get(pk=menu.pk).item_names,
+                         ['Salad', 'Soup'])
+
+    def test_import_applies_form_rules(self):
+        """A row breaking the ItemForm rules rolls back the whole import"""
+        path = self.write_file('.jsonl', '\n'.join([
+            json.dumps({'item': 'Pie', 'description': 'Apple pie with cream',
+                        'chef': 'tomika', 'ingredients': ['apple', 'cream']}),
+            json.dumps({'item': 'Salt', 'description': 'Salt',
+                        'chef': 'tomika', 'ingredients': ['salt', 'water']}),
+        ]))
+        with self.assertRaises(CommandError):
+            call_command('import_menu', path, stdout=StringIO())
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(Item.objects.filter(name='Pie').exists())
+
+        err = StringIO()
+        call_command('import_menu', path, skip_invalid=True,
+                     stdout=StringIO(), stderr=err)
+        self.assertIn('Row 2', err.getvalue())
+        # noinspection PyUnresolvedReferences
+        self.assertTrue(Item.objects.filter(name='Pie').exists())
+
+    def test_export_jsonl(self):
+        """Export writes one row per menu item"""
+        out = StringIO()
+        call_command('export_menu', format='jsonl', stdout=out,
+                     stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[-1]['menu'], 'Winter')
+        self.assertEqual(rows[-1]['ingredients'], ['pepper', 'salt'])
+
+    def test_export_leaves_deleted_out(self):
+        """Soft deleted menus and items, and the items of a deleted chef,
+        are not exported, items left on deleted menus only are
+        """
+        soft_delete(Menu, [self.menu_1.pk])
+        # noinspection PyUnresolvedReferences
+        item = Item.objects.create(name='Tea', description='Cup of tea',
+                                   chef=User.objects.create(username='ana'))
+        self.menu_1.items.add(item)
+        soft_delete(Item, [self.item_2.pk])
+        out = StringIO()
+        call_command('export_menu', format='jsonl', stdout=out,
+                     stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(row['menu'], row['item'], row['chef'])
+                          for row in rows],
+                         [('Winter', 'Soup', 'tomika'), ('', 'Tea', 'ana')])
+
+        self.user.delete()
+        out = StringIO()
+        call_command('export_menu', format='jsonl', stdout=out,
+                     stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['item'] for row in rows], ['Tea'])
+
+
+class FormChoicesTest(BaseTest):
+    """FormChoicesTest test class
+    Inherit: - BaseTest
+    - Cached choices and autocomplete widgets of MenuForm and ItemForm.
+    """
+
+    def test_choices_cached_between_requests(self):
+        """Second new item page only looks up the keys of the chef and
+        ingredient choices
+        """
+        url = reverse('menu:item_new')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            resp = self.client.get(url)
+        self.assertContains(resp, 'pepper')
+
+    def test_choices_invalidated(self):
+        """New ingredient and new item show up in the forms"""
+        ItemForm().as_p()
+        MenuForm().as_p()
+        # noinspection PyUnresolvedReferences
+        Ingredient.objects.create(name='basil')
+        self.assertIn('basil', ItemForm().as_p())
+        # noinspection PyUnresolvedReferences
+        Item.objects.create(name='Pesto', description='Basil pesto',
+                            chef=self.user)
+        self.assertIn('Pesto', MenuForm().as_p())
+
+    def test_choices_follow_database(self):
+        """The key comes from the rows, not from a per process counter"""
+        ItemForm().as_p()
+        # noinspection PyUnresolvedReferences
+        Ingredient.objects.filter(pk=self.ingredient_2.pk).update(
+            name='paprika', updated_at=timezone.now())
+        self.assertIn('paprika', ItemForm().as_p())
+
+    def test_year_range_per_form(self):
+        """Expiration years start with the current year"""
+        years = MenuForm().fields['expiration_date'].widget.years
+        self.assertEqual(years[0], datetime.date.today().year)
+        self.assertEqual(len(years), 3)
+
+    @override_settings(MENU_AUTOCOMPLETE_THRESHOLD=1)
+    def test_autocomplete_widget(self):
+        """Big catalogs only render the selected options"""
+        form = ItemForm(instance=self.item_1)
+        self.assertIsInstance(form.fields['ingredients'].widget,
+                              AutocompleteSelectMultiple)
+        html = str(form['ingredients'])
+        self.assertIn('salt', html)
+        self.assertNotIn('pepper', html)
+        self.assertIn(reverse('menu:autocomplete',
+                              kwargs={'kind': 'ingredients'}), html)
+
+    def test_autocomplete_view(self):
+        """Prefix search endpoint"""
+        resp = self.client.get(reverse('menu:autocomplete',
+                                       kwargs={'kind': 'ingredients'}),
+                               {'q': 'pe'})
+        self.assertEqual(resp.json()['results'],
+                         [{'id': self.ingredient_2.pk, 'text': 'pepper'}])
+        resp_2 = self.client.get(reverse('menu:autocomplete',
+                                         kwargs={'kind': 'menus'}))
+        self.assertEqual(resp_2.status_code, 404)
+
+
+class SearchTest(BaseTest):
+    """SearchTest test class
+    Inherit: - BaseTest
+    - Item search on the database full-text index and on the in-process
+      trigram fallback.
+    """
+
+    def assertFinds(self, query, items):
+        """Search returns exactly the items"""
+        self.assertEqual(
+            sorted(item.pk for item in search_items(query)),
+            sorted(item.pk for item in items))
+
+    def check_search(self):
+        """Name, description and ingredient prefixes, kept in sync"""
+        self.assertFinds('sou', [self.item_1])
+        self.assertFinds('chick', [self.item_1])
+        self.assertFinds('pepp', [self.item_2])
+        self.assertFinds('salt', [self.item_1, self.item_2])
+        self.assertFinds('salt gord', [self.item_2])
+        self.assertFinds('peanut', [])
+        self.assertFinds('s', [])
+
+        self.item_1.ingredients.add(self.ingredient_2)
+        self.assertFinds('pepp', [self.item_1, self.item_2])
+        self.ingredient_2.name = 'peanuts'
+        self.ingredient_2.save()
+        self.assertFinds('peanut', [self.item_1, self.item_2])
+        self.item_2.delete()
+        self.assertFinds('peanut', [self.item_1])
+
+    def test_database_search(self):
+        """FTS5 (SQLite) / tsvector (PostgreSQL)"""
+        self.check_search()
+
+    def test_prefix_index_sizes(self):
+        """Query words of 2 to 4 letters have an FTS5 prefix index"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master "
+                           "WHERE name = 'menu_item_fts'")
+            sql = cursor.fetchone()[0]
+        sizes = set(map(int, re.search(r"prefix='([\d ]+)'", sql).group(
+            1).split()))
+        for word in ('so', 'sou', 'soup'):
+            self.assertIn(len(restaurant_words(restaurant_id(), word)),
+                          sizes)
+
+    @override_settings(MENU_SEARCH_BACKEND='menu.search.TrigramSearch')
+    def test_trigram_search(self):
+        """In-process trigram index"""
+        self.check_search()
+
+    def test_search_view(self):
+        """Search page lists matching items"""
+        resp = self.client.get(reverse('menu:search'), {'q': 'pepper'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'menu/search.html')
+        self.assertContains(resp, self.item_2.name)
+        self.assertNotContains(resp, self.item_1.name)
+
+
+class IngredientIndexTest(BaseTest):
+    """IngredientIndexTest test class
+    Inherit: - BaseTest
+    - Ingredient -> menus reverse index and its queries.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # noinspection PyUnresolvedReferences
+        Menu.objects.update(expiration_date=None)
+
+    def index(self):
+        """Returns set of (ingredient name, menu season, items) rows"""
+        # noinspection PyUnresolvedReferences
+        return set(MenuIngredient.objects.values_list(
+            'ingredient__name', 'menu__season', 'items'))
+
+    def test_index_follows_both_through_tables(self):
+        """Index rows follow item and ingredient membership"""
+        self.assertEqual(self.index(), {('salt', 'Summer', 1),
+                                        ('salt', 'Winter', 2),
+                                        ('pepper', 'Winter', 1)})
+        self.item_1.ingredients.add(self.ingredient_2)
+        self.menu_2.items.remove(self.item_2)
+        self.assertEqual(self.index(), {('salt', 'Summer', 1),
+                                        ('pepper', 'Summer', 1),
+                                        ('salt', 'Winter', 1),
+                                        ('pepper', 'Winter', 1)})
+        self.item_1.delete()
+        self.assertEqual(self.index(), set())
+
+    def test_set_queries(self):
+        """containing() / free_of() on live menus"""
+        # noinspection PyUnresolvedReferences
+        live = Menu.objects.live()
+        self.assertEqual(set(live.containing(['pepper'])), {self.menu_2})
+        self.assertEqual(set(live.free_of(['pepper', 'nuts'])),
+                         {self.menu_1})
+        self.assertEqual(set(live.free_of(['salt'])), set())
+
+    def test_expired_menus_left_out(self):
+        """Expired menus are not live"""
+        # noinspection PyUnresolvedReferences
+        Menu.objects.filter(pk=self.menu_2.pk).update(
+            expiration_date=datetime.date.today())
+        # noinspection PyUnresolvedReferences
+        self.assertFalse(Menu.objects.live().containing(['pepper']).exists())
+
+    def test_ingredient_menus_view(self):
+        """View answers from the index"""
+        url = reverse('menu:ingredient_menus')
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, {'free_of': 'pepper, nuts'})
+        self.assertEqual(list(resp.context['menus']), [self.menu_1])
+        self.assertContains(resp, 'Summer')
+
+
+class FragmentCacheTest(BaseTest):
+    """FragmentCacheTest test class
+    Inherit: - BaseTest
+    - Rows of the list pages are cached per object version.
+    """
+
+    def test_item_rows_follow_updated_at(self):
+        """A row is rendered again only when its item is saved"""
+        url = reverse('menu:item_list')
+        self.client.get(url)
+        # noinspection PyUnresolvedReferences
+        Item.objects.filter(pk=self.item_1.pk).update(name='Stale')
+        self.assertNotContains(self.client.get(url), 'Stale')
+        self.item_1.name = 'Fresh'
+        self.item_1.save()
+        self.assertContains(self.client.get(url), 'Fresh')
+
+    def test_menu_rows_per_user_variant(self):
+        """Authenticated users get their own rows with the buttons"""
+        url = reverse('menu:menu_list')
+        self.menu_1.expiration_date = None
+        self.menu_1.save()
+        self.assertNotContains(self.client.get(url), 'Delete')
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(url), 'Delete')
+
+
+class StaticBuildTest(TestCase):
+    """StaticBuildTest test class
+    Inherit: - TestCase
+    - CSS bundle and WebP images of build_static.
+    """
+
+    def setUp(self):
+        self.assets = tempfile.mkdtemp()
+        self.build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.assets)
+        self.addCleanup(shutil.rmtree, self.build_dir)
+        os.makedirs(os.path.join(self.assets, 'css'))
+        os.makedirs(os.path.join(self.assets, 'images'))
+        Image.new('RGB', (100, 50)).save(
+            os.path.join(self.assets, 'images', 'back.jpg'))
+        with open(os.path.join(self.assets, 'css', 'site.css'), 'w') as css:
+            css.write("body { background-image: url('../images/back.jpg'); }")
+
+    def test_bundle_with_webp_variants(self):
+        """Backgrounds get a WebP image-set and resized variants"""
+        with override_settings(STATICFILES_DIRS=[self.assets]):
+            result = build(self.build_dir, 'css/bundle.css',
+                           (('css/site.css', None),), widths=(40, 200))
+        self.assertEqual(result['images'], 2)
+        for name in ('back.webp', 'back-40w.webp'):
+            self.assertTrue(os.path.exists(
+                os.path.join(self.build_dir, 'images', name)))
+        with open(result['bundle']) as stream:
+            css = stream.read()
+        self.assertIn('image-set(url("../images/back.webp") '
+                      'type("image/webp")', css)
+        self.assertIn('@media (max-width: 40px) { body {', css)
+
+    def test_vendored_file_checked(self):
+        """Vendored files must match their integrity hash"""
+        with self.assertRaises(AssetError):
+            fetch('https://example.com/a.css', None, self.build_dir)
+        integrity = 'sha384-AAAA'
+        path = os.path.join(self.build_dir, 'vendor', 'sha384-{}'.format(
+            hashlib.md5(b'AAAA').hexdigest()))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as stream:
+            stream.write('body {}')
+        with self.assertRaises(AssetError):
+            fetch('https://example.com/a.css', integrity, self.build_dir)
+
+    def test_sources_linked_without_bundle(self):
+        """Every source is linked when the bundle is not used"""
+        html = stylesheets()
+        self.assertIn('integrity="sha384-', html)
+        self.assertIn('/static/css/my_css.css', html)
+        self.assertNotIn('site.css', html)
+
+    @override_settings(MENU_USE_CSS_BUNDLE=True)
+    def test_missing_bundle_fails(self):
+        """A bundle which was not collected is an error, not CDN links"""
+        with self.assertRaises(ImproperlyConfigured):
+            stylesheets()
+
+
+class ConnectionHealthCheckTest(TransactionTestCase):
+    """ConnectionHealthCheckTest test class
+    Inherit: - TransactionTestCase
+    - Persistent connections are checked before the first query of a
+      request.
+    """
+
+    def setUp(self):
+        connection.ensure_connection()
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+        self.addCleanup(connection.settings_dict.pop, 'CONN_HEALTH_CHECKS')
+
+    def test_broken_connection_closed(self):
+        """Only an unusable connection is closed, before its first query"""
+        with patch.object(connection, 'close') as close:
+            with patch.object(connection, 'is_usable', return_value=True):
+                check_connections()
+                connection.ensure_connection()
+            close.assert_not_called()
+            with patch.object(connection, 'is_usable', return_value=False):
+                check_connections()
+                close.assert_not_called()
+                connection.ensure_connection()
+            close.assert_called_once_with()
+
+    def test_checked_once_on_use(self):
+        """Requests without queries are not checked, others once"""
+        with patch.object(connection, 'is_usable',
+                          return_value=True) as is_usable:
+            check_connections()
+            is_usable.assert_not_called()
+            with connection.cursor():
+                pass
+            with connection.cursor():
+                pass
+        is_usable.assert_called_once_with()
+
+    def test_disabled_without_setting(self):
+        """Databases without CONN_HEALTH_CHECKS are not pinged"""
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = False
+        with patch.object(connection, 'is_usable') as is_usable:
+            check_connections()
+            connection.ensure_connection()
+        is_usable.assert_not_called()
+
+
+@override_settings(ROOT_URLCONF='mysite.urls_async')
+class AsyncViewsTest(TransactionTestCase):
+    """AsyncViewsTest test class
+    Inherit: - TransactionTestCase, queries run in the offload threads
+               (own connections), so the data is committed
+    - Async read views of the ASGI entry point.
+    """
+    setUp = BaseTest.setUp
+
+    async def test_read_views(self):
+        """Same pages and validators as the sync views"""
+        for url, text in ((reverse('menu:menu_list'), 'Add Menu'),
+                          (reverse('menu:menu_detail',
+                                   kwargs={'pk': self.menu_2.pk}), 'Soup'),
+                          (reverse('menu:item_list'), 'Gordon bleu'),
+                          (reverse('menu:item_detail',
+                                   kwargs={'pk': self.item_1.pk}), 'salt')):
+            resp = await self.async_client.get(url)
+            self.assertContains(resp, text)
+            # AsyncClient takes header names, not META keys
+            resp = await self.async_client.get(
+                url, **{'if-none-match': resp['ETag']})
+            self.assertEqual(resp.status_code, 304, url)
+
+    async def test_change_feed(self):
+        """The long poll waits without a thread, changes are committed"""
+        url = reverse('menu:api_changes')
+        resp = await self.async_client.get(url)
+        last = resp.json()['last']
+        self.assertIn('no-cache', resp['Cache-Control'])
+        # noinspection PyUnresolvedReferences
+        ingredient = await offload(Ingredient.objects.create, name='thyme')
+        # AsyncClient of Django 3.2 drops the data of a GET
+        resp = await self.async_client.get(
+            '{}?since={}&timeout=1'.format(url, last))
+        self.assertEqual(
+            [(change['model'], change['id'], change['action'])
+             for change in resp.json()['changes']],
+            [('ingredient', ingredient.pk, 'create')])
+
+    async def test_missing_item(self):
+        """Http404 raised in an offload thread"""
+        resp = await self.async_client.get(
+            reverse('menu:item_detail', kwargs={'pk': 999}))
+        self.assertEqual(resp.status_code, 404)
+
+    async def test_offload_closes_connection(self):
+        """Without CONN_MAX_AGE the thread does not keep its connection"""
+        def query():
+            # noinspection PyUnresolvedReferences
+            Item.objects.count()
+            return connection
+        used = await offload(query)
+        self.assertIsNone(used.connection)
+
+
+class PerformanceMiddlewareTest(BaseTest):
+    """PerformanceMiddlewareTest test class
+    Inherit: - BaseTest
+    - Per-request timings, JSON logs and Server-Timing.
+    """
+
+    @override_settings(MENU_PERF_SLOW_MS=0)
+    def test_slow_request_logged_with_sql(self):
+        """JSON log line with the SQL of slow requests, Server-Timing"""
+        with self.assertLogs('menu.perf', 'WARNING') as logs:
+            resp = self.client.get(reverse('menu:menu_list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'menu:menu_list')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['db_queries'], 3)
+        self.assertEqual(len(record['sql']), 3)
+        self.assertEqual(record['bytes'], len(resp.content))
+        self.assertGreater(record['template_ms'], 0)
+        self.assertIn('db;dur=', resp['Server-Timing'])
+
+    @override_settings(MENU_PERF_SLOW_MS=60000)
+    def test_fast_request_without_sql(self):
+        """Fast requests are logged without their SQL"""
+        with self.assertLogs('menu.perf', 'INFO') as logs:
+            self.client.get(reverse('menu:menu_detail',
+                                    kwargs={'pk': self.menu_1.pk}))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertFalse(record['slow'])
+        self.assertNotIn('sql', record)
+
+    @override_settings(MENU_PERF_SAMPLE_RATE=0.0)
+    def test_unsampled_request(self):
+        """No details nor header outside of the sample"""
+        resp = self.client.get(reverse('menu:menu_list'))
+        self.assertFalse(resp.has_header('Server-Timing'))
+
+    def test_async_chain(self):
+        """Middlewares wrapping an async handler are coroutine functions,
+        called without a thread switch
+        """
+        async def handler(request):
+            pass
+
+        def sync_handler(request):
+            pass
+
+        for middleware in (PerformanceMiddleware, ReplicaPinMiddleware,
+                           TenantMiddleware, AsyncWhiteNoiseMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(handler)))
+            self.assertFalse(iscoroutinefunction(middleware(sync_handler)))
+
+
+class BenchmarkTest(TestCase):
+    """BenchmarkTest test class
+    Inherit: - TestCase
+    - Benchmark suite on a tiny synthetic catalog.
+    """
+
+    def test_every_route_measured(self):
+        """Every route answers, regressions are reported"""
+        results = run_benchmarks([40], repeat=2)['40']
+        self.assertEqual(set(results), {
+            'menu_list', 'menu_new', 'menu_bulk_edit', 'menu_detail',
+            'menu_edit', 'menu_delete', 'menu_history', 'item_list',
+            'item_new',
+            'item_detail', 'item_edit', 'item_delete', 'search',
+            'ingredient_menus',
+            'autocomplete', 'api_menus', 'api_items', 'api_ingredients',
+            'api_menu_history', 'api_changes'})
+        for result in results.values():
+            self.assertEqual(result['status'], 200)
+        baseline = {'40': {name: dict(result) for name, result
+                           in results.items()}}
+        self.assertEqual(regressions({'40': results}, baseline, 1.5), [])
+        baseline['40']['menu_list']['queries'] -= 1
+        self.assertEqual(len(regressions({'40': results}, baseline, 1.5)), 1)
+
+
+class SeedCatalogTest(TestCase):
+    """SeedCatalogTest test class
+    Inherit: - TestCase
+    - seed_catalog command writes a reproducible catalog of a restaurant.
+    """
+
+    def test_seeds_restaurant(self):
+        """Counts are reported, rows belong to the selected restaurant"""
+        # noinspection PyUnresolvedReferences
+        other = Restaurant.objects.create(name='Other', slug='other')
+        out = StringIO()
+        call_command('seed_catalog', items=40, menus=5, ingredients=20,
+                     chefs=2, restaurant='other', stdout=out)
+        self.assertIn('2 chefs, 20 ingredients, 40 items and 5 menus',
+                      out.getvalue())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Item.objects.filter(restaurant=other).count(), 40)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Menu.objects.filter(restaurant=other).count(), 5)
+        call_command('seed_catalog', items=40, menus=5, ingredients=20,
+                     chefs=2, stdout=StringIO())
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(Item.objects.count(), 80)
+        with self.assertRaises(CommandError):
+            call_command('seed_catalog', restaurant='nowhere')
+
+
+class SiteLoadTest(LiveServerTestCase):
+    """SiteLoadTest test class
+    Inherit: - LiveServerTestCase
+    - The site load replays the weighted routes over HTTP.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        call_command('seed_catalog', items=60, menus=6, stdout=StringIO())
+        self.targets = site_targets()
+
+    def test_plan_reproducible(self):
+        """Plans follow the seed, routes without targets are left out"""
+        plan = plan_site_load(self.targets, SITE_MIX, 50, seed=1)
+        self.assertEqual(plan, plan_site_load(self.targets, SITE_MIX, 50,
+                                              seed=1))
+        self.assertEqual(len(plan), 50)
+        plan = plan_site_load(dict(self.targets, menus=[]), SITE_MIX, 50,
+                              seed=1)
+        self.assertFalse([name for name, method, path, data in plan
+                          if name in ('menu_detail', 'menu_edit')])
+
+    def test_every_route_answers(self):
+        """Reads and edits succeed, latencies are reported per route"""
+        # One client, the live server shares its in-memory SQLite
+        # connection between the request threads
+        result = run_site_load(
+            self.live_server_url,
+            mix={name: 1 for name in SITE_MIX}, threads=1, requests=60,
+            targets=self.targets)
+        self.assertEqual(result['error_samples'], [])
+        self.assertEqual(result['requests'], 60)
+        self.assertIn('menu_edit', result['routes'])
+        self.assertIn('item_edit', result['routes'])
+        for route in result['routes'].values():
+            self.assertLessEqual(route['p50_ms'], route['p99_ms'])
+
+
+@override_settings(MENU_DB_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    """ReplicaRouterTest test class
+    Inherit: - TransactionTestCase, the replica alias is a second
+               connection to the default test database
+    - Read views read from the replica, writes and the requests pinned
+      after a write use the primary.
+    """
+    databases = {'default', 'replica'}
+    setUp = BaseTest.setUp
+
+    def get_queries(self, method, url, data=None):
+        """Returns response, primary queries and replica queries"""
+        with CaptureQueriesContext(connection) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            resp = getattr(self.client, method)(url, data)
+        return resp, primary.captured_queries, replica.captured_queries
+
+    def test_reads_from_replica(self):
+        """Queries of replica_reads views go to the replica"""
+        resp, primary, replica = self.get_queries(
+            'get', reverse('menu:menu_detail', kwargs={'pk': self.menu_2.pk}))
+        self.assertContains(resp, 'Soup')
+        self.assertTrue(replica)
+        self.assertFalse([query for query in primary
+                          if query['sql'].startswith('SELECT')])
+
+    def test_write_pins_primary(self):
+        """A successful POST writes to the primary and pins the redirect"""
+        url = reverse('menu:menu_edit', kwargs={'pk': self.menu_1.pk})
+        resp, primary, replica = self.get_queries('post', url, {
+            'season': 'Fall',
+            'items': [self.item_2.pk],
+            'expiration_date': datetime.date.today()})
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(primary)
+        self.assertFalse(replica)
+        self.assertIn('menu_primary', resp.cookies)
+        resp, primary, replica = self.get_queries('get', resp['Location'])
+        self.assertContains(resp, 'Fall')
+        self.assertTrue(primary)
+        self.assertFalse(replica)
+
+    def test_invalid_form_not_pinned(self):
+        """A form re-rendered with errors does not pin"""
+        resp = self.client.post(
+            reverse('menu:menu_edit', kwargs={'pk': self.menu_1.pk}), {})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('menu_primary', resp.cookies)
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Menu, Item
+from .signals import send_catalog_changed
+from .tenants import use_restaurant
+
+# Soft deleted model: send_catalog_changed() keyword
+KEYS = {Menu: 'menus', Item: 'items'}
+# Rows hard deleted per transaction by purge()
+PURGE_BATCH = 500
+
+
+def soft_delete(model, pks):
+    """Soft deletes menus or items of the current restaurant in one UPDATE.
+    Their through rows stay until purge(), the default managers, the
+    related managers and the read models (cards, ingredient and search
+    indexes) leave them out from now on.
+    :input: - model - Menu or Item
+            - pks - iterable of pks
+    :return: - list of the deleted pks
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # noinspection PyUnresolvedReferences
+        rows = model.objects.filter(pk__in=pks)
+        pks = list(rows.values_list('pk', flat=True))
+        rows.update(deleted_at=now, updated_at=now)
+        send_catalog_changed(model, deleted=True, **{KEYS[model]: pks})
+    return pks
+
+
+def restore(model, pks):
+    """Restores soft deleted menus or items of the current restaurant in one
+    UPDATE. Items of a deleted chef stay deleted.
+    :input: - model - Menu or Item
+            - pks - iterable of pks
+    :return: - list of the restored pks
+    """
+    with transaction.atomic():
+        # noinspection PyUnresolvedReferences
+        rows = model.all_objects.filter(pk__in=pks, deleted_at__isnull=False)
+        if model is Item:
+            rows = rows.filter(chef__isnull=False)
+        pks = list(rows.values_list('pk', flat=True))
+        # noinspection PyUnresolvedReferences
+        model.all_objects.filter(pk__in=pks).update(
+            deleted_at=None, updated_at=timezone.now())
+        send_catalog_changed(model, created=True, **{KEYS[model]: pks})
+    return pks
+
+
+def purge(model, before, batch_size=PURGE_BATCH):
+    """Hard deletes menus or items soft deleted before a time, with their
+    through rows, one transaction per batch so no lock is held for long
+    (menu_deleted_idx, item_deleted_idx)
+    :input: - model - Menu or Item
+            - before - datetime
+            - batch_size - rows per transaction
+    :return: - number of rows deleted
+    """
+    purged = 0
+    while True:
+        with transaction.atomic():
+            # noinspection PyUnresolvedReferences
+            pks = list(model.all_objects.filter(
+                deleted_at__lt=before).values_list('pk', flat=True)[
+                :batch_size])
+            if not pks:
+                return purged
+            model._base_manager.filter(pk__in=pks).delete()
+        purged += len(pks)
+
+
+@receiver(pre_delete, sender='auth.User')
+def chef_deleting(sender, instance, **kwargs):
+    """User about to be deleted - their items, in every restaurant, are
+    soft deleted and lose their chef in one UPDATE instead of a cascade
+    (Item.chef is DO_NOTHING), purge() removes them later
+    """
+    with use_restaurant(None):
+        # noinspection PyUnresolvedReferences
+        rows = Item.all_objects.filter(chef=instance)
+        # noinspection PyUnresolvedReferences
+        pks = list(Item.objects.filter(chef=instance).values_list(
+            'pk', flat=True))
+        now = timezone.now()
+        rows.update(chef=None, deleted_at=Coalesce(F('deleted_at'), now),
+                    updated_at=now)
+        send_catalog_changed(Item, deleted=True, items=pks)
@@ -1,15 +1,25 @@
 from django.conf.urls import url
-from . import views
+from . import api, views
 
 urlpatterns = [
     url(r'^$', views.menu_list, name='menu_list'),
     url(r'^menu/new/$', views.create_new_menu, name='menu_new'),
+    url(r'^menu/bulk-edit/$', views.bulk_edit_menus, name='menu_bulk_edit'),
     url(r'^menu/(?P<pk>\d+)/$', views.menu_detail, name='menu_detail'),
     url(r'^menu/(?P<pk>\d+)/edit/$', views.edit_menu, name='menu_edit'),
     url(r'^menu/(?P<pk>\d+)/delete/$', views.delete_menu, name='menu_delete'),
+    url(r'^menu/(?P<pk>\d+)/history/$', views.menu_history, name='menu_history'),
     url(r'^menu/items/$', views.item_list, name='item_list'),
     url(r'^menu/item/new/$', views.create_new_item, name='item_new'),
     url(r'^menu/item/(?P<pk>\d+)/$', views.item_detail, name='item_detail'),
     url(r'^menu/item/(?P<pk>\d+)/edit/$', views.edit_item, name='item_edit'),
     url(r'^menu/item/(?P<pk>\d+)/delete/$', views.delete_item, name='item_delete'),
+    url(r'^menu/search/$', views.search, name='search'),
+    url(r'^menu/ingredients/menus/$', views.ingredient_menus, name='ingredient_menus'),
+    url(r'^menu/autocomplete/(?P<kind>\w+)/$', views.autocomplete, name='autocomplete'),
+    url(r'^api/menus/$', api.menu_list_api, name='api_menus'),
+    url(r'^api/items/$', api.item_list_api, name='api_items'),
+    url(r'^api/ingredients/$', api.ingredient_list_api, name='api_ingredients'),
+    url(r'^api/menus/(?P<pk>\d+)/history/$', api.menu_history_api, name='api_menu_history'),
+    url(r'^api/changes/$', api.change_feed_api, name='api_changes'),
 ]
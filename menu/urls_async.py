@@ -0,0 +1,19 @@
+from django.urls import URLPattern
+
+from . import async_views, urls
+
+# menu.urls with the async read views, served by mysite.asgi
+ASYNC_VIEWS = {
+    'menu_list': async_views.menu_list,
+    'menu_detail': async_views.menu_detail,
+    'item_list': async_views.item_list,
+    'item_detail': async_views.item_detail,
+    'api_changes': async_views.change_feed_api,
+}
+
+urlpatterns = [
+    URLPattern(pattern.pattern, ASYNC_VIEWS.get(pattern.name,
+                                                pattern.callback),
+               pattern.default_args, pattern.name)
+    for pattern in urls.urlpatterns
+]
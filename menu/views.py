@@ -1,45 +1,62 @@
+from django.contrib.auth.models import User
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
 
-from .models import Menu, Item
+from . import conditional
+from .bulk import MenuBulkForm
+from .cache import cached_render
+from .cards import get_card
+from .models import Menu, MenuCard, Item, Ingredient
 from .forms import MenuForm, ItemForm
+from .history import menu_as_of, parse_at, recorded_at
+from .pagination import keyset_page
+from .routers import replica_reads
+from .search import search_items
+from .trash import soft_delete
 
-from operator import attrgetter
-import datetime
+# Number of items on one page of item_list
+ITEMS_PER_PAGE = 50
+# Number of suggestions returned by autocomplete
+AUTOCOMPLETE_LIMIT = 20
+# autocomplete kind: (model, searched field)
+AUTOCOMPLETE_FIELDS = {
+    'items': (Item, 'name'),
+    'ingredients': (Ingredient, 'name'),
+    'chefs': (User, 'username'),
+}
 
 
+@replica_reads
+@condition(etag_func=conditional.menu_list_etag)
 def menu_list(request):
-    """Menu list view, selects all the menu objects related to 'items'
+    """Menu list view, selects the current menu cards
     :return: - list_all_current.html + menu_list with expiration date
                                      + menu_list without expiration date
     """
     # noinspection PyUnresolvedReferences
-    all_menus = Menu.objects.all().prefetch_related('items')
-    menus_no_expdate = []  # all_menus.exclude(expiration_date__gt=datetime.date.today())
-
-    menus = []  # all_menus.filter(expiration_date__gt=datetime.date.today())
-    for menu in all_menus:
-        if menu.expiration_date:
-            if menu.expiration_date > datetime.date.today():
-                menus.append(menu)
-        else:
-            menus_no_expdate.append(menu)
-    # Sorts menus by expiration date
-    menus = sorted(menus, key=attrgetter('created_date'))[::-1]
-    # Sorts menus_no_expdate by season
-    menus_no_expdate = sorted(menus_no_expdate, key=attrgetter('season'))
+    # Menus not expired yet, sorted by created date (newest first)
+    menus = MenuCard.objects.current()
+    # noinspection PyUnresolvedReferences
+    # Menus without expiration date, sorted by season
+    menus_no_expdate = MenuCard.objects.without_expiration()
     return render(request, 'menu/list_all_current_menus.html',
                   {'menus': menus,
                    'no_date': menus_no_expdate})
 
 
+@replica_reads
+@condition(etag_func=conditional.menu_etag,
+           last_modified_func=conditional.menu_last_modified)
 def menu_detail(request, pk):
-    """Menu detail view - get menu object 'pk'
+    """Menu detail view - get menu card 'pk'
     :input: - pk - menu id
     :return: - menu_detail.html + dictionary of menu values
     """
-    menu = get_object_or_404(Menu, pk=pk)
-    # import pdb; pdb.set_trace()
-    return render(request, 'menu/menu_detail.html', {'menu': menu})
+    def get_context():
+        return {'menu': get_card(pk)}
+    return cached_render(request, 'menu', pk, 'menu/menu_detail.html',
+                         get_context)
 
 
 def create_new_menu(request):
@@ -70,39 +87,105 @@ def edit_menu(request, pk):
     return render(request, 'menu/add_menu.html', {'form': form, 'key': True})
 
 
+def bulk_edit_menus(request):
+    """Bulk edit menus view - item, season and expiration date changes of
+    many menus applied in one transaction
+    :return: - redirect to menu_list
+             - bulk_edit_menus.html + form for the changes
+    """
+    form = MenuBulkForm()
+    if request.method == "POST":
+        form = MenuBulkForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('menu:menu_list')
+    return render(request, 'menu/bulk_edit_menus.html', {'form': form})
+
+
 def delete_menu(request, pk):
-    """Delete menu view - get menu object by 'pk'
+    """Delete menu view - get menu object by 'pk', soft deleted on POST
+    (menu.trash)
     :input: - pk - menu id
     :return: - redirect to menu_list
              - delete_menu.html + menu dictionary with values
     """
-    menu_d = get_object_or_404(Menu, pk=pk)
+    # noinspection PyUnresolvedReferences
+    menu_d = get_object_or_404(Menu.objects.with_items(), pk=pk)
     if request.method == 'POST':
-        menu_d.delete()
+        soft_delete(Menu, [menu_d.pk])
         return redirect('menu:menu_list')
     return render(
         request, 'menu/delete_menu.html', {'menu': menu_d})
 
 
-def item_list(request):
-    """Item list view, selects all the item objects
-    :return: - item_list.html + item list dictionary
+@replica_reads
+def menu_history(request, pk):
+    """Menu history view - the menu as it was at a time, rebuilt from its
+    versions (menu.history)
+    :input: - pk - menu id
+            - ?at= - ISO 8601 date or date and time, the last version if
+                     not given
+    :return: - menu_history.html + version, its items and the times of
+                                   the last versions
+    """
+    try:
+        at = parse_at(request.GET.get('at', '').strip())
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date.')
+    found = menu_as_of(pk, at)
+    if found is None:
+        raise Http404('No menu matches the given query.')
+    version, items = found
+    return render(request, 'menu/menu_history.html',
+                  {'pk': pk, 'version': version, 'items': items, 'at': at,
+                   'versions': recorded_at(pk)})
+
+
+def render_item_list(request):
+    """Renders one page of item objects, the body of item_list and of its
+    async version (menu.async_views.item_list)
+    :input: - ?after= - cursor of the last item on the previous page
+    :return: - item_list.html + item list dictionary + next page cursor
     """
     # noinspection PyUnresolvedReferences
-    items = Item.objects.all()
-    # Sorts items by alphabet
-    items = sorted(items, key=attrgetter('name'))
+    # Only the columns item_list.html shows (updated_at keys the cached
+    # rows), sorted by alphabet
+    items = Item.objects.only('name', 'description', 'created_date',
+                              'updated_at')
+    items, next_cursor = keyset_page(items, ('name', 'pk'),
+                                     cursor=request.GET.get('after'),
+                                     size=ITEMS_PER_PAGE)
+
+    return render(request, 'menu/item_list.html',
+                  {'items': items,
+                   'next_cursor': next_cursor,
+                   'first_page': 'after' not in request.GET})
+
 
-    return render(request, 'menu/item_list.html', {'items': items})
+@replica_reads
+@condition(etag_func=conditional.item_list_etag)
+def item_list(request):
+    """Item list view, selects one page of item objects
+    :input: - ?after= - cursor of the last item on the previous page
+    :return: - item_list.html + item list dictionary + next page cursor
+    """
+    return render_item_list(request)
 
 
+@replica_reads
+@condition(etag_func=conditional.item_etag,
+           last_modified_func=conditional.item_last_modified)
 def item_detail(request, pk):
     """Item detail view - get item object 'pk'
     :input: - pk - item id
     :return: - detail_item.html + dictionary of item values
     """
-    item = get_object_or_404(Item, pk=pk)
-    return render(request, 'menu/detail_item.html', {'item': item})
+    def get_context():
+        # noinspection PyUnresolvedReferences
+        return {'item': get_object_or_404(Item.objects.with_relations(),
+                                          pk=pk)}
+    return cached_render(request, 'item', pk, 'menu/detail_item.html',
+                         get_context)
 
 
 def create_new_item(request):
@@ -135,13 +218,75 @@ def edit_item(request, pk):
 
 
 def delete_item(request, pk):
-    """Delete item view - get item object by 'pk'
+    """Delete item view - get item object by 'pk', soft deleted on POST
+    (menu.trash)
     :input: - pk - item id
     :return: - redirect to item_list
              - delete_item.html + item dictionary with values
     """
-    item = get_object_or_404(Item, pk=pk)
+    # noinspection PyUnresolvedReferences
+    item = get_object_or_404(Item.objects.with_relations(), pk=pk)
     if request.method == 'POST':
-        item.delete()
+        soft_delete(Item, [item.pk])
         return redirect('menu:item_list')
     return render(request, 'menu/delete_item.html', {'item': item})
+
+
+def autocomplete(request, kind):
+    """Prefix search used by the autocomplete form widgets
+    :input: - kind - 'items', 'ingredients' or 'chefs'
+            - ?q= - beginning of the name
+    :return: - JSON list of {id, text}
+    """
+    try:
+        model, field = AUTOCOMPLETE_FIELDS[kind]
+    except KeyError:
+        raise Http404('Unknown autocomplete kind.')
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        # noinspection PyUnresolvedReferences
+        rows = model.objects.filter(
+            **{field + '__istartswith': query}
+        ).order_by(field, 'pk').values_list('pk', field)[:AUTOCOMPLETE_LIMIT]
+        results = [{'id': pk, 'text': text} for pk, text in rows]
+    return JsonResponse({'results': results})
+
+
+def search(request):
+    """Search view - items by name, description or ingredient names
+    :input: - ?q= - words, each one matches the beginning of a word
+    :return: - search.html + query + matching items
+    """
+    query = request.GET.get('q', '').strip()
+    items = search_items(query) if query else []
+    return render(request, 'menu/search.html',
+                  {'query': query, 'items': items})
+
+
+def _names(request, key):
+    """Returns list of names from repeated or comma separated parameters"""
+    return [name.strip()
+            for value in request.GET.getlist(key)
+            for name in value.split(',') if name.strip()]
+
+
+def ingredient_menus(request):
+    """Which current menus contain, or are free of, some ingredients
+    :input: - ?contains= - ingredient names, menus using any of them
+            - ?free_of= - ingredient names, menus using none of them
+    :return: - ingredient_menus.html + ingredient names + matching menus
+    """
+    contains = _names(request, 'contains')
+    free_of = _names(request, 'free_of')
+    menus = []
+    if contains or free_of:
+        # noinspection PyUnresolvedReferences
+        menus = Menu.objects.live().order_by('season', 'pk').only(
+            'season', 'expiration_date')
+        if contains:
+            menus = menus.containing(contains)
+        if free_of:
+            menus = menus.free_of(free_of)
+    return render(request, 'menu/ingredient_menus.html',
+                  {'contains': contains, 'free_of': free_of, 'menus': menus})
@@ -0,0 +1,21 @@
+"""
+ASGI config for mysite project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``, serving the async read views (mysite.urls_async), e.g.
+uvicorn mysite.asgi:application or gunicorn -k uvicorn.workers.UvicornWorker
+mysite.asgi:application. Blocking calls of the async views run in a thread
+pool of MENU_ASYNC_THREADS threads per process.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.deploy_settings")
+os.environ.setdefault("DJANGO_URLCONF", "mysite.urls_async")
+
+application = get_asgi_application()
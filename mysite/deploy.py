@@ -2,6 +2,8 @@
 WSGI config for mysite project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Static files are served by whitenoise.middleware.WhiteNoiseMiddleware
+(mysite.deploy_settings).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
@@ -9,12 +11,8 @@ https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
 
 import os
 
-from whitenoise.django import DjangoWhiteNoise
-
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.deploy_settings")
 
 application = get_wsgi_application()
-
-application = DjangoWhiteNoise(application)
@@ -12,7 +12,80 @@ ALLOWED_HOSTS = [
 
 SECRET_KEY = get_env_variable("SECRET_KEY")
 
-db_from_env = dj_database_url.config()
+# Database connections (DATABASE_URL)
+# - DB_CONN_MAX_AGE: seconds a connection is kept open between requests
+#   (0 opens one per request), checked at the start of every request
+#   unless DB_HEALTH_CHECKS=0.
+# - DB_POOL_SIZE: > 0 borrows connections from a pool of that size inside
+#   each worker process instead (PostgreSQL only), for gthread or gevent
+#   workers. DB_POOL_MIN_SIZE and DB_POOL_TIMEOUT tune it.
+# - DB_REPLICA_URLS: comma separated urls of read replicas, same settings
+#   as the primary otherwise (menu.routers.ReplicaRouter).
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
+db_from_env = dj_database_url.config(conn_max_age=DB_CONN_MAX_AGE)
 DATABASES['default'].update(db_from_env)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = \
+    os.environ.get('DB_HEALTH_CHECKS', '1') == '1'
+if DB_POOL_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': 'menu.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    })
+DATABASES = {'default': DATABASES['default']}
+for number, url in enumerate(
+        [url for url in os.environ.get('DB_REPLICA_URLS', '').split(',')
+         if url.strip()], 1):
+    replica = dj_database_url.parse(url.strip())
+    DATABASES['replica_{}'.format(number)] = dict(
+        DATABASES['default'],
+        **{key: replica[key]
+           for key in ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')},
+        TEST={'MIRROR': 'default'})
+MENU_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Static files are served by WhiteNoise with far-future immutable headers
+# for fingerprinted names, Brotli and gzip copies are written by
+# collectstatic. bin/post_compile runs build_static before collectstatic,
+# pages fail (ImproperlyConfigured) if the bundle was not collected.
+# (menu.middleware.AsyncWhiteNoiseMiddleware also runs under mysite.asgi.)
+# debug_toolbar is development only, its middleware would also force the
+# ASGI middleware chain to run synchronously.
+MIDDLEWARE = ('menu.middleware.AsyncWhiteNoiseMiddleware',) + tuple(
+    name for name in MIDDLEWARE if not name.startswith('debug_toolbar.'))
+INSTALLED_APPS = tuple(name for name in INSTALLED_APPS
+                       if name != 'debug_toolbar')
+STATICFILES_DIRS = STATICFILES_DIRS + [STATIC_BUILD_DIR]
+STATICFILES_STORAGE = \
+    "whitenoise.storage.CompressedManifestStaticFilesStorage"
+MENU_USE_CSS_BUNDLE = True
+
+MENU_PERF_SAMPLE_RATE = float(os.environ.get('MENU_PERF_SAMPLE_RATE', 0.1))
 
-STATICFILES_STORAGE = "whitenoise.django.GzipManifestStaticFilesStorage"
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'menu.perf': {'handlers': ['console'], 'level': 'INFO',
+                      'propagate': False},
+    },
+}
+
+# Templates are compiled once per process (cached loader), the app
+# directories loader replaces APP_DIRS which cannot be combined with loaders
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
@@ -54,6 +54,9 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = (
+    'menu.middleware.PerformanceMiddleware',
+    'menu.middleware.ReplicaPinMiddleware',
+    'menu.middleware.TenantMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,11 +68,13 @@ MIDDLEWARE = (
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 )
 
-ROOT_URLCONF = 'mysite.urls'
+# mysite.asgi switches to mysite.urls_async (async read views)
+ROOT_URLCONF = os.environ.get('DJANGO_URLCONF', 'mysite.urls')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'menu.perf.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR), 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,9 +98,107 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Read replica, only used while listed in MENU_DB_REPLICAS. Locally a
+    # second connection to the same file (a replica without lag), tests
+    # mirror the default test database the same way.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Read-only views (menu.routers.replica_reads) read from a random database
+# of MENU_DB_REPLICAS, writes go to default. A client which wrote reads
+# from default for MENU_DB_PIN_SECONDS (replication lag).
+DATABASE_ROUTERS = ['menu.routers.ReplicaRouter']
+MENU_DB_REPLICAS = [alias for alias in
+                    os.environ.get('MENU_DB_REPLICAS', '').split(',')
+                    if alias]
+MENU_DB_PIN_SECONDS = int(os.environ.get('MENU_DB_PIN_SECONDS', 5))
+
+# Restaurants (menu.tenants): a request is served for the restaurant of its
+# /r/<slug>/ path prefix or of its host (Restaurant.host), else for the
+# restaurant with the MENU_DEFAULT_RESTAURANT slug, created on first use.
+# Cache keys are namespaced by restaurant (KEY_FUNCTION of CACHES).
+MENU_DEFAULT_RESTAURANT = os.environ.get('MENU_DEFAULT_RESTAURANT', 'main')
+
+
+# Primary keys of models without an explicit one
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Rendered menu and item pages (menu.cache). The local-memory backend evicts
+# the least recently used entry once MAX_ENTRIES is reached. Set
+# MENU_CACHE_DIR to share the cache between processes through files
+# (FileBasedCache culls a random third of the entries instead).
+# Rows of the list pages ({% cache ... using="fragments" %}) have their own
+# cache, sized for 5000 items and menus in both user variants, so pages and
+# choice lists do not evict them.
+
+MENU_CACHE_DIR = os.environ.get('MENU_CACHE_DIR')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'menu',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+        'KEY_FUNCTION': 'menu.tenants.make_key',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'menu-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 12000},
+        'KEY_FUNCTION': 'menu.tenants.make_key',
+    },
 }
 
+if MENU_CACHE_DIR:
+    CACHES['default'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': MENU_CACHE_DIR,
+    })
+    CACHES['fragments'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(MENU_CACHE_DIR, 'fragments'),
+    })
+
+MENU_RENDER_CACHE = 'default'
+
+# Item, ingredient and chef form fields with more choices than this render
+# an autocomplete search box instead of every option (None to disable)
+MENU_AUTOCOMPLETE_THRESHOLD = 500
+# Seconds the choices of those fields are cached, their key follows row
+# count and last update, renamed users show up after this
+MENU_CHOICES_TIMEOUT = 300
+
+
+# Request timings (menu.middleware.PerformanceMiddleware)
+# Share of requests whose DB/template time is recorded, logged on the
+# 'menu.perf' logger and sent as a Server-Timing header. Requests slower
+# than MENU_PERF_SLOW_MS are logged as warnings with their SQL.
+
+MENU_PERF_SAMPLE_RATE = float(os.environ.get('MENU_PERF_SAMPLE_RATE', 1.0))
+MENU_PERF_SLOW_MS = int(os.environ.get('MENU_PERF_SLOW_MS', 500))
+MENU_PERF_SERVER_TIMING = True
+
+
+# Threads running the blocking calls of the async views (mysite.asgi)
+MENU_ASYNC_THREADS = int(os.environ.get('MENU_ASYNC_THREADS', 16))
+
+
+# Longest wait (seconds) of the WSGI change feed (menu.api.change_feed_api).
+# A waiting request holds its worker, so it answers at once unless the
+# workers are gevent greenlets (GUNICORN_WORKER_CLASS=gevent). The ASGI
+# entry point (mysite.asgi) always waits.
+
+MENU_CHANGE_FEED_WAIT = int(os.environ.get(
+    'MENU_CHANGE_FEED_WAIT',
+    25 if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent' else 0))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -122,5 +225,29 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'assets'),
 ]
 
-# Local IP address to run django-debug-toolbar (version==1.9.1) locally
+# Output of the build_static command (CSS bundle, WebP images), collected
+# with the other static files in production
+STATIC_BUILD_DIR = os.path.join(BASE_DIR, 'build', 'static')
+
+# Stylesheets in cascade order: static paths, or vendored urls pinned by
+# their integrity hash. build_static concatenates them into MENU_CSS_BUNDLE,
+# layout.html links the bundle when MENU_USE_CSS_BUNDLE is set.
+MENU_CSS_SOURCES = (
+    ('css/normalize.css', None),
+    ('https://stackpath.bootstrapcdn.com/bootstrap/4.1.3/css/'
+     'bootstrap.min.css',
+     'sha384-MCw98/SFnGE8fJT3GXwEOngsV7Zt27NXFoaoApmYm81iuXoPkFOJwJ8ERdknLPMO'),
+    ('css/my_css.css', None),
+)
+MENU_CSS_BUNDLE = 'css/site.css'
+MENU_USE_CSS_BUNDLE = False
+
+# Widths of the resized WebP variants of assets/images
+MENU_IMAGE_WIDTHS = (640, 1280, 1920)
+
+# debug_toolbar only recognizes the stock DjangoTemplates backend, the
+# timed subclass (menu.perf.TimedDjangoTemplates) does load app templates
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W006']
+
+# Local IP address to run django-debug-toolbar (version==3.2.4) locally
 INTERNAL_IPS = ('127.0.0.1',)
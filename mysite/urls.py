@@ -25,7 +25,7 @@ urlpatterns = [
     url(r'', include(('menu.urls', 'menu'), namespace='menu')),
 ]
 
-# Setting up urlpatterns for django-debug-toolbar(version==1.9.1)
+# Setting up urlpatterns for django-debug-toolbar(version==3.2.4)
 if settings.DEBUG:
     import debug_toolbar
     urlpatterns += url(r'^__debug__/', include(debug_toolbar.urls)),
@@ -0,0 +1,14 @@
+"""mysite URL Configuration of the ASGI entry point (mysite.asgi)
+
+Same routes as mysite.urls, the menu read views are the async ones of
+menu.async_views.
+"""
+from django.conf.urls import include, url
+
+from mysite.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    url(r'', include(('menu.urls_async', 'menu'), namespace='menu'))
+    if getattr(pattern, 'namespace', None) == 'menu' else pattern
+    for pattern in sync_urlpatterns
+]